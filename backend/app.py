@@ -1,257 +1,322 @@
 import os
-import sys
+import re
 import logging
 import time
 import json
-import requests
+import hashlib
+import hmac
+import uuid
+import posixpath
 import warnings
-import oss2
+import threading
+import contextvars
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from urllib.parse import unquote, urlsplit
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, send_file, send_from_directory
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from prometheus_flask_exporter import PrometheusMetrics
 from flask_cors import CORS
 
+from config import Config
+from utils.task_tracker import TaskTracker, TERMINAL_STATES
+from utils.task_store import create_task_store
+from utils.http_session import get_session, register_pool_metrics
+from utils.result_cache import ResultCache, create_cache_backend
+from utils.upload_store import spool_upload
+from utils.storage import IMMUTABLE_CACHE_CONTROL, LocalStorage, create_storage_backend
+from utils.result_images import ResultImageStore
+from utils.warm_index import IndexWarmer, WarmIndex, model_key
+from utils.status_cache import FINAL_STATES, StatusCache, StatusUnavailable
+from utils.prefetch import Prefetcher
+from utils.url_guard import UnsafeURLError, check_url_syntax
+from utils.image_preprocess import preprocess_upload
+from utils import metrics as tryon_metrics
+from utils import tracing
+from utils.logging_setup import configure_logging
+from utils.governor import PRIORITY_CLASSES, GovernorBusy, UpstreamGovernor, current_schedule, set_schedule
+from utils.aliyun_client import AliyunAITryOnClient
+
 # 加载环境变量
 load_dotenv()
 
-# 创建Flask应用实例
-app = Flask(__name__)
-CORS(app)
-
-# 基础配置
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
-
-# 设置日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('app.log')
-    ]
+logger = logging.getLogger(__name__)
+
+# 所有路由注册在蓝图上，由create_app()挂载到应用
+api = Blueprint('api', __name__)
+
+# 限流规则（ASGI部署的协程接口使用相同的规则，见asgi.py）
+DEFAULT_RATE_LIMITS = ["200 per day", "50 per hour"]
+TRYON_RATE_LIMIT = "10 per hour"
+
+# API密钥到租户的映射（TENANT_API_KEYS）
+TENANT_API_KEYS = {
+    key.strip(): tenant.strip()
+    for key, tenant in (part.split('=', 1) for part in Config.TENANT_API_KEYS.split(',') if '=' in part)
+    if key.strip() and tenant.strip()
+}
+
+def client_address(headers, remote_addr):
+    """客户端IP：部署在可信反向代理之后时（TRUSTED_PROXY_COUNT）取X-Forwarded-For中最外层可信代理记录的地址"""
+    if Config.TRUSTED_PROXY_COUNT > 0:
+        forwarded = [value.strip() for value in headers.get('X-Forwarded-For', '').split(',') if value.strip()]
+        if len(forwarded) >= Config.TRUSTED_PROXY_COUNT:
+            return forwarded[-Config.TRUSTED_PROXY_COUNT]
+    return remote_addr or '-'
+
+def request_tenant(headers, remote_addr):
+    """
+    请求所属的租户，限流和上游提交配额的公平排队都以租户为单位
+    
+    带有已配置API密钥（请求头X-API-Key）的请求归属对应的租户，其余请求按客户端IP区分
+    （客户端不能自行声明租户，否则可以伪造多个租户多占配额）
+    """
+    tenant = TENANT_API_KEYS.get(headers.get('X-API-Key', ''))
+    return tenant or f"ip:{client_address(headers, remote_addr)}"
+
+def request_priority(headers, default='interactive'):
+    """请求的优先级类别：客户端可以通过请求头X-Priority主动降低（如批量集成方标记为batch），不能提高"""
+    requested = headers.get('X-Priority', '').strip().lower()
+    if requested in PRIORITY_CLASSES and PRIORITY_CLASSES.index(requested) > PRIORITY_CLASSES.index(default):
+        return requested
+    return default
+
+def rate_limit_key():
+    return request_tenant(request.headers, request.remote_addr)
+
+# 限流器（在create_app()中绑定应用），按租户计数
+limiter = Limiter(
+    key_func=rate_limit_key,
+    default_limits=DEFAULT_RATE_LIMITS
 )
 
-logger = logging.getLogger(__name__)
+# Prometheus监控（在create_app()中初始化）
+metrics = None
 
-# 检查API密钥是否存在
-api_key = os.environ.get('DASHSCOPE_API_KEY')
-if not api_key:
-    logger.error("未找到DASHSCOPE_API_KEY环境变量! 请创建.env文件或设置环境变量")
-    api_key = "fake-api-key-for-debug"
-else:
-    logger.info("API密钥已找到")
-
-# 初始化阿里云OSS
-oss_access_key_id = os.environ.get('OSS_ACCESS_KEY_ID')
-oss_access_key_secret = os.environ.get('OSS_ACCESS_KEY_SECRET')
-oss_endpoint = os.environ.get('OSS_ENDPOINT')
-oss_bucket_name = os.environ.get('OSS_BUCKET_NAME')
-
-# 调试信息
-logger.info(f"OSS_ACCESS_KEY_ID: {oss_access_key_id}")
-logger.info(f"OSS_ENDPOINT: {oss_endpoint}")
-logger.info(f"OSS_BUCKET_NAME: {oss_bucket_name}")
-
-if all([oss_access_key_id, oss_access_key_secret, oss_endpoint, oss_bucket_name]):
+def create_app():
+    """
+    创建Flask应用
+    
+    只做轻量的配置和路由注册，不访问网络：OSS存储、DashScope客户端、任务跟踪器等组件
+    在首次使用时才初始化（见 get_storage() 等），适合 gunicorn --preload 在fork前加载应用
+    """
+    global metrics
+    
+    configure_logging()
+    
+    app = Flask(__name__)
+    # 允许浏览器端脚本读取trace id响应头
+    CORS(app, expose_headers=['X-Trace-Id'])
+    
+    # 基础配置
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+    # 本地上传目录（未配置OSS或上传OSS失败时使用）
+    app.config['UPLOAD_FOLDER'] = Config.UPLOAD_FOLDER
+    
+    # 检查API密钥是否存在
+    if not os.environ.get('DASHSCOPE_API_KEY'):
+        logger.error("未找到DASHSCOPE_API_KEY环境变量! 请创建.env文件或设置环境变量")
+    
+    # 初始化扩展
+    if os.environ.get('FLASK_ENV') == 'development':
+        warnings.filterwarnings("ignore", 
+                               category=UserWarning, 
+                               message="Using the in-memory storage for tracking rate limits")
+    app.config['RATELIMIT_ENABLED'] = Config.RATELIMIT_ENABLED
+    limiter.init_app(app)
+    
+    # 初始化Prometheus监控
     try:
-        auth = oss2.Auth(oss_access_key_id, oss_access_key_secret)
-        bucket = oss2.Bucket(auth, oss_endpoint, oss_bucket_name)
-        
-        # 测试OSS连接
-        try:
-            for obj in oss2.ObjectIterator(bucket, max_keys=1):
-                logger.info("OSS连接成功")
-                break
-        except Exception as e:
-            logger.error(f"OSS连接测试失败: {e}")
-            bucket = None
-        
+        metrics = PrometheusMetrics(app)
+        # 添加自定义指标
+        metrics.counter(
+            'tryon_requests_total', 
+            'Total number of try-on requests',
+            labels={'status': lambda r: r.status_code}
+        )
+        # 上游连接池复用统计
+        register_pool_metrics()
     except Exception as e:
-        logger.error(f"OSS初始化失败: {e}")
-        bucket = None
-else:
-    logger.warning("阿里云OSS配置不完整，将使用本地存储（不推荐用于生产环境）")
-    bucket = None
-    # 创建本地上传目录
-    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    logger.info(f"上传目录: {app.config['UPLOAD_FOLDER']}")
-
-# 初始化扩展
-if os.environ.get('FLASK_ENV') == 'development':
-    warnings.filterwarnings("ignore", 
-                           category=UserWarning, 
-                           message="Using the in-memory storage for tracking rate limits")
-
-# 初始化限流器
-limiter = Limiter(
-    app=app,
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
-)
+        logger.warning(f"Prometheus监控初始化失败: {e}")
+    
+    app.register_blueprint(api)
+    return app
 
-# 初始化Prometheus监控
-try:
-    metrics = PrometheusMetrics(app)
-    # 添加自定义指标
-    tryon_requests = metrics.counter(
-        'tryon_requests_total', 
-        'Total number of try-on requests',
-        labels={'status': lambda r: r.status_code}
-    )
-except Exception as e:
-    logger.warning(f"Prometheus监控初始化失败: {e}")
-    metrics = None
-
-# 阿里云AI试衣客户端
-class AliyunAITryOnClient:
-    """阿里云AI试衣客户端"""
-    
-    def __init__(self, api_key=None):
-        self.api_key = api_key or os.environ.get('DASHSCOPE_API_KEY')
-        self.submit_url = 'https://dashscope.aliyuncs.com/api/v1/services/aigc/image2image/image-synthesis'
-        self.query_url_template = 'https://dashscope.aliyuncs.com/api/v1/tasks/{}'
-        
-    def submit_tryon_task(self, person_image_url, garment_image_url, garment_type="top"):
-        """
-        提交试衣任务到阿里云AI试衣Plus API
-        
-        参数:
-            person_image_url: 人物图像的URL
-            garment_image_url: 服装图像的URL
-            garment_type: 服装类型 ("top", "bottom", "dress")
-            
-        返回:
-            task_id: 任务ID (成功时) 或 None (失败时)
-        """
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-            "X-DashScope-Async": "enable"
-        }
-        
-        # 构建请求体
-        payload = {
-            "model": "aitryon-plus",
-            "input": {
-                "person_image_url": person_image_url,
-            },
-            "parameters": {
-                "resolution": -1,
-                "restore_face": True
-            }
-        }
-        
-        # 根据服装类型设置不同的输入字段
-        if garment_type == "top":
-            payload["input"]["top_garment_url"] = garment_image_url
-        elif garment_type == "bottom":
-            payload["input"]["bottom_garment_url"] = garment_image_url
-        elif garment_type == "dress":
-            payload["input"]["top_garment_url"] = garment_image_url
-        
-        try:
-            logger.info(f"提交试衣任务: {person_image_url} + {garment_image_url} ({garment_type})")
-            logger.info(f"请求头: {headers}")
-            logger.info(f"请求体: {json.dumps(payload, indent=2)}")
-            
-            response = requests.post(self.submit_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"阿里云响应: {json.dumps(result, indent=2)}")
-            
-            task_id = result.get('output', {}).get('task_id')
-            
-            if task_id:
-                logger.info(f"任务提交成功，任务ID: {task_id}")
-                return task_id
-            else:
-                logger.error(f"响应中未找到task_id: {result}")
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"提交试衣任务时请求出错: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                logger.error(f"响应内容: {e.response.text}")
-            return None
-        except Exception as e:
-            logger.error(f"提交试衣任务时发生未知错误: {e}")
-            return None
+# 按需初始化的组件：首次使用时创建，按进程缓存（gunicorn fork后各worker分别创建）
+_components = {}
+_components_lock = threading.RLock()
+
+def _component(name, factory):
+    """返回名为name的组件，不存在时调用factory()创建"""
+    key = (name, os.getpid())
+    if key not in _components:
+        with _components_lock:
+            if key not in _components:
+                _components[key] = factory()
+    return _components[key]
+
+def get_storage():
+    """返回上传图片的存储后端（OSS / S3兼容存储 / 本地目录）"""
+    return _component('storage', create_storage_backend)
+
+def get_local_storage():
+    """返回本地目录存储（主存储不是本地目录时，用于上传失败后的回退和 /uploads 访问）"""
+    storage = get_storage()
+    if isinstance(storage, LocalStorage):
+        return storage
+    return _component('local_storage', LocalStorage)
+
+def get_tryon_client():
+    """返回阿里云AI试衣客户端（全局上游配额调节器：所有worker共享QPS和在途任务上限）"""
+    return _component('tryon_client', lambda: AliyunAITryOnClient(governor=UpstreamGovernor()))
+
+def get_result_cache():
+    """返回试衣结果缓存（相同人物+服装+类型直接返回已有结果）"""
+    return _component('result_cache', lambda: ResultCache(create_cache_backend(), session=get_session('assets')))
+
+def get_result_images():
+    """返回试衣结果图片代理，未启用时返回None"""
+    if not Config.RESULT_PROXY_ENABLED:
+        return None
+    return _component('result_images', lambda: ResultImageStore(get_storage(), get_session('assets')))
+
+def get_warm_index():
+    """返回预计算试衣结果索引，未启用时返回None"""
+    if not Config.WARM_INDEX_ENABLED:
+        return None
+    # 未启用结果图片代理时索引中只有DashScope的临时结果URL，按结果缓存的有效期过期
+    max_age = None if Config.RESULT_PROXY_ENABLED else Config.RESULT_CACHE_TTL
+    return _component('warm_index', lambda: WarmIndex(max_age=max_age))
+
+def get_index_warmer():
+    """返回预计算结果索引的后台预热器"""
+    def create():
+        result_cache = get_result_cache()
+        return IndexWarmer(get_warm_index(), get_tryon_client(), result_cache.content_digest, get_result_images())
+    return _component('index_warmer', create)
+
+def warm_model_key():
+    """当前模型及参数对应的索引键（模型或参数变化后旧条目不再命中）"""
+    client = get_tryon_client()
+    return _component('warm_model_key', lambda: model_key(client.model, client.parameters))
+
+def warm_lookup(params):
+    """
+    在预计算结果索引中查找（只读本地数据库，不下载图片、不访问上游）
     
-    def query_task_status(self, task_id):
-        """
-        查询任务状态
-        
-        参数:
-            task_id: 任务ID
-            
-        返回:
-            dict: 包含任务状态和结果信息的字典
-        """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        query_url = self.query_url_template.format(task_id)
-        
-        try:
-            logger.info(f"查询任务状态: {task_id}")
-            response = requests.get(query_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            logger.info(f"任务状态响应: {json.dumps(result, indent=2)}")
-            return result
-        except requests.exceptions.RequestException as e:
-            logger.error(f"查询任务状态时出错: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                logger.error(f"响应内容: {e.response.text}")
-            return None
-    
-    def wait_for_task_completion(self, task_id, max_retries=30, interval=5):
-        """
-        等待任务完成
-        
-        参数:
-            task_id: 任务ID
-            max_retries: 最大重试次数
-            interval: 检查间隔(秒)
-            
-        返回:
-            dict: 任务结果或None(超时或失败)
-        """
-        for attempt in range(max_retries):
-            result = self.query_task_status(task_id)
-            if not result:
-                time.sleep(interval)
-                continue
-            
-            task_status = result.get('output', {}).get('task_status')
-            
-            if task_status == 'SUCCEEDED':
-                logger.info(f"任务 {task_id} 完成")
-                return result
-            elif task_status == 'FAILED':
-                error_msg = result.get('output', {}).get('message', '未知错误')
-                logger.error(f"任务 {task_id} 失败: {error_msg}")
-                return None
-            elif task_status in ['PENDING', 'RUNNING', 'PRE-PROCESSING', 'POST-PROCESSING']:
-                logger.info(f"任务 {task_id} 状态: {task_status} (尝试 {attempt+1}/{max_retries})")
-                time.sleep(interval)
-            else:
-                logger.warning(f"未知的任务状态: {task_status}")
-                time.sleep(interval)
-        
-        logger.error(f"任务 {task_id} 在 {max_retries} 次尝试后仍未完成")
+    返回:
+        dict: 命中时为与结果缓存格式相同的记录（task_id、image_url），否则为None
+    """
+    warm_index = get_warm_index()
+    # 索引键不含下装，整套搭配不查索引
+    if warm_index is None or params.get('bottom_garment_url'):
         return None
+    try:
+        return warm_index.lookup(params['person_url'], params['garment_url'], params['garment_type'],
+                                 warm_model_key(), known_digest=get_result_cache().known_digest)
+    except Exception as e:
+        logger.warning(f"查找预计算结果索引失败: {e}")
+        return None
+
+def result_image_fields(task_id, source_url, base_url):
+    """
+    结果图片相关的响应字段
+    
+    启用结果图片代理时，image_url为本服务提供的长期有效地址，并附带各宽度的缩略图地址；
+    source_image_url为DashScope返回的原始地址（约24小时后失效）
+    """
+    result_images = get_result_images()
+    if result_images is None or not task_id or not source_url:
+        return {'image_url': source_url}
+    prefix = f"{base_url.rstrip('/')}/api/tryon/results/{task_id}"
+    thumbnails = {}
+    for variant in result_images.thumbnail_variants():
+        width, extension = variant.split('.')
+        thumbnails.setdefault(width[1:], {})[extension] = f"{prefix}.{variant}"
+    return {
+        'image_url': f"{prefix}.{result_images.original_variant(source_url)}",
+        'source_image_url': source_url,
+        'thumbnails': thumbnails
+    }
+
+def on_task_finished(record):
+    """任务结束后写入结果缓存，并清除进行中标记"""
+    cache_key = record['meta'].get('cache_key')
+    if not cache_key:
+        return
+    result_cache = get_result_cache()
+    if record['task_status'] == 'SUCCEEDED' and record['image_url']:
+        result_cache.set(cache_key, {
+            'image_url': record['image_url'],
+            'task_id': record['task_id'],
+            'created_at': record['updated_at']
+        })
+    result_cache.clear_inflight(cache_key)
 
-# 创建全局客户端实例
-tryon_client = AliyunAITryOnClient()
+def create_task_tracker():
+    """创建后台任务跟踪器，任务状态持久化到任务登记表（共享轮询调度器在首个任务提交时才启动）"""
+    tryon_client = get_tryon_client()
+    task_tracker = TaskTracker(tryon_client, store=create_task_store())
+    task_tracker.add_listener(on_task_finished)
+    # 本进程跟踪的任务结束后立即丢弃状态接口中缓存的进行中状态
+    task_tracker.add_listener(lambda record: get_status_cache().invalidate(record['task_id']))
+    # 任务结束后释放全局在途任务槽位
+    task_tracker.add_listener(lambda record: tryon_client.governor.task_finished(record['task_id']))
+    # 任务成功后在后台下载结果图片并生成缩略图
+    result_images = get_result_images()
+    if result_images is not None:
+        def persist_result_image(record):
+            if record['task_status'] == 'SUCCEEDED' and record['image_url']:
+                result_images.schedule(record['task_id'], record['image_url'])
+        task_tracker.add_listener(persist_result_image)
+    # 接管重启前（或已退出的worker）未完成的任务
+    task_tracker.resume()
+    return task_tracker
+
+def get_task_tracker():
+    """返回后台任务跟踪器"""
+    return _component('task_tracker', create_task_tracker)
+
+def get_status_cache():
+    """返回状态接口的进程内缓存"""
+    return _component('status_cache', StatusCache)
+
+def warm_up():
+    """提前初始化各组件（由gunicorn的post_worker_init钩子在worker启动后调用），避免首个请求承担初始化耗时"""
+    started = time.time()
+    try:
+        get_storage()
+        get_result_cache()
+        get_task_tracker()
+        logger.info(f"组件初始化完成，耗时 {time.time() - started:.3f}s")
+    except Exception as e:
+        logger.error(f"组件初始化失败: {e}")
+
+# 就绪检查中存储连通性探测的缓存结果
+_storage_probe = {'checked_at': 0, 'error': None}
+_storage_probe_lock = threading.Lock()
+
+def probe_storage():
+    """
+    探测存储后端连通性，结果缓存 Config.READINESS_PROBE_TTL 秒（并发的就绪检查只会触发一次探测）
+    
+    返回:
+        str: 探测失败时的错误信息，正常时返回None
+    """
+    storage = get_storage()
+    if time.time() - _storage_probe['checked_at'] < Config.READINESS_PROBE_TTL:
+        return _storage_probe['error']
+    with _storage_probe_lock:
+        if time.time() - _storage_probe['checked_at'] >= Config.READINESS_PROBE_TTL:
+            _storage_probe['error'] = storage.check()
+            if _storage_probe['error']:
+                logger.error(f"{storage.name}存储连接测试失败: {_storage_probe['error']}")
+            _storage_probe['checked_at'] = time.time()
+        return _storage_probe['error']
 
 # 辅助函数
 def allowed_file(filename):
@@ -259,54 +324,567 @@ def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def upload_to_oss(file, filename):
-    """上传文件到阿里云OSS"""
-    if bucket is None:
-        # 如果没有配置OSS，使用本地存储
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        return f"{request.host_url}uploads/{filename}"
+def is_public_url(url):
+    """检查URL是否可被阿里云公开访问（http(s)地址，排除本机和内网IP；本服务下载前还会解析域名再检查）"""
+    try:
+        check_url_syntax(url)
+        return True
+    except UnsafeURLError:
+        return False
+
+def validate_tryon_params(data):
+    """
+    校验试衣请求参数（同步和ASGI两种部署共用）
+    
+    浏览器直传的图片会向存储服务确认（见 check_direct_upload，每个对象一次HEAD请求），
+    ASGI部署在线程池中调用。
+    
+    参数:
+        data: 请求体JSON
+    
+    返回:
+        (params, error): 校验通过时error为None，否则为 (响应体, 状态码)
+    """
+    if not data:
+        return None, ({'error': '没有提供JSON数据'}, 400)
+    
+    person_url = data.get('person_image_url')
+    garment_url = data.get('garment_image_url')
+    garment_type = data.get('garment_type', 'top')
+    # 整套搭配：garment_image_url为上装，bottom_garment_image_url为下装
+    bottom_garment_url = data.get('bottom_garment_image_url')
+    if bottom_garment_url:
+        garment_type = 'outfit'
     
+    logger.info(f"试衣参数: person_url={person_url}, garment_url={garment_url}, garment_type={garment_type}"
+                + (f", bottom_garment_url={bottom_garment_url}" if bottom_garment_url else ""))
+    
+    if not person_url or not garment_url:
+        return None, ({'error': '缺少必需的参数: person_image_url 或 garment_image_url'}, 400)
+    if garment_type == 'outfit' and not bottom_garment_url:
+        return None, ({'error': '整套搭配缺少必需的参数: bottom_garment_image_url'}, 400)
+    
+    # 检查URL是否可公开访问
+    if not is_public_url(person_url):
+        return None, ({'error': '人物图像URL不可公开访问，请使用公共存储服务'}, 400)
+        
+    if not is_public_url(garment_url):
+        return None, ({'error': '服装图像URL不可公开访问，请使用公共存储服务'}, 400)
+    
+    if bottom_garment_url and not is_public_url(bottom_garment_url):
+        return None, ({'error': '下装图像URL不可公开访问，请使用公共存储服务'}, 400)
+    
+    for url in (person_url, garment_url, bottom_garment_url):
+        error = url and check_direct_upload(url)
+        if error:
+            return None, ({'error': error}, 400)
+    
+    return {
+        'person_url': person_url,
+        'garment_url': garment_url,
+        'garment_type': garment_type,
+        'bottom_garment_url': bottom_garment_url
+    }, None
+
+def parse_tryon_request():
+    """
+    解析并校验试衣请求参数
+    
+    返回:
+        (params, error_response): 校验通过时error_response为None
+    """
+    params, error = validate_tryon_params(request.get_json(silent=True))
+    if error:
+        return None, (jsonify(error[0]), error[1])
+    return params, None
+
+def tryon_cache_key(params):
+    """计算试衣结果缓存键，缓存关闭或计算失败时返回None（不影响正常提交）"""
+    result_cache = get_result_cache()
+    if not result_cache.enabled:
+        return None
+    tryon_client = get_tryon_client()
     try:
-        # 生成唯一文件名
-        unique_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
+        return result_cache.make_key(
+            params['person_url'], params['garment_url'], params['garment_type'],
+            {'model': tryon_client.model, 'parameters': tryon_client.parameters},
+            bottom_garment_url=params.get('bottom_garment_url')
+        )
+    except Exception as e:
+        logger.warning(f"计算结果缓存键失败，跳过缓存: {e}")
+        return None
+
+def tryon_inputs_hash(params):
+    """未启用结果缓存时登记到任务表的输入哈希（按URL计算）"""
+    material = f"{params['person_url']}|{params['garment_url']}|{params['garment_type']}"
+    if params.get('bottom_garment_url'):
+        material += f"|{params['bottom_garment_url']}"
+    return hashlib.sha256(material.encode()).hexdigest()
+
+def admit_submission():
+    """准入控制：按当前请求的优先级类别和租户估算排队时间，排队过久时抛出GovernorBusy（接口返回429）"""
+    governor = get_tryon_client().governor
+    # 推测性预取只使用空闲的配额，可接受的排队时间更短
+    max_wait = Config.PREFETCH_MAX_QUEUE_WAIT if current_schedule()[0] == 'prefetch' else None
+    retry_after = governor.admit(max_wait) if governor else 0
+    if retry_after:
+        raise GovernorBusy(retry_after)
+
+def submit_task(params):
+    """向上游提交试衣任务，返回任务ID，失败时返回None；预计排队过久时抛出GovernorBusy"""
+    admit_submission()
+    return get_tryon_client().submit_tryon_task(params['person_url'], params['garment_url'], params['garment_type'],
+                                                params.get('bottom_garment_url'))
+
+def is_chained_outfit(params):
+    """整套搭配且模型不支持一次提交上下装时，需要由服务端分两步提交"""
+    return bool(params.get('bottom_garment_url')) and not get_tryon_client().supports_outfit
+
+def note_prefetch_hit(cache_key, stage):
+    """用户请求复用了预取的结果或进行中的预取任务时计入预取命中（每个预取结果只计一次）"""
+    if not Config.PREFETCH_ENABLED or current_schedule()[0] == 'prefetch':
+        return
+    if get_result_cache().claim_prefetched(cache_key):
+        tryon_metrics.PREFETCH_HITS.labels(stage=stage).inc()
+
+def submit_or_reuse(params):
+    """
+    提交试衣任务，相同输入优先复用缓存结果或正在处理中的任务
+    
+    返回:
+        (task_id, cached): 命中缓存时cached为缓存的结果，否则为None；
+                           提交失败时task_id为None
+    """
+    # 热门商品的预计算结果：查找只需读本地索引，在计算缓存键（可能需要下载图片）之前进行
+    warm = warm_lookup(params)
+    if warm:
+        logger.info(f"命中预计算结果索引: 任务 {warm['task_id']}")
+        return warm['task_id'], warm
+    
+    cache_key = tryon_cache_key(params)
+    if cache_key is None:
+        task_id = submit_task(params)
+        if task_id:
+            get_task_tracker().track(task_id, inputs_hash=tryon_inputs_hash(params), garment_type=params['garment_type'],
+                                     trace_id=tracing.current_trace_id())
+        return task_id, None
+    
+    result_cache = get_result_cache()
+    with result_cache.lock(cache_key):
+        cached = result_cache.get(cache_key)
+        if cached:
+            logger.info(f"命中试衣结果缓存: {cache_key}")
+            note_prefetch_hit(cache_key, 'cached')
+            return cached.get('task_id'), cached
         
-        # 上传到OSS
-        bucket.put_object(unique_filename, file)
+        # 跨进程合并：其他worker正在提交相同输入时等待其任务ID
+        task_id, owner = result_cache.reserve_inflight(cache_key)
+        if not owner:
+            logger.info(f"相同输入的任务 {task_id} 正在处理中，复用该任务")
+            note_prefetch_hit(cache_key, 'inflight')
+        else:
+            try:
+                task_id = submit_task(params)
+            finally:
+                if not task_id:
+                    result_cache.clear_inflight(cache_key)
+            if not task_id:
+                return None, None
+            result_cache.set_inflight(cache_key, task_id)
         
-        # 返回OSS文件的公共URL
-        oss_url = f"https://{oss_bucket_name}.{oss_endpoint.replace('https://', '')}/{unique_filename}"
-        logger.info(f"文件已上传到OSS: {oss_url}")
-        return oss_url
+        get_task_tracker().track(task_id, inputs_hash=cache_key, garment_type=params['garment_type'], cache_key=cache_key,
+                                 trace_id=tracing.current_trace_id())
+        return task_id, None
+
+def prefetch_lookup(params):
+    """预取前检查候选组合：返回 (是否已有结果或进行中的任务, 缓存键)"""
+    if warm_lookup(params):
+        return True, None
+    cache_key = tryon_cache_key(params)
+    if cache_key is None:
+        return False, None
+    result_cache = get_result_cache()
+    return bool(result_cache.get(cache_key) or result_cache.get_inflight(cache_key)), cache_key
+
+def get_prefetcher():
+    """返回推测性预取器"""
+    return _component('prefetcher', lambda: Prefetcher(prefetch_lookup, lambda params: submit_or_reuse(params)[0],
+                                                       admit_submission, get_result_cache()))
+
+def prefetch_budget_keys(headers):
+    """
+    预取预算计数的 (租户, 会话)：租户由服务端确定（API密钥或客户端IP），
+    客户端传入的X-Session-Id只在租户预算之内细分，没有时为None
+    """
+    tenant = current_schedule()[1] or '-'
+    session = headers.get('X-Session-Id', '').strip()[:64]
+    return tenant, session or None
+
+def prefetch_candidates(data, params):
+    """
+    请求体中的预取候选（prefetch_garments，按可能性从高到低），与本次请求使用同一张人物图
+    
+    参数:
+        data: 请求体JSON，候选为 {'garment_image_url', 'garment_type'} 的列表，无效的候选忽略
+        params: 本次请求校验后的参数
+    """
+    garments = data.get('prefetch_garments') if isinstance(data, dict) else None
+    if not isinstance(garments, list):
+        return []
+    candidates = []
+    for garment in garments:
+        if not isinstance(garment, dict) or garment.get('bottom_garment_image_url'):
+            continue
+        candidate, error = validate_tryon_params({
+            'person_image_url': params['person_url'],
+            'garment_image_url': garment.get('garment_image_url'),
+            'garment_type': garment.get('garment_type', 'top')
+        })
+        if not error and candidate['garment_url'] != params['garment_url']:
+            candidates.append(candidate)
+    return candidates
+
+def schedule_prefetch(data, params, headers):
+    """
+    直接试衣成功后在后台预取用户接下来可能试穿的服装
+    （需启用PREFETCH_ENABLED和结果缓存：预取的结果只能通过结果缓存命中；整套搭配不预取）
+    """
+    if not Config.PREFETCH_ENABLED or params.get('bottom_garment_url') or not get_result_cache().enabled:
+        return
+    try:
+        candidates = prefetch_candidates(data, params)
+        if candidates:
+            get_prefetcher().start(*prefetch_budget_keys(headers), candidates)
     except Exception as e:
-        logger.error(f"上传到OSS失败: {e}")
-        # 失败时回退到本地存储
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        return f"{request.host_url}uploads/{filename}"
+        logger.warning(f"安排预取失败: {e}")
+
+def outfit_stages(params):
+    """分步提交整套搭配时的两个阶段：上装（人物图为原图）和下装（人物图为上装结果，提交前填入）"""
+    top = {'person_url': params['person_url'], 'garment_url': params['garment_url'], 'garment_type': 'top'}
+    bottom = {'person_url': None, 'garment_url': params['bottom_garment_url'], 'garment_type': 'bottom'}
+    return top, bottom
+
+def track_outfit_bottom(task_id, params, cache_key, top_task_id):
+    """登记分步整套搭配的下装任务：结果按整套搭配的缓存键写入结果缓存"""
+    get_task_tracker().track(task_id, inputs_hash=cache_key or tryon_inputs_hash(params), garment_type='outfit',
+                             cache_key=cache_key, outfit_top_task_id=top_task_id, trace_id=tracing.current_trace_id())
+
+def run_outfit_chain(params):
+    """
+    分步提交整套搭配（模型不支持一次提交上下装时）
+    
+    先试穿上装（与单件上装共用结果缓存和进行中任务）；跟踪器一观察到上装任务成功，
+    立即在服务端以上装结果图为人物图提交下装，不经过浏览器往返。
+    
+    返回:
+        (task_id, cached, record): 下装任务（上装失败时为上装任务）的ID、命中缓存时的结果和最终记录
+    """
+    cache_key = tryon_cache_key(params)
+    if cache_key:
+        cached = get_result_cache().get(cache_key)
+        if cached:
+            logger.info(f"命中试衣结果缓存: {cache_key}")
+            return cached.get('task_id'), cached, None
+    
+    top, bottom = outfit_stages(params)
+    top_task_id, cached, record = submit_and_wait(top)
+    if cached:
+        bottom['person_url'] = cached['image_url']
+    elif record and record['task_status'] == 'SUCCEEDED':
+        bottom['person_url'] = record['image_url']
+    else:
+        return top_task_id, None, record
+    
+    task_id = submit_task(bottom)
+    if not task_id:
+        return None, None, None
+    logger.info(f"整套搭配的上装任务 {top_task_id} 已完成，已提交下装任务 {task_id}")
+    track_outfit_bottom(task_id, params, cache_key, top_task_id)
+    return task_id, None, get_task_tracker().wait(task_id)
+
+def submit_and_wait(params):
+    """
+    提交（或复用）试衣任务并等待结束，direct接口和批量试衣共用
+    
+    返回:
+        (task_id, cached, record): 命中缓存时record为None；提交失败时task_id为None
+    """
+    if is_chained_outfit(params):
+        return run_outfit_chain(params)
+    task_id, cached = submit_or_reuse(params)
+    if cached or not task_id:
+        return task_id, cached, None
+    return task_id, None, get_task_tracker().wait(task_id)
+
+# 批量试衣的共享线程池：线程数即同时进行的批量试衣子任务上限
+batch_executor = ThreadPoolExecutor(max_workers=Config.BATCH_CONCURRENCY, thread_name_prefix='tryon-batch')
+
+def run_batch_item(index, params, base_url):
+    """批量试衣中的单个子任务：提交（或复用缓存）并等待结束"""
+    item = {
+        'index': index,
+        'garment_image_url': params['garment_url'],
+        'garment_type': params['garment_type']
+    }
+    if params.get('bottom_garment_url'):
+        item['bottom_garment_image_url'] = params['bottom_garment_url']
+    try:
+        task_id, cached, record = submit_and_wait(params)
+    except GovernorBusy as e:
+        item.update(status='error', message=QUEUE_FULL_ERROR, retry_after=e.retry_after)
+        return item
+    if cached:
+        item.update(status='success', task_id=task_id, cached=True, **result_image_fields(task_id, cached['image_url'], base_url))
+        return item
+    if not task_id:
+        item.update(status='error', message='提交试衣任务失败')
+        return item
+    
+    item['task_id'] = task_id
+    if record and record['task_status'] == 'SUCCEEDED':
+        item.update(status='success', **result_image_fields(task_id, record['image_url'], base_url))
+    elif record and record['task_status'] in TERMINAL_STATES:
+        item.update(status='error', message=record['message'] or '未知错误')
+    else:
+        item.update(status='error', message='获取试衣结果失败或任务超时')
+    return item
+
+def task_status_payload(record, base_url):
+    """将跟踪器中的任务记录转换为状态接口的响应格式（trace_id为提交该任务的请求的trace id）"""
+    task_status = record['task_status']
+    if task_status == 'SUCCEEDED':
+        payload = {
+            'status': 'success',
+            'task_status': task_status,
+            **result_image_fields(record['task_id'], record['image_url'], base_url)
+        }
+    else:
+        payload = {
+            'status': task_status.lower(),
+            'task_status': task_status,
+            'message': record['message']
+        }
+    if record['meta'].get('trace_id'):
+        payload['trace_id'] = record['meta']['trace_id']
+    return payload
+
+# 提交失败时的错误信息
+SUBMIT_FAILED_ERROR = '提交试衣任务失败，请检查API密钥和网络连接'
+# 准入控制拒绝时的错误信息（HTTP 429）
+QUEUE_FULL_ERROR = '当前排队的试衣任务过多，请稍后再试'
+# 分步提交的整套搭配需要在服务端等待上装结果，只能通过等待结果的接口提交
+OUTFIT_CHAIN_JOBS_ERROR = '当前模型不支持一次提交整套搭配，请使用 /api/tryon/direct 接口'
+# 状态推送接口只推送本服务提交过的任务
+TASK_NOT_FOUND_ERROR = '任务不存在或已过期'
+# 等待同一任务的并发状态查询超时（HTTP 503）
+STATUS_UNAVAILABLE_ERROR = '任务状态查询繁忙，请稍后再试'
+
+def cached_result_payload(task_id, cached, base_url):
+    """命中结果缓存时 direct / jobs 接口的响应体"""
+    return {
+        'status': 'success',
+        'task_id': task_id,
+        'cached': True,
+        'trace_id': tracing.current_trace_id(),
+        **result_image_fields(task_id, cached['image_url'], base_url)
+    }
+
+def busy_response_parts(error):
+    """准入控制拒绝时的响应体和响应头（Retry-After为估计的排队消化时间）"""
+    return {'error': QUEUE_FULL_ERROR, 'retry_after': error.retry_after}, {'Retry-After': str(error.retry_after)}
+
+def submitted_task_payload(task_id):
+    """jobs接口提交成功时的响应体"""
+    return {
+        'status': 'submitted',
+        'task_id': task_id,
+        'trace_id': tracing.current_trace_id(),
+        'status_url': f"/api/tryon/status/{task_id}"
+    }
+
+def finished_task_response(task_id, record, base_url):
+    """
+    direct接口等待任务结束后的响应
+    
+    返回:
+        (响应体, 状态码)
+    """
+    if not record or record['task_status'] not in TERMINAL_STATES:
+        return {'error': '获取试衣结果失败或任务超时'}, 500
+    
+    if record['task_status'] == 'SUCCEEDED':
+        return {
+            'status': 'success',
+            'task_id': task_id,
+            'trace_id': tracing.current_trace_id(),
+            **result_image_fields(task_id, record['image_url'], base_url)
+        }, 200
+    error_msg = record['message'] or '未知错误'
+    return {
+        'status': 'error',
+        'message': f'试衣任务失败: {error_msg}',
+        'task_id': task_id,
+        'trace_id': tracing.current_trace_id()
+    }, 500
+
+def upstream_status_payload(result):
+    """跟踪器和登记表中都没有的任务，根据上游查询结果生成状态接口的响应体"""
+    task_status = result.get('output', {}).get('task_status')
+    if task_status == 'SUCCEEDED':
+        return {
+            'status': 'success',
+            'image_url': result['output']['image_url'],
+            'task_status': task_status
+        }
+    return {
+        'status': task_status.lower(),
+        'task_status': task_status,
+        'message': result.get('output', {}).get('message', '')
+    }
+
+def load_task_status(task_id):
+    """
+    读取任务状态（状态接口缓存未命中时调用）
+
+    返回:
+        tuple: ((来源, 任务记录或上游查询结果), 任务状态)，查询失败时为 (None, None)
+    """
+    # 优先使用后台跟踪器（及任务登记表）中的状态，无需请求上游
+    record = get_task_tracker().get(task_id)
+    if record:
+        tryon_metrics.STATUS_LOOKUPS.labels(source='tracker').inc()
+        return ('tracker', record), record['task_status']
+    # 登记表中也没有的任务（如已过期清理），直接查询上游
+    tryon_metrics.STATUS_LOOKUPS.labels(source='upstream').inc()
+    result = get_tryon_client().query_task_status(task_id)
+    if not result:
+        return None, None
+    return ('upstream', result), result.get('output', {}).get('task_status')
+
+def status_payload(status, base_url):
+    """根据 load_task_status 读取到的状态生成状态接口的响应体"""
+    source, data = status
+    if source == 'tracker':
+        return task_status_payload(data, base_url)
+    return upstream_status_payload(data)
+
+def status_response_headers(payload):
+    """
+    状态接口的缓存相关响应头
+
+    ETag为响应体的哈希，轮询的客户端带上If-None-Match时状态未变化即返回304；
+    进行中的状态每次都要重新验证，已结束的状态允许浏览器缓存一段时间
+    （不长期缓存：未启用结果图片代理时结果URL约24小时后失效）。
+    """
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode()
+    etag = hashlib.sha1(body).hexdigest()
+    if payload.get('task_status') in FINAL_STATES:
+        cache_control = f"private, max-age={Config.STATUS_CACHE_MAX_AGE}"
+    else:
+        cache_control = 'no-cache'
+    return etag, {'ETag': f'W/"{etag}"', 'Cache-Control': cache_control}
+
+def prepare_upload(stream, filename):
+    """将上传流写入临时文件并规范化，返回处理后的SpooledUpload（同步和ASGI两种部署共用）"""
+    started = time.time()
+    spooled = spool_upload(stream, filename)
+    tryon_metrics.UPLOAD_BYTES.observe(spooled.size)
+    upload = preprocess_upload(spooled)
+    tracing.record_stage('upload', started, time.time(), bytes=spooled.size, stored_bytes=upload.size)
+    return upload
+
+def save_upload(file, filename):
+    """
+    保存上传的图片到存储后端（远程存储不可用时保存到本地）
+    
+    文件分块写入临时文件并同时计算SHA-256，在进程池中完成规范化（方向校正、缩放、
+    去除元数据、重新编码）后以内容哈希作为对象名，相同内容只存储一份，已存在的对象不会重复上传
+    
+    返回:
+        (url, digest): 文件URL和内容哈希
+    """
+    upload = prepare_upload(file.stream, filename)
+    storage = get_storage()
+    try:
+        try:
+            with tracing.stage('storage_put', backend=storage.name, bytes=upload.size):
+                key = storage.store(upload)
+            url = storage.url(key, base_url=request.host_url)
+            logger.info(f"文件已保存到{storage.name}存储: {url}")
+            return url, upload.digest
+        except Exception as e:
+            if isinstance(storage, LocalStorage):
+                raise
+            logger.error(f"上传到{storage.name}存储失败，改用本地存储: {e}")
+        
+        local_storage = get_local_storage()
+        with tracing.stage('storage_put', backend=local_storage.name, bytes=upload.size):
+            key = local_storage.store(upload)
+        return local_storage.url(key, base_url=request.host_url), upload.digest
+    finally:
+        upload.cleanup()
+
+# 请求级trace id：沿用客户端传入的traceparent / X-Request-ID，否则新生成，并通过响应头返回
+@api.before_app_request
+def bind_trace_id():
+    tracing.set_trace_id(tracing.trace_id_from_headers(request.headers))
+
+# 本请求提交上游任务时的优先级类别和租户（批量试衣接口默认按批量类别排队）
+@api.before_app_request
+def bind_schedule():
+    default = 'batch' if request.endpoint == 'api.batch_tryon' else 'interactive'
+    set_schedule(request_priority(request.headers, default), request_tenant(request.headers, request.remote_addr))
+
+@api.after_app_request
+def add_trace_header(response):
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        response.headers['X-Trace-Id'] = trace_id
+    return response
 
 # 路由定义
-@app.route('/')
+@api.route('/')
 def hello():
     return "PAIDA虚拟试穿服务已启动!"
 
-@app.route('/favicon.ico')
+@api.route('/favicon.ico')
 def favicon():
-    return send_from_directory(os.path.join(app.root_path, 'static'),
+    return send_from_directory(os.path.join(current_app.root_path, 'static'),
                                'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
-@app.route('/api/health')
+@api.route('/api/health')
 def health_check():
     return jsonify({'status': 'ok', 'message': '服务正常运行'})
 
-@app.route('/api/verify')
+@api.route('/api/ready')
+def readiness_check():
+    """
+    就绪检查：初始化各组件并探测OSS连通性，全部正常时返回200，否则返回503
+    
+    存活检查（/api/health）不依赖任何外部服务；负载均衡/编排系统应使用本接口决定是否转发流量
+    """
+    checks = {
+        'dashscope': 'ok' if get_tryon_client().api_key else '未配置DASHSCOPE_API_KEY',
+        'storage': probe_storage() or 'ok'
+    }
+    try:
+        get_task_tracker()
+        checks['task_tracker'] = 'ok'
+    except Exception as e:
+        checks['task_tracker'] = str(e)
+    
+    ready = all(value == 'ok' for value in checks.values())
+    return jsonify({'status': 'ready' if ready else 'not_ready', 'checks': checks}), 200 if ready else 503
+
+@api.route('/api/verify')
 def verify_api_key():
     """验证DashScope API密钥"""
     headers = {
         "Authorization": f"Bearer {os.environ.get('DASHSCOPE_API_KEY')}"
     }
     try:
-        response = requests.get("https://dashscope.aliyuncs.com/api/v1/models", headers=headers, timeout=10)
+        response = get_session('dashscope').get(f"{Config.DASHSCOPE_BASE_URL}/api/v1/models", headers=headers,
+                                                timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_QUERY_TIMEOUT))
         if response.status_code == 200:
             return jsonify({"status": "success", "message": "API key is valid"})
         else:
@@ -314,7 +892,7 @@ def verify_api_key():
     except Exception as e:
         return jsonify({"status": "error", "message": f"API key validation error: {str(e)}"})
 
-@app.route('/api/tryon/upload', methods=['POST'])
+@api.route('/api/tryon/upload', methods=['POST'])
 def upload_image():
     """上传图片到服务器或OSS"""
     try:
@@ -328,8 +906,9 @@ def upload_image():
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             
-            # 上传文件到OSS或本地
-            image_url = upload_to_oss(file, filename)
+            # 上传文件到存储后端，并记录内容哈希供结果缓存使用
+            image_url, digest = save_upload(file, filename)
+            get_result_cache().register_digest(image_url, digest)
             
             return jsonify({'url': image_url})
         
@@ -338,109 +917,441 @@ def upload_image():
         logger.error(f"上传文件时出错: {e}")
         return jsonify({'error': '上传文件时发生错误'}), 500
 
-@app.route('/uploads/<filename>')
+# 浏览器直传支持的图片类型及对象扩展名（浏览器端已缩放并重新编码）
+DIRECT_UPLOAD_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp'}
+# 直传的图片不存在、无法确认或超出直传的类型和大小限制时的错误信息
+DIRECT_UPLOAD_REJECTED_ERROR = '直传的图片不存在或不符合要求，请重新上传'
+# 直传对象的文件名（随机键，位于存储后端前缀下的direct/目录）
+DIRECT_UPLOAD_NAME = re.compile(r'^[0-9a-f]{32}\.(jpg|png|webp)$')
+
+def _origin(parts):
+    """URL的 (协议, 主机, 端口)，主机已转为小写，端口缺省时按协议补全"""
+    scheme = parts.scheme.lower()
+    return scheme, parts.hostname, parts.port or {'http': 80, 'https': 443}.get(scheme)
+
+def check_direct_upload(url):
+    """
+    浏览器直传的图片用于试衣之前，通过HEAD确认对象存在、类型和大小符合直传的限制；其他URL直接通过
+
+    按解析后的对象键判断：与存储的访问地址同源、解码并规范化后的路径位于直传目录下的URL都视为直传，
+    必须恰好是目录下的一个内容寻址文件名（不带查询参数、编码或多余的路径段）
+
+    返回:
+        str: 不符合时的错误信息，否则为None
+    """
+    storage = get_storage()
+    directory = f"{storage.prefix}direct/"
+    base = urlsplit(storage.url(directory))
+    parts = urlsplit(url)
+    if _origin(parts) != _origin(base):
+        return None
+    base_path = unquote(base.path)
+    path = unquote(parts.path)
+    # 规范化（去掉 .、.. 和重复的/）之后指向直传目录的也按直传检查，不能借此绕过
+    normalized = '/' + posixpath.normpath(path).lstrip('/')
+    if not (path.startswith(base_path) or (normalized + '/').startswith(base_path)):
+        return None
+    name = path[len(base_path):]
+    if parts.path != base.path + name or parts.query or parts.fragment or not DIRECT_UPLOAD_NAME.fullmatch(name):
+        return f'{DIRECT_UPLOAD_REJECTED_ERROR}: {url}'
+    try:
+        reason = storage.check_upload(directory + name, DIRECT_UPLOAD_TYPES, Config.DIRECT_UPLOAD_MAX_BYTES)
+    except Exception as e:
+        logger.warning(f"检查直传图片 {url} 失败: {e}")
+        return f'{DIRECT_UPLOAD_REJECTED_ERROR}: {url}'
+    if reason:
+        logger.warning(f"拒绝直传图片 {url}: {reason}")
+        return f'{DIRECT_UPLOAD_REJECTED_ERROR}: {url}'
+    return None
+
+@api.route('/api/tryon/upload-url', methods=['POST'])
+def create_upload_url():
+    """
+    签发浏览器直接上传到存储服务的短时签名URL，图片字节不经过本服务
+    
+    请求体:
+        {"content_type": "image/jpeg", "size": 123456}
+    
+    返回:
+        {"direct": true, "method": "POST", "upload_url": "...", "fields": {...}, "url": "上传后的访问地址", "expires_in": 300}，
+        浏览器以multipart表单上传（fields在前，文件字段file在后），存储服务拒绝大于size的文件；
+        存储后端不支持直传（本地存储）、已关闭直传或图片超过DIRECT_UPLOAD_MAX_BYTES时为 {"direct": false}，
+        浏览器改为POST到 /api/tryon/upload（由本服务预处理）
+    """
+    data = request.get_json(silent=True) or {}
+    content_type = data.get('content_type')
+    if content_type not in DIRECT_UPLOAD_TYPES:
+        return jsonify({'error': '不支持的文件类型'}), 400
+    size = data.get('size')
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': '缺少必需的参数: size'}), 400
+    if size > Config.MAX_CONTENT_LENGTH:
+        return jsonify({'error': '文件太大'}), 413
+    
+    storage = get_storage()
+    # 对象键随机生成：浏览器声明的内容哈希无法校验，不能作为内容寻址的键（结果缓存在首次试衣时自行计算哈希）
+    key = f"{storage.prefix}direct/{uuid.uuid4().hex}{DIRECT_UPLOAD_TYPES[content_type]}"
+    signed = None
+    if Config.DIRECT_UPLOAD_ENABLED and size <= Config.DIRECT_UPLOAD_MAX_BYTES:
+        signed = storage.presign_upload(key, content_type, size, Config.DIRECT_UPLOAD_EXPIRES)
+    if signed is None:
+        tryon_metrics.UPLOAD_URLS.labels(mode='server').inc()
+        return jsonify({'direct': False})
+    
+    tryon_metrics.UPLOAD_URLS.labels(mode='direct').inc()
+    return jsonify({
+        'direct': True,
+        'method': signed['method'],
+        'upload_url': signed['url'],
+        'fields': signed['fields'],
+        'url': storage.url(key),
+        'expires_in': Config.DIRECT_UPLOAD_EXPIRES
+    })
+
+@api.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """提供已上传的文件（仅当使用本地存储时）"""
-    if bucket is not None:
-        return jsonify({'error': '文件存储在OSS，请使用OSS URL'}), 404
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """
+    提供本地存储中的上传文件
+    
+    根据 LOCAL_STORAGE_SERVE_MODE 交给nginx（X-Accel-Redirect）/ Apache（X-Sendfile）发送，
+    或由WSGI服务器以sendfile发送（支持ETag和Range），文件内容不经过Python代码
+    """
+    response = get_local_storage().serve(filename)
+    if response is None:
+        return jsonify({'error': '文件不存在'}), 404
+    return response
 
-@app.route('/api/tryon/direct', methods=['POST'])
-@limiter.limit("10 per hour")
+@api.route('/api/tryon/direct', methods=['POST'])
+@limiter.limit(TRYON_RATE_LIMIT)
 def direct_tryon():
     """直接处理试衣请求"""
     try:
         logger.info("收到试衣请求")
         
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': '没有提供JSON数据'}), 400
-        
-        person_url = data.get('person_image_url')
-        garment_url = data.get('garment_image_url')
-        garment_type = data.get('garment_type', 'top')
+        params, error = parse_tryon_request()
+        if error:
+            return error
         
-        logger.info(f"试衣参数: person_url={person_url}, garment_url={garment_url}, garment_type={garment_type}")
+        # 提交试衣任务（相同输入复用缓存结果或正在处理中的任务），由共享轮询调度器跟踪，
+        # 本请求只等待状态变化，不再自行轮询上游
+        task_id, cached, record = submit_and_wait(params)
+        if cached:
+            schedule_prefetch(request.get_json(silent=True), params, request.headers)
+            return jsonify(cached_result_payload(task_id, cached, request.host_url))
+        if not task_id:
+            return jsonify({'error': SUBMIT_FAILED_ERROR}), 500
         
-        if not person_url or not garment_url:
-            return jsonify({'error': '缺少必需的参数: person_image_url 或 garment_image_url'}), 400
+        body, status = finished_task_response(task_id, record, request.host_url)
+        if status == 200:
+            schedule_prefetch(request.get_json(silent=True), params, request.headers)
+        return jsonify(body), status
+    except GovernorBusy as e:
+        body, headers = busy_response_parts(e)
+        return jsonify(body), 429, headers
+    except Exception as e:
+        logger.exception("处理试衣请求时发生异常")
+        return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+@api.route('/api/tryon/jobs', methods=['POST'])
+@limiter.limit(TRYON_RATE_LIMIT)
+def create_tryon_job():
+    """提交试衣任务后立即返回任务ID，由后台跟踪器轮询结果"""
+    try:
+        logger.info("收到异步试衣请求")
         
-        # 检查URL是否可公开访问
-        if 'localhost' in person_url or '127.0.0.1' in person_url:
-            return jsonify({'error': '人物图像URL不可公开访问，请使用公共存储服务'}), 400
-            
-        if 'localhost' in garment_url or '127.0.0.1' in garment_url:
-            return jsonify({'error': '服装图像URL不可公开访问，请使用公共存储服务'}), 400
+        params, error = parse_tryon_request()
+        if error:
+            return error
+        if is_chained_outfit(params):
+            return jsonify({'error': OUTFIT_CHAIN_JOBS_ERROR}), 400
         
-        # 提交试衣任务
-        task_id = tryon_client.submit_tryon_task(person_url, garment_url, garment_type)
+        task_id, cached = submit_or_reuse(params)
+        if cached:
+            return jsonify(cached_result_payload(task_id, cached, request.host_url))
         if not task_id:
-            return jsonify({'error': '提交试衣任务失败，请检查API密钥和网络连接'}), 500
+            return jsonify({'error': SUBMIT_FAILED_ERROR}), 500
         
-        # 等待任务完成
-        result = tryon_client.wait_for_task_completion(task_id)
-        if not result:
-            return jsonify({'error': '获取试衣结果失败或任务超时'}), 500
-        
-        task_status = result.get('output', {}).get('task_status')
-        if task_status == 'SUCCEEDED':
-            image_url = result['output']['image_url']
-            return jsonify({
-                'status': 'success',
-                'image_url': image_url,
-                'task_id': task_id
-            })
-        else:
-            error_msg = result.get('output', {}).get('message', '未知错误')
-            return jsonify({
-                'status': 'error',
-                'message': f'试衣任务失败: {error_msg}',
-                'task_id': task_id
-            }), 500
-            
+        return jsonify(submitted_task_payload(task_id)), 202
+    except GovernorBusy as e:
+        body, headers = busy_response_parts(e)
+        return jsonify(body), 429, headers
     except Exception as e:
-        logger.exception("处理试衣请求时发生异常")
+        logger.exception("提交异步试衣任务时发生异常")
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
-@app.route('/api/tryon/status/<task_id>', methods=['GET'])
+@api.route('/api/tryon/batch', methods=['POST'])
+@limiter.limit(TRYON_RATE_LIMIT)
+def batch_tryon():
+    """
+    批量试衣：同一张人物图搭配多件服装，并发提交，每完成一件即以NDJSON流式返回一行
+    
+    请求体:
+        {"person_image_url": "...",
+         "garments": [{"garment_image_url": "...", "garment_type": "top"}, ...]}
+        整套搭配的条目同时给出 garment_image_url（上装）和 bottom_garment_image_url（下装）
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': '没有提供JSON数据'}), 400
+    
+    person_url = data.get('person_image_url')
+    garments = data.get('garments')
+    if not person_url or not isinstance(garments, list) or not garments:
+        return jsonify({'error': '缺少必需的参数: person_image_url 或 garments'}), 400
+    if len(garments) > Config.BATCH_MAX_ITEMS:
+        return jsonify({'error': f'单次最多支持 {Config.BATCH_MAX_ITEMS} 件服装'}), 400
+    if not is_public_url(person_url):
+        return jsonify({'error': '人物图像URL不可公开访问，请使用公共存储服务'}), 400
+    error = check_direct_upload(person_url)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    items = []
+    for garment in garments:
+        garment_url = garment.get('garment_image_url') if isinstance(garment, dict) else None
+        if not garment_url or not is_public_url(garment_url):
+            return jsonify({'error': f'服装图像URL无效或不可公开访问: {garment_url}'}), 400
+        bottom_garment_url = garment.get('bottom_garment_image_url')
+        if bottom_garment_url and not is_public_url(bottom_garment_url):
+            return jsonify({'error': f'下装图像URL不可公开访问: {bottom_garment_url}'}), 400
+        for url in (garment_url, bottom_garment_url):
+            error = url and check_direct_upload(url)
+            if error:
+                return jsonify({'error': error}), 400
+        items.append({
+            'person_url': person_url,
+            'garment_url': garment_url,
+            'garment_type': 'outfit' if bottom_garment_url else garment.get('garment_type', 'top'),
+            'bottom_garment_url': bottom_garment_url
+        })
+    
+    # 批量类别的提交队列已经排得过长时整批拒绝（子任务命中缓存时不受影响，但无法预先判断）
+    try:
+        admit_submission()
+    except GovernorBusy as e:
+        body, headers = busy_response_parts(e)
+        return jsonify(body), 429, headers
+    
+    batch_id = uuid.uuid4().hex
+    base_url = request.host_url
+    logger.info(f"收到批量试衣请求 {batch_id}: {len(items)} 件服装")
+    tryon_metrics.BATCH_SIZE.observe(len(items))
+    
+    def stream():
+        started = time.time()
+        succeeded = 0
+        yield json.dumps({'event': 'accepted', 'batch_id': batch_id, 'total': len(items),
+                          'trace_id': tracing.current_trace_id()}) + "\n"
+        
+        # 子任务在线程池中执行，复制当前上下文使其日志和任务带上本批次的trace id
+        futures = [batch_executor.submit(contextvars.copy_context().run, run_batch_item, index, params, base_url)
+                   for index, params in enumerate(items)]
+        for future in as_completed(futures):
+            try:
+                item = future.result()
+            except Exception as e:
+                logger.exception(f"批量试衣 {batch_id} 子任务异常")
+                item = {'status': 'error', 'message': str(e)}
+            
+            item['event'] = 'result'
+            item['elapsed'] = round(time.time() - started, 3)
+            if item['status'] == 'success':
+                succeeded += 1
+            tryon_metrics.BATCH_ITEMS.labels(status=item['status']).inc()
+            tryon_metrics.BATCH_ITEM_LATENCY.observe(item['elapsed'])
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+        
+        duration = time.time() - started
+        tryon_metrics.BATCH_DURATION.observe(duration)
+        tryon_metrics.BATCH_THROUGHPUT.observe(len(items) / duration if duration > 0 else 0)
+        logger.info(f"批量试衣 {batch_id} 完成: 成功 {succeeded}/{len(items)}，耗时 {duration:.1f}s")
+        yield json.dumps({
+            'event': 'done',
+            'batch_id': batch_id,
+            'succeeded': succeeded,
+            'failed': len(items) - succeeded,
+            'duration': round(duration, 3)
+        }) + "\n"
+    
+    return Response(stream(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@api.route('/api/tryon/status/<task_id>', methods=['GET'])
 def get_tryon_status(task_id):
     """查询试衣任务状态"""
     try:
         if not task_id:
             return jsonify({'error': '缺少task_id参数'}), 400
         
-        result = tryon_client.query_task_status(task_id)
-        if not result:
+        # 同一任务的并发查询合并为一次读取，进行中的状态短时缓存（见 utils.status_cache）
+        status = get_status_cache().get(task_id, lambda: load_task_status(task_id))
+        if not status:
             return jsonify({'error': '查询任务状态失败'}), 500
         
-        task_status = result.get('output', {}).get('task_status')
-        if task_status == 'SUCCEEDED':
-            image_url = result['output']['image_url']
-            return jsonify({
-                'status': 'success',
-                'image_url': image_url,
-                'task_status': task_status
-            })
-        else:
-            return jsonify({
-                'status': task_status.lower(),
-                'task_status': task_status,
-                'message': result.get('output', {}).get('message', '')
-            })
+        payload = status_payload(status, request.host_url)
+        etag, headers = status_response_headers(payload)
+        if request.if_none_match.contains_weak(etag):
+            return '', 304, headers
+        return jsonify(payload), 200, headers
+    except StatusUnavailable as e:
+        return jsonify({'error': STATUS_UNAVAILABLE_ERROR, 'retry_after': e.retry_after}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.exception("查询任务状态时发生异常")
         return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
 
+@api.route('/api/tryon/events/<task_id>', methods=['GET'])
+def tryon_events(task_id):
+    """
+    以Server-Sent Events推送任务状态变化（PENDING -> RUNNING -> SUCCEEDED/FAILED）
+    
+    状态来自后台跟踪器，浏览器端无论有多少连接都不会产生额外的上游请求
+    """
+    # 只推送本服务提交过的任务（跟踪器或登记表中已有），读接口不创建跟踪、不触发上游查询；
+    # 由其他worker负责的任务只读取登记表
+    if get_task_tracker().get(task_id) is None:
+        return jsonify({'error': TASK_NOT_FOUND_ERROR}), 404
+    base_url = request.host_url
+    
+    def stream():
+        last_status = None
+        # 建议浏览器断线后的重连间隔(毫秒)
+        yield "retry: 3000\n\n"
+        while True:
+            record = get_task_tracker().wait_for_change(task_id, last_status, Config.SSE_KEEPALIVE_INTERVAL)
+            if record is None:
+                yield f"event: error\ndata: {json.dumps({'error': TASK_NOT_FOUND_ERROR})}\n\n"
+                return
+            if record['task_status'] == last_status:
+                # 心跳注释，防止代理因空闲断开连接
+                yield ": keep-alive\n\n"
+                continue
+            last_status = record['task_status']
+            payload = task_status_payload(record, base_url)
+            payload['task_id'] = task_id
+            yield f"event: status\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            if last_status in TERMINAL_STATES:
+                return
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # 关闭nginx对该响应的缓冲
+        'X-Accel-Buffering': 'no'
+    })
+
+@api.route('/api/tryon/results/<name>', methods=['GET'])
+def get_result_image(name):
+    """
+    提供试衣结果原图（<task_id>.png）或缩略图（<task_id>.w320.webp 等）
+    
+    文件来自本地磁盘LRU缓存或存储后端，尚未保存时立即从DashScope结果地址下载一次；
+    文件内容不变，响应带长期缓存头并支持ETag/Range
+    """
+    task_id, _, variant = name.partition('.')
+    result_images = get_result_images()
+    if result_images is None or not task_id.replace('-', '').isalnum() or not result_images.is_valid_variant(variant):
+        return jsonify({'error': '图片不存在'}), 404
+    
+    record = get_task_tracker().get(task_id)
+    source_url = record['image_url'] if record and record['task_status'] == 'SUCCEEDED' else None
+    path = result_images.open(task_id, variant, source_url)
+    if path is None:
+        return jsonify({'error': '图片不存在或已过期'}), 404
+    
+    response = send_file(path, conditional=True, etag=True, max_age=31536000)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+def require_admin_token(view):
+    """管理接口鉴权：请求头 Authorization: Bearer <ADMIN_TOKEN>，未配置ADMIN_TOKEN时管理接口不可用"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not Config.ADMIN_TOKEN:
+            return jsonify({'error': '管理接口未启用'}), 404
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+            return jsonify({'error': '未授权'}), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+def parse_warm_pairs(data):
+    """
+    解析预热请求中的 (人物, 服装, 类型) 组合
+    
+    请求体为以下两种格式之一：
+        {"pairs": [{"person_image_url": "...", "garment_image_url": "...", "garment_type": "top"}, ...]}
+        {"person_image_urls": [...], "garments": [{"garment_image_url": "...", "garment_type": "top"}, ...]}
+        （后者为所有人物与所有服装的组合）
+    
+    返回:
+        (pairs, error): 校验通过时error为None，否则为错误说明
+    """
+    if not data:
+        return None, '没有提供JSON数据'
+    if isinstance(data.get('pairs'), list):
+        items = data['pairs']
+    elif isinstance(data.get('person_image_urls'), list) and isinstance(data.get('garments'), list):
+        items = [dict(garment, person_image_url=person_url)
+                 for person_url in data['person_image_urls'] for garment in data['garments'] if isinstance(garment, dict)]
+    else:
+        return None, '缺少必需的参数: pairs 或 person_image_urls + garments'
+    if not items:
+        return None, '没有需要预热的组合'
+    if len(items) > Config.WARM_INDEX_MAX_PAIRS:
+        return None, f'单次最多支持 {Config.WARM_INDEX_MAX_PAIRS} 个组合'
+    
+    pairs = []
+    for item in items:
+        params, error = validate_tryon_params(item if isinstance(item, dict) else None)
+        if error:
+            return None, error[0]['error']
+        if params['bottom_garment_url']:
+            return None, '预计算结果索引不支持整套搭配'
+        pairs.append(params)
+    return pairs, None
+
+@api.route('/api/admin/warm', methods=['POST'])
+@limiter.exempt
+@require_admin_token
+def start_warm_job():
+    """为热门商品预先生成试衣结果并写入预计算结果索引，立即返回预热任务ID"""
+    if get_warm_index() is None:
+        return jsonify({'error': '预计算结果索引未启用'}), 404
+    pairs, error = parse_warm_pairs(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    job_id = get_index_warmer().start(pairs)
+    logger.info(f"收到预热请求 {job_id}: {len(pairs)} 个组合")
+    return jsonify({'job_id': job_id, 'status': 'pending', 'total': len(pairs),
+                    'status_url': f"/api/admin/warm/{job_id}"}), 202
+
+@api.route('/api/admin/warm/<job_id>', methods=['GET'])
+@limiter.exempt
+@require_admin_token
+def get_warm_job(job_id):
+    """查询预热任务的进度"""
+    warm_index = get_warm_index()
+    job = warm_index.get_job(job_id) if warm_index is not None else None
+    if job is None:
+        return jsonify({'error': '预热任务不存在'}), 404
+    job['entries'] = warm_index.count()
+    return jsonify(job)
+
 # 错误处理
-@app.errorhandler(413)
+@api.app_errorhandler(413)
 def too_large(e):
     return jsonify({'error': '文件太大'}), 413
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(e):
     logger.error(f"服务器内部错误: {e}")
     return jsonify({'error': '服务器内部错误'}), 500
 
+# 创建应用实例（gunicorn app:app）
+app = create_app()
+
 # 应用启动
 if __name__ == '__main__':
     port = int(os.environ.get('FLASK_PORT', 5001))
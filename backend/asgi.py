@@ -0,0 +1,435 @@
+"""
+ASGI部署入口：uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+（或 gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app）
+
+试衣的耗时几乎都花在等待DashScope和OSS上。同步部署中每个进行中的试衣请求占用一个线程，
+这里把上传、提交、等待结果、状态查询和状态推送改为协程：
+  - DashScope提交/查询使用httpx异步客户端，排队等待上游配额时不占用线程
+  - 等待任务结束由共享轮询调度器在状态变化时唤醒（TaskTracker.wait_async），一个进程可以同时等待数千个任务
+  - OSS小文件通过签名URL异步PUT，图片预处理等CPU/磁盘操作在线程池中执行
+其余接口（批量试衣、结果图片、/uploads、/metrics、/api/ready等）及CORS预检请求转交原Flask应用，
+由hypercorn的WSGI适配器在线程池中执行。两种部署的路由和JSON格式一致，任务跟踪、结果缓存、
+配额调节器等组件与 app.py 共用。
+
+需要额外安装 requirements-asgi.txt 中的依赖（quart、httpx、uvicorn）。
+"""
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from quart import Quart, g, jsonify, make_response, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import secure_filename
+
+import app as sync_app
+from app import (
+    DEFAULT_RATE_LIMITS, OUTFIT_CHAIN_JOBS_ERROR, STATUS_UNAVAILABLE_ERROR, SUBMIT_FAILED_ERROR, TASK_NOT_FOUND_ERROR, TRYON_RATE_LIMIT, admit_submission, allowed_file,
+    busy_response_parts, cached_result_payload, finished_task_response, get_local_storage, get_result_cache, get_storage, get_task_tracker, get_tryon_client,
+    get_status_cache, is_chained_outfit, note_prefetch_hit, outfit_stages, prepare_upload, status_payload, status_response_headers,
+    submitted_task_payload, task_status_payload, track_outfit_bottom, tryon_cache_key, tryon_inputs_hash,
+    request_priority, request_tenant, schedule_prefetch, validate_tryon_params, warm_lookup, warm_up
+)
+from config import Config
+from utils import metrics as tryon_metrics
+from utils import tracing
+from utils.aliyun_client import TERMINAL_STATES, AsyncAliyunAITryOnClient
+from utils.async_http import close_async_clients
+from utils.governor import GovernorBusy, set_schedule
+from utils.status_cache import StatusUnavailable
+from utils.storage import LocalStorage
+
+logger = logging.getLogger(__name__)
+
+
+def get_async_tryon_client():
+    """返回阿里云AI试衣异步客户端（与同步客户端共用API密钥和上游配额调节器）"""
+    def create():
+        client = get_tryon_client()
+        return AsyncAliyunAITryOnClient(api_key=client.api_key, governor=client.governor)
+    return sync_app._component('async_tryon_client', create)
+
+
+async def load_task_status_async(task_id):
+    """load_task_status 的协程版本：登记表在线程池中读取，上游查询使用异步客户端"""
+    record = await asyncio.to_thread(get_task_tracker().get, task_id)
+    if record:
+        tryon_metrics.STATUS_LOOKUPS.labels(source='tracker').inc()
+        return ('tracker', record), record['task_status']
+    tryon_metrics.STATUS_LOOKUPS.labels(source='upstream').inc()
+    result = await get_async_tryon_client().query_task_status(task_id)
+    if not result:
+        return None, None
+    return ('upstream', result), result.get('output', {}).get('task_status')
+
+
+async def submit_task_async(client, params):
+    """app.submit_task的协程版本"""
+    admit_submission()
+    return await client.submit_tryon_task(params['person_url'], params['garment_url'], params['garment_type'],
+                                          params.get('bottom_garment_url'))
+
+
+async def submit_or_reuse_async(params):
+    """app.submit_or_reuse的协程版本，返回 (task_id, cached)"""
+    warm = await asyncio.to_thread(warm_lookup, params)
+    if warm:
+        logger.info(f"命中预计算结果索引: 任务 {warm['task_id']}")
+        return warm['task_id'], warm
+
+    cache_key = await asyncio.to_thread(tryon_cache_key, params)
+    tracker = get_task_tracker()
+    client = get_async_tryon_client()
+    if cache_key is None:
+        task_id = await submit_task_async(client, params)
+        if task_id:
+            await asyncio.to_thread(tracker.track, task_id, inputs_hash=tryon_inputs_hash(params),
+                                    garment_type=params['garment_type'], trace_id=tracing.current_trace_id())
+        return task_id, None
+
+    result_cache = get_result_cache()
+    async with result_cache.lock_async(cache_key):
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached:
+            logger.info(f"命中试衣结果缓存: {cache_key}")
+            await asyncio.to_thread(note_prefetch_hit, cache_key, 'cached')
+            return cached.get('task_id'), cached
+
+        task_id, owner = await result_cache.reserve_inflight_async(cache_key)
+        if not owner:
+            logger.info(f"相同输入的任务 {task_id} 正在处理中，复用该任务")
+            await asyncio.to_thread(note_prefetch_hit, cache_key, 'inflight')
+        else:
+            try:
+                task_id = await submit_task_async(client, params)
+            finally:
+                if not task_id:
+                    await asyncio.to_thread(result_cache.clear_inflight, cache_key)
+            if not task_id:
+                return None, None
+            await asyncio.to_thread(result_cache.set_inflight, cache_key, task_id)
+
+        await asyncio.to_thread(tracker.track, task_id, inputs_hash=cache_key, garment_type=params['garment_type'],
+                                cache_key=cache_key, trace_id=tracing.current_trace_id())
+        return task_id, None
+
+
+async def run_outfit_chain_async(params):
+    """app.run_outfit_chain的协程版本，返回 (task_id, cached, record)"""
+    cache_key = await asyncio.to_thread(tryon_cache_key, params)
+    if cache_key:
+        cached = await asyncio.to_thread(get_result_cache().get, cache_key)
+        if cached:
+            logger.info(f"命中试衣结果缓存: {cache_key}")
+            return cached.get('task_id'), cached, None
+
+    top, bottom = outfit_stages(params)
+    top_task_id, cached, record = await submit_and_wait_async(top)
+    if cached:
+        bottom['person_url'] = cached['image_url']
+    elif record and record['task_status'] == 'SUCCEEDED':
+        bottom['person_url'] = record['image_url']
+    else:
+        return top_task_id, None, record
+
+    task_id = await submit_task_async(get_async_tryon_client(), bottom)
+    if not task_id:
+        return None, None, None
+    logger.info(f"整套搭配的上装任务 {top_task_id} 已完成，已提交下装任务 {task_id}")
+    await asyncio.to_thread(track_outfit_bottom, task_id, params, cache_key, top_task_id)
+    return task_id, None, await get_task_tracker().wait_async(task_id)
+
+
+async def submit_and_wait_async(params):
+    """app.submit_and_wait的协程版本，返回 (task_id, cached, record)"""
+    if is_chained_outfit(params):
+        return await run_outfit_chain_async(params)
+    task_id, cached = await submit_or_reuse_async(params)
+    if cached or not task_id:
+        return task_id, cached, None
+    return task_id, None, await get_task_tracker().wait_async(task_id)
+
+
+async def save_upload_async(file, filename, base_url):
+    """app.save_upload的协程版本：预处理在线程池中执行，上传由存储后端的store_async完成"""
+    upload = await asyncio.to_thread(prepare_upload, file.stream, filename)
+    storage = get_storage()
+    try:
+        try:
+            with tracing.stage('storage_put', backend=storage.name, bytes=upload.size):
+                key = await storage.store_async(upload)
+            url = storage.url(key, base_url=base_url)
+            logger.info(f"文件已保存到{storage.name}存储: {url}")
+            return url, upload.digest
+        except Exception as e:
+            if isinstance(storage, LocalStorage):
+                raise
+            logger.error(f"上传到{storage.name}存储失败，改用本地存储: {e}")
+
+        local_storage = get_local_storage()
+        with tracing.stage('storage_put', backend=local_storage.name, bytes=upload.size):
+            key = await local_storage.store_async(upload)
+        return local_storage.url(key, base_url=base_url), upload.digest
+    finally:
+        upload.cleanup()
+
+
+class RateLimits:
+    """
+    协程接口的限流（与Flask应用中flask_limiter的默认规则和各接口规则相同，按租户计数，计数保存在进程内）
+    """
+
+    def __init__(self, default_limits, route_limits):
+        self.strategy = FixedWindowRateLimiter(MemoryStorage())
+        self.default_limits = [parse(value) for value in default_limits]
+        self.route_limits = {endpoint: [parse(value)] for endpoint, value in route_limits.items()}
+
+    def hit(self, endpoint, client):
+        """记录一次请求，超过任一限制时返回False"""
+        limits = self.route_limits.get(endpoint, self.default_limits)
+        return all(self.strategy.hit(limit, endpoint, client) for limit in limits)
+
+
+def create_asgi_app():
+    """创建处理热点接口的Quart应用（其余接口由TryOnASGIApp转交Flask应用）"""
+    app = Quart(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
+    # 等待任务结束的请求最长约 TASK_MAX_WAIT 秒，状态推送为长连接，不限制响应时间
+    app.config['RESPONSE_TIMEOUT'] = None
+    app.config['BODY_TIMEOUT'] = Config.HTTP_READ_TIMEOUT
+    rate_limits = RateLimits(DEFAULT_RATE_LIMITS, {
+        'direct_tryon': TRYON_RATE_LIMIT,
+        'create_tryon_job': TRYON_RATE_LIMIT
+    })
+
+    @app.before_serving
+    async def start_workers():
+        # 阻塞操作（asyncio.to_thread）和转交Flask的接口共用默认线程池
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(Config.ASGI_THREADS, thread_name_prefix='tryon-asgi'))
+        # 在后台初始化各组件，不阻塞服务启动
+        loop.run_in_executor(None, warm_up)
+
+    @app.after_serving
+    async def stop_workers():
+        await close_async_clients()
+
+    @app.before_request
+    async def before_request():
+        tracing.set_trace_id(tracing.trace_id_from_headers(request.headers))
+        g.started_at = time.perf_counter()
+        tryon_metrics.ASGI_REQUESTS_IN_FLIGHT.inc()
+        tenant = request_tenant(request.headers, request.remote_addr)
+        set_schedule(request_priority(request.headers), tenant)
+        if Config.RATELIMIT_ENABLED and not rate_limits.hit(request.endpoint, tenant):
+            return jsonify({'error': '请求过于频繁，请稍后再试'}), 429
+
+    @app.after_request
+    async def after_request(response):
+        trace_id = tracing.current_trace_id()
+        if trace_id:
+            response.headers['X-Trace-Id'] = trace_id
+        # 与Flask应用的CORS配置一致（预检请求由Flask应用处理）
+        if 'Origin' in request.headers:
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            response.headers['Access-Control-Expose-Headers'] = 'X-Trace-Id'
+        tryon_metrics.ASGI_REQUEST_DURATION.labels(
+            method=request.method, endpoint=request.endpoint, status=response.status_code
+        ).observe(time.perf_counter() - g.started_at)
+        return response
+
+    @app.teardown_request
+    async def teardown_request(exc):
+        if 'started_at' in g:
+            tryon_metrics.ASGI_REQUESTS_IN_FLIGHT.dec()
+
+    @app.route('/api/health')
+    async def health_check():
+        return jsonify({'status': 'ok', 'message': '服务正常运行'})
+
+    @app.route('/api/tryon/upload', methods=['POST'])
+    async def upload_image():
+        """上传图片到服务器或OSS"""
+        try:
+            files = await request.files
+            if 'file' not in files:
+                return jsonify({'error': '没有文件部分'}), 400
+
+            file = files['file']
+            if file.filename == '':
+                return jsonify({'error': '没有选择文件'}), 400
+
+            if file and allowed_file(file.filename):
+                filename = secure_filename(file.filename)
+                image_url, digest = await save_upload_async(file, filename, request.host_url)
+                await asyncio.to_thread(get_result_cache().register_digest, image_url, digest)
+                return jsonify({'url': image_url})
+
+            return jsonify({'error': '不支持的文件类型'}), 400
+        except Exception as e:
+            logger.error(f"上传文件时出错: {e}")
+            return jsonify({'error': '上传文件时发生错误'}), 500
+
+    @app.route('/api/tryon/direct', methods=['POST'])
+    async def direct_tryon():
+        """直接处理试衣请求（等待期间不占用线程）"""
+        try:
+            logger.info("收到试衣请求")
+            data = await request.get_json(silent=True)
+            params, error = await asyncio.to_thread(validate_tryon_params, data)
+            if error:
+                return jsonify(error[0]), error[1]
+
+            task_id, cached, record = await submit_and_wait_async(params)
+            if cached:
+                await asyncio.to_thread(schedule_prefetch, data, params, request.headers)
+                return jsonify(cached_result_payload(task_id, cached, request.host_url))
+            if not task_id:
+                return jsonify({'error': SUBMIT_FAILED_ERROR}), 500
+
+            body, status = finished_task_response(task_id, record, request.host_url)
+            if status == 200:
+                await asyncio.to_thread(schedule_prefetch, data, params, request.headers)
+            return jsonify(body), status
+        except GovernorBusy as e:
+            body, headers = busy_response_parts(e)
+            return jsonify(body), 429, headers
+        except Exception as e:
+            logger.exception("处理试衣请求时发生异常")
+            return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+    @app.route('/api/tryon/jobs', methods=['POST'])
+    async def create_tryon_job():
+        """提交试衣任务后立即返回任务ID，由后台跟踪器轮询结果"""
+        try:
+            logger.info("收到异步试衣请求")
+            params, error = await asyncio.to_thread(validate_tryon_params, await request.get_json(silent=True))
+            if error:
+                return jsonify(error[0]), error[1]
+            if is_chained_outfit(params):
+                return jsonify({'error': OUTFIT_CHAIN_JOBS_ERROR}), 400
+
+            task_id, cached = await submit_or_reuse_async(params)
+            if cached:
+                return jsonify(cached_result_payload(task_id, cached, request.host_url))
+            if not task_id:
+                return jsonify({'error': SUBMIT_FAILED_ERROR}), 500
+            return jsonify(submitted_task_payload(task_id)), 202
+        except GovernorBusy as e:
+            body, headers = busy_response_parts(e)
+            return jsonify(body), 429, headers
+        except Exception as e:
+            logger.exception("提交异步试衣任务时发生异常")
+            return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+    @app.route('/api/tryon/status/<task_id>', methods=['GET'])
+    async def get_tryon_status(task_id):
+        """查询试衣任务状态"""
+        try:
+            status = await get_status_cache().get_async(task_id, lambda: load_task_status_async(task_id))
+            if not status:
+                return jsonify({'error': '查询任务状态失败'}), 500
+
+            payload = status_payload(status, request.host_url)
+            etag, headers = status_response_headers(payload)
+            if request.if_none_match.contains_weak(etag):
+                return '', 304, headers
+            return jsonify(payload), 200, headers
+        except StatusUnavailable as e:
+            return jsonify({'error': STATUS_UNAVAILABLE_ERROR, 'retry_after': e.retry_after}), 503, {'Retry-After': str(e.retry_after)}
+        except Exception as e:
+            logger.exception("查询任务状态时发生异常")
+            return jsonify({'error': '服务器内部错误', 'details': str(e)}), 500
+
+    @app.route('/api/tryon/events/<task_id>', methods=['GET'])
+    async def tryon_events(task_id):
+        """以Server-Sent Events推送任务状态变化，每个连接只是一个等待中的协程"""
+        tracker = get_task_tracker()
+        if await asyncio.to_thread(tracker.get, task_id) is None:
+            return jsonify({'error': TASK_NOT_FOUND_ERROR}), 404
+        base_url = request.host_url
+
+        async def stream():
+            last_status = None
+            yield b"retry: 3000\n\n"
+            while True:
+                record = await tracker.wait_for_change_async(task_id, last_status, Config.SSE_KEEPALIVE_INTERVAL)
+                if record is None:
+                    yield f"event: error\ndata: {json.dumps({'error': TASK_NOT_FOUND_ERROR})}\n\n".encode()
+                    return
+                if record['task_status'] == last_status:
+                    yield b": keep-alive\n\n"
+                    continue
+                last_status = record['task_status']
+                payload = task_status_payload(record, base_url)
+                payload['task_id'] = task_id
+                yield f"event: status\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode()
+                if last_status in TERMINAL_STATES:
+                    return
+
+        response = await make_response(stream(), 200, {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        response.timeout = None
+        return response
+
+    @app.errorhandler(413)
+    async def too_large(e):
+        return jsonify({'error': '文件太大'}), 413
+
+    return app
+
+
+def _nonempty_body(wsgi_app):
+    """hypercorn的WSGI适配器在第一个数据块到来时才发送响应头，响应体为空（如304、CORS预检）时补一个空数据块"""
+    def wrapped(environ, start_response):
+        body = wsgi_app(environ, start_response)
+        try:
+            empty = True
+            for chunk in body:
+                empty = False
+                yield chunk
+            if empty:
+                yield b''
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+    return wrapped
+
+
+class TryOnASGIApp:
+    """
+    ASGI入口：Quart应用中定义的接口由协程处理，其余请求（包括CORS预检）转交Flask应用
+    """
+
+    def __init__(self, asgi_app, wsgi_app):
+        from hypercorn.middleware import AsyncioWSGIMiddleware
+        self.asgi_app = asgi_app
+        self.wsgi_app = AsyncioWSGIMiddleware(_nonempty_body(wsgi_app), max_body_size=Config.MAX_CONTENT_LENGTH)
+        self.routes = asgi_app.url_map.bind('localhost')
+
+    def handles(self, scope):
+        if scope['method'] == 'OPTIONS':
+            return False
+        try:
+            self.routes.match(scope['path'], method=scope['method'])
+            return True
+        except HTTPException:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self.handles(scope):
+            return await self.wsgi_app(scope, receive, send)
+        return await self.asgi_app(scope, receive, send)
+
+
+quart_app = create_asgi_app()
+
+# uvicorn asgi:app
+app = TryOnASGIApp(quart_app, sync_app.app)
@@ -0,0 +1,62 @@
+"""
+同步部署与ASGI部署对比基准测试
+
+分别以单个worker进程启动同步部署（gunicorn gthread，app:app）和ASGI部署（uvicorn，asgi:app），
+用 bench_load.py 以相同的模拟上游（任务排队+运行约数秒）对 direct 接口施加逐级增加的并发，对比:
+  - 吞吐量和延迟：同步部署同时进行的试衣数受线程数限制，超出的请求排队等待线程，延迟随并发线性增长；
+    ASGI部署每个进行中的试衣只是一个等待中的协程，延迟基本保持为任务本身的耗时
+  - 服务端线程数和内存峰值
+
+用法:
+    cd backend
+    python benchmarks/bench_asgi.py --concurrency 32,256,1024 --duration 30 --threads 32
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+BENCH_LOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_load.py')
+
+
+def run_mode(server, args):
+    output = os.path.join(tempfile.mkdtemp(prefix='bench-asgi-'), f'{server}.json')
+    command = [sys.executable, BENCH_LOAD, '--server', server, '--scenarios', args.scenario,
+               '--concurrency', args.concurrency, '--duration', str(args.duration),
+               '--workers', '1', '--threads', str(args.threads),
+               '--queue-time', args.queue_time, '--run-time', args.run_time,
+               '--failure-rate', '0', '--json', output]
+    for item in args.app_env:
+        command.extend(['--app-env', item])
+    print(f"\n=== {server} ===", flush=True)
+    subprocess.run(command, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步部署与ASGI部署对比基准测试')
+    parser.add_argument('--scenario', default='direct', help='压测场景（见bench_load.py）')
+    parser.add_argument('--concurrency', default='32,256,1024', help='并发虚拟用户数，逗号分隔')
+    parser.add_argument('--duration', type=float, default=30, help='每个并发级别的压测时长(秒)')
+    parser.add_argument('--threads', type=int, default=32, help='同步部署每个worker的线程数')
+    parser.add_argument('--queue-time', default='uniform:0.5,1.5', help='模拟任务排队时长分布')
+    parser.add_argument('--run-time', default='lognormal:4,0.2', help='模拟任务运行时长分布')
+    parser.add_argument('--app-env', action='append', default=[], metavar='NAME=VALUE', help='覆盖被测应用的环境变量')
+    args = parser.parse_args()
+
+    results = {server: run_mode(server, args) for server in ('sync', 'asgi')}
+
+    print(f"\n{'并发':>6} {'部署':>5} {'吞吐/s':>8} {'p50(s)':>8} {'p99(s)':>8} {'错误':>6} {'线程峰值':>8} {'内存峰值MB':>10}")
+    for index, sync_result in enumerate(results['sync']):
+        for server in ('sync', 'asgi'):
+            result = results[server][index]
+            print(f"{result['concurrency']:>6} {server:>5} {result['throughput']:>8.1f} {result['p50']:>8.2f} "
+                  f"{result['p99']:>8.2f} {result['errors']:>6} {result['server_peak_threads'] or '-':>8} "
+                  f"{result['server_peak_rss_mb'] or 0:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
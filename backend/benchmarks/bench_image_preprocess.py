@@ -0,0 +1,77 @@
+"""
+上传图片预处理基准测试
+
+对 test-images/ 中的示例图片执行规范化（EXIF方向校正、缩放、去除元数据、重新编码），
+统计每张图片节省的字节数和处理耗时，并测量通过进程池处理时的耗时。
+
+用法:
+    cd backend
+    python benchmarks/bench_image_preprocess.py --rounds 10
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from utils.image_preprocess import normalize_image, get_pool
+
+TEST_IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'test-images')
+TEST_IMAGES = ['person1.png', 'top1.jpg', 'pants1.jpg']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上传图片预处理基准测试')
+    parser.add_argument('--rounds', type=int, default=10, help='每张图片的处理次数')
+    parser.add_argument('--max-side', type=int, default=Config.IMAGE_MAX_SIDE, help='最长边像素上限')
+    parser.add_argument('--quality', type=int, default=Config.IMAGE_QUALITY, help='编码质量')
+    parser.add_argument('--format', default=Config.IMAGE_OUTPUT_FORMAT, help='输出格式 (JPEG/PNG/WEBP)')
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp(prefix='bench-preprocess-')
+    total_original = 0
+    total_output = 0
+
+    print(f"最长边: {args.max_side}，质量: {args.quality}，格式: {args.format}")
+    for name in TEST_IMAGES:
+        src_path = os.path.join(TEST_IMAGES_DIR, name)
+        dst_path = os.path.join(output_dir, f"{name}.out")
+        timings = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            info = normalize_image(src_path, dst_path, args.max_side, args.quality, args.format)
+            timings.append(time.perf_counter() - started)
+
+        timings.sort()
+        output_bytes = info['output_bytes'] if info['use_output'] else info['original_bytes']
+        total_original += info['original_bytes']
+        total_output += output_bytes
+        saved = info['original_bytes'] - output_bytes
+        print(f"{name}: {info['original_dimensions']} -> {info['output_dimensions']}, "
+              f"{info['original_bytes']} -> {info['output_bytes']} 字节 "
+              f"({'采用输出' if info['use_output'] else '保留原图'}，节省 {saved} 字节 / {saved * 100 / info['original_bytes']:.1f}%)，"
+              f"耗时 p50={timings[len(timings) // 2] * 1000:.1f}ms max={timings[-1] * 1000:.1f}ms")
+
+    saved = total_original - total_output
+    print(f"合计: {total_original} -> {total_output} 字节，节省 {saved} 字节 ({saved * 100 / total_original:.1f}%)")
+
+    # 进程池：首次调用包含启动子进程的开销
+    pool = get_pool()
+    for label in ('进程池首次调用', '进程池热调用'):
+        started = time.perf_counter()
+        futures = [
+            pool.submit(normalize_image, os.path.join(TEST_IMAGES_DIR, name), os.path.join(output_dir, f"{name}.pool"),
+                        args.max_side, args.quality, args.format)
+            for name in TEST_IMAGES
+        ]
+        for future in futures:
+            future.result()
+        print(f"{label}: {len(TEST_IMAGES)} 张图片共 {(time.perf_counter() - started) * 1000:.1f}ms")
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
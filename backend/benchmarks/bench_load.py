@@ -0,0 +1,497 @@
+"""
+试衣服务负载测试
+
+启动本地DashScope / OSS模拟服务（benchmarks/mock_upstream.py）和被测应用（--server sync：安装了gunicorn时使用
+gunicorn.conf.py，否则使用Flask自带的多线程服务器；--server asgi：uvicorn asgi:app），用asyncio驱动固定数量的并发虚拟用户
+（每个用户一条keep-alive连接，收到响应后立即发出下一个请求）依次压测各接口，报告:
+  - 吞吐量（请求/秒）、p50/p95/p99/最大延迟、非2xx响应数
+  - 平均在途请求数（利特尔法则：吞吐量 x 平均延迟）及其占worker并发容量（workers x threads）的比例
+  - 被测服务进程树的CPU占用、线程数和内存峰值（读取/proc，仅Linux）
+  - 模拟上游收到的提交/查询/限流/OSS请求数
+
+场景:
+  upload  POST /api/tryon/upload（上传图片，经预处理后写入模拟OSS）
+  direct  POST /api/tryon/direct（提交并等待结果，每个请求占用一个worker线程直到任务结束）
+  status  GET  /api/tryon/status/<task_id>（先通过 /api/tryon/jobs 提交一批任务）
+
+默认关闭接口限流和结果缓存（每个请求都走完整链路），并放宽上游配额调节器，测量的是本服务自身的容量；
+可以用 --app-env 覆盖任意应用配置，如 --app-env GOVERNOR_SUBMIT_QPS=2 模拟真实配额。
+
+用法:
+    cd backend
+    python benchmarks/bench_load.py --scenarios upload,direct,status --concurrency 16 --duration 20
+    python benchmarks/bench_load.py --target http://127.0.0.1:5000 --scenarios status   # 压测已运行的服务
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_IMAGE = os.path.join(os.path.dirname(BACKEND_DIR), 'test-images', 'person1.png')
+MOCK_BUCKET = 'mock-bucket'
+
+
+class HTTPConnection:
+    """最小的asyncio HTTP/1.1客户端连接（keep-alive，支持Content-Length和chunked响应）"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """发送请求，返回 (状态码, 响应体)；连接被服务端关闭时自动重连一次"""
+        for attempt in range(2):
+            if self.writer is None:
+                await self._connect()
+            try:
+                return await self._request(method, path, body, headers or {})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+
+    async def _request(self, method, path, body, headers):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            data = b''.join(chunks)
+        else:
+            data = await self.reader.read()
+            self.close()
+            return status, data
+
+        if response_headers.get('connection', '').lower() == 'close' or status_line.startswith(b'HTTP/1.0'):
+            self.close()
+        return status, data
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(int(len(values) * pct / 100 + 0.5) - 1, 0))
+    return values[index]
+
+
+class ProcessTreeStats:
+    """
+    统计某个进程及其所有子进程的资源占用（读取/proc，非Linux系统返回None）：
+    累计CPU时间、线程数和常驻内存
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def _stats(self):
+        stats = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            # 字段（从state开始计数）：ppid为第2个，utime/stime为第12、13个，线程数为第18个，RSS（页数）为第22个
+            stats[int(entry)] = (int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[17]), int(fields[21]))
+        return stats
+
+    def sample(self):
+        """返回 {'cpu_seconds', 'threads', 'rss_mb'}"""
+        if not os.path.isdir('/proc'):
+            return None
+        stats = self._stats()
+        tree = {self.pid}
+        changed = True
+        while changed:
+            changed = False
+            for pid, (ppid, *_) in stats.items():
+                if ppid in tree and pid not in tree:
+                    tree.add(pid)
+                    changed = True
+        members = [stats[pid] for pid in tree if pid in stats]
+        return {
+            'cpu_seconds': sum(item[1] for item in members) / self.ticks,
+            'threads': sum(item[2] for item in members),
+            'rss_mb': sum(item[3] for item in members) * self.page_size / 1024 / 1024
+        }
+
+    async def watch(self, peak, interval=0.5):
+        """定期采样，把线程数和常驻内存的峰值记录到peak中（直到被取消）"""
+        while True:
+            current = self.sample()
+            if current:
+                peak['threads'] = max(peak.get('threads', 0), current['threads'])
+                peak['rss_mb'] = max(peak.get('rss_mb', 0), current['rss_mb'])
+            await asyncio.sleep(interval)
+
+
+def build_multipart(field, filename, content, content_type='image/jpeg'):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def make_upload_images(count, width, height):
+    """
+    生成count张内容不同的JPEG图片（按内容寻址存储，相同内容不会重复写入OSS）；
+    未安装Pillow时使用仓库中的测试图片
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        with open(TEST_IMAGE, 'rb') as f:
+            return [f.read()]
+    import io
+    images = []
+    for index in range(count):
+        image = Image.effect_noise((width, height), 40 + index % 50).convert('RGB')
+        image.paste((random.randrange(256), random.randrange(256), random.randrange(256)),
+                    (width // 4, height // 4, width * 3 // 4, height * 3 // 4))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+class LoadTest:
+    def __init__(self, args, target, public_object_url):
+        parts = urlsplit(target)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.args = args
+        self.public_object_url = public_object_url
+        self.upload_images = []
+        self.task_ids = []
+
+    def tryon_body(self):
+        # 每个请求使用不同的服务图片地址，避免命中进行中任务的复用
+        return json.dumps({
+            'person_image_url': f"{self.public_object_url}/uploads/bench-person.jpg",
+            'garment_image_url': f"{self.public_object_url}/uploads/bench-garment-{uuid.uuid4().hex}.jpg",
+            'garment_type': 'top'
+        }).encode()
+
+    async def call(self, connection, scenario):
+        if scenario == 'upload':
+            body, content_type = build_multipart('file', 'photo.jpg', random.choice(self.upload_images))
+            return await connection.request('POST', '/api/tryon/upload', body, {'Content-Type': content_type})
+        if scenario == 'direct':
+            return await connection.request('POST', '/api/tryon/direct', self.tryon_body(),
+                                            {'Content-Type': 'application/json'})
+        if scenario == 'status':
+            return await connection.request('GET', f"/api/tryon/status/{random.choice(self.task_ids)}")
+        raise ValueError(f"未知场景: {scenario}")
+
+    async def prepare(self, scenario):
+        if scenario == 'upload' and not self.upload_images:
+            self.upload_images = make_upload_images(self.args.upload_variants, *self.args.upload_size)
+        if scenario == 'status' and not self.task_ids:
+            connection = HTTPConnection(self.host, self.port)
+            for _ in range(self.args.status_tasks):
+                status, data = await connection.request('POST', '/api/tryon/jobs', self.tryon_body(),
+                                                        {'Content-Type': 'application/json'})
+                if status in (200, 202):
+                    self.task_ids.append(json.loads(data)['task_id'])
+            connection.close()
+            if not self.task_ids:
+                raise RuntimeError('无法通过 /api/tryon/jobs 提交任务，status场景无法进行')
+
+    async def run(self, scenario, concurrency, duration):
+        await self.prepare(scenario)
+        latencies = []
+        statuses = {}
+        deadline = time.perf_counter() + duration
+
+        async def user():
+            connection = HTTPConnection(self.host, self.port)
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _ = await self.call(connection, scenario)
+                except Exception as e:
+                    status = type(e).__name__
+                    connection.close()
+                    await asyncio.sleep(0.1)
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+            connection.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        throughput = len(latencies) / elapsed
+        mean_latency = sum(latencies) / len(latencies) if latencies else 0
+        return {
+            'scenario': scenario,
+            'concurrency': concurrency,
+            'elapsed': elapsed,
+            'requests': len(latencies),
+            'statuses': {str(key): value for key, value in sorted(statuses.items(), key=lambda item: str(item[0]))},
+            'errors': sum(value for key, value in statuses.items() if not (isinstance(key, int) and key < 400)),
+            'throughput': throughput,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else 0,
+            # 利特尔法则：平均在途请求数 = 吞吐量 x 平均延迟
+            'in_flight': throughput * mean_latency
+        }
+
+
+def wait_until_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            time.sleep(0.3)
+    raise RuntimeError(f"等待 {url} 就绪超时")
+
+
+def fetch_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read())
+    except Exception:
+        return {}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(args):
+    port = free_port()
+    command = [sys.executable, os.path.join(BACKEND_DIR, 'benchmarks', 'mock_upstream.py'),
+               '--host', '0.0.0.0', '--port', str(port),
+               '--submit-latency', args.submit_latency, '--query-latency', args.query_latency,
+               '--oss-latency', args.oss_latency, '--queue-time', args.queue_time, '--run-time', args.run_time,
+               '--failure-rate', str(args.failure_rate), '--throttle-rate', str(args.throttle_rate),
+               '--error-rate', str(args.error_rate)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    wait_until_ready(f"http://127.0.0.1:{port}/_stats")
+    return process, port
+
+
+def start_app(args, mock_port, public_host):
+    """启动被测应用，返回 (进程, 地址, worker并发容量, 服务说明)"""
+    port = free_port()
+    work_dir = tempfile.mkdtemp(prefix='bench-load-')
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': BACKEND_DIR,
+        'DASHSCOPE_API_KEY': 'mock-key',
+        'DASHSCOPE_BASE_URL': f"http://127.0.0.1:{mock_port}",
+        'STORAGE_BACKEND': 'oss',
+        'OSS_ACCESS_KEY_ID': 'mock',
+        'OSS_ACCESS_KEY_SECRET': 'mock',
+        'OSS_ENDPOINT': f"http://127.0.0.1:{mock_port}",
+        'OSS_BUCKET_NAME': MOCK_BUCKET,
+        # 提交给DashScope的图片地址必须是公网可访问的形式（不能是localhost/127.0.0.1）
+        'OSS_PUBLIC_URL': f"http://{public_host}:{mock_port}/{MOCK_BUCKET}",
+        'RATELIMIT_ENABLED': 'False',
+        # 模拟上游的主机名解析到内网地址，允许计算缓存键时下载其中的图片
+        'IMAGE_FETCH_ALLOWED_HOSTS': public_host,
+        'RESULT_CACHE_BACKEND': 'none',
+        'GOVERNOR_BACKEND': 'local',
+        'GOVERNOR_SUBMIT_QPS': '10000',
+        'GOVERNOR_QUERY_QPS': '10000',
+        'GOVERNOR_MAX_INFLIGHT': '100000',
+        'TASK_POLL_MAX_QPS': '1000',
+        'TASK_POLL_CONCURRENCY': '64',
+        'TASK_STORE_PATH': os.path.join(work_dir, 'tasks.db'),
+        'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads'),
+        'RESULT_IMAGE_CACHE_DIR': os.path.join(work_dir, 'result-images'),
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FILE': os.path.join(work_dir, 'app.log'),
+        'GUNICORN_BIND': f"127.0.0.1:{port}",
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        # 虚拟用户使用长连接，连接数上限需覆盖最高并发级别
+        'GUNICORN_WORKER_CONNECTIONS': str(max(args.concurrency) + 100)
+    })
+    for item in args.app_env:
+        name, _, value = item.partition('=')
+        env[name] = value
+
+    if args.server == 'asgi':
+        # 协程处理请求，并发不受线程数限制
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(args.workers), '--log-level', 'warning', '--backlog', '8192']
+        capacity = None
+        server = f"uvicorn {args.workers} workers（ASGI）"
+    else:
+        try:
+            import gunicorn  # noqa: F401
+            command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--backlog', '8192', 'app:app']
+            capacity = args.workers * args.threads
+            server = f"gunicorn {args.workers} workers x {args.threads} threads"
+        except ImportError:
+            command = [sys.executable, '-c',
+                       f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+            capacity = None
+            server = "Flask多线程服务器（未安装gunicorn，每个请求一个线程，无并发上限）"
+
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{url}/api/ready")
+    return process, url, capacity, server
+
+
+def format_result(result, capacity, cpu_seconds, peak=None):
+    line = (f"{result['scenario']:>7} c={result['concurrency']:<4} 请求 {result['requests']:>6}  "
+            f"吞吐 {result['throughput']:8.1f}/s  p50 {result['p50'] * 1000:8.1f}ms  p95 {result['p95'] * 1000:8.1f}ms  "
+            f"p99 {result['p99'] * 1000:8.1f}ms  max {result['max'] * 1000:8.1f}ms  错误 {result['errors']}")
+    saturation = f"在途请求 {result['in_flight']:.1f}"
+    if capacity:
+        saturation += f"（worker并发容量的 {result['in_flight'] / capacity:.0%}）"
+    if cpu_seconds is not None:
+        saturation += f"，服务端CPU {cpu_seconds / result['elapsed']:.2f} 核"
+    if peak:
+        saturation += f"，线程数峰值 {peak['threads']}，内存峰值 {peak['rss_mb']:.0f}MB"
+    return f"{line}\n{'':>9}{saturation}，状态码 {result['statuses']}"
+
+
+async def run_all(args, load_test, scenarios, capacity, server_stats, mock_url):
+    results = []
+    for scenario in scenarios:
+        for concurrency in args.concurrency:
+            upstream_before = fetch_json(f"{mock_url}/_stats") if mock_url else {}
+            before = server_stats.sample() if server_stats else None
+            peak = {}
+            watcher = asyncio.ensure_future(server_stats.watch(peak)) if before else None
+            result = await load_test.run(scenario, concurrency, args.duration)
+            if watcher:
+                watcher.cancel()
+            after = server_stats.sample() if before else None
+            cpu_seconds = after['cpu_seconds'] - before['cpu_seconds'] if after else None
+            upstream_after = fetch_json(f"{mock_url}/_stats") if mock_url else {}
+            result['server_cpu_cores'] = cpu_seconds / result['elapsed'] if cpu_seconds is not None else None
+            result['server_peak_threads'] = peak.get('threads')
+            result['server_peak_rss_mb'] = peak.get('rss_mb')
+            result['upstream'] = {key: value - upstream_before.get(key, 0) for key, value in upstream_after.items()}
+            results.append(result)
+            print(format_result(result, capacity, cpu_seconds, peak or None))
+            if result['upstream']:
+                print(f"{'':>9}模拟上游: {result['upstream']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='试衣服务负载测试')
+    parser.add_argument('--scenarios', default='upload,direct,status', help='要压测的场景，逗号分隔')
+    parser.add_argument('--concurrency', default='16', help='并发虚拟用户数，可以是逗号分隔的多个值')
+    parser.add_argument('--duration', type=float, default=20, help='每个场景每个并发级别的压测时长(秒)')
+    parser.add_argument('--target', help='压测已运行的服务（此时不启动模拟服务和应用，direct/status需要服务已连接上游）')
+    parser.add_argument('--server', choices=['sync', 'asgi'], default='sync',
+                        help='被测应用的部署方式：sync为gunicorn gthread（app:app），asgi为uvicorn（asgi:app）')
+    parser.add_argument('--workers', type=int, default=2, help='worker进程数')
+    parser.add_argument('--threads', type=int, default=32, help='每个gunicorn worker的线程数')
+    parser.add_argument('--app-env', action='append', default=[], metavar='NAME=VALUE', help='覆盖被测应用的环境变量')
+    parser.add_argument('--upload-variants', type=int, default=64, help='上传场景使用的不同图片数量')
+    parser.add_argument('--upload-size', type=int, nargs=2, default=(1280, 1706), metavar=('W', 'H'),
+                        help='上传图片的尺寸')
+    parser.add_argument('--status-tasks', type=int, default=50, help='status场景预先提交的任务数')
+    parser.add_argument('--submit-latency', default='lognormal:0.15,0.3', help='模拟提交接口延迟分布')
+    parser.add_argument('--query-latency', default='lognormal:0.05,0.3', help='模拟查询接口延迟分布')
+    parser.add_argument('--oss-latency', default='lognormal:0.02,0.5', help='模拟OSS接口延迟分布')
+    parser.add_argument('--queue-time', default='uniform:0.5,2', help='模拟任务排队时长分布')
+    parser.add_argument('--run-time', default='lognormal:6,0.3', help='模拟任务运行时长分布')
+    parser.add_argument('--failure-rate', type=float, default=0.02, help='模拟任务失败比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='模拟上游429比例')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟上游500比例')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    args = parser.parse_args()
+    args.concurrency = [int(value) for value in args.concurrency.split(',')]
+    scenarios = [value.strip() for value in args.scenarios.split(',') if value.strip()]
+
+    processes = []
+    try:
+        if args.target:
+            target, capacity, server_stats, mock_url = args.target.rstrip('/'), None, None, None
+            public_object_url = f"http://{socket.gethostname()}/{MOCK_BUCKET}"
+            print(f"压测已运行的服务: {target}")
+        else:
+            # 提交给DashScope的图片地址不能是localhost，使用本机主机名访问模拟OSS
+            public_host = socket.gethostname()
+            mock_process, mock_port = start_mock(args)
+            processes.append(mock_process)
+            app_process, target, capacity, server = start_app(args, mock_port, public_host)
+            processes.append(app_process)
+            server_stats = ProcessTreeStats(app_process.pid)
+            mock_url = f"http://127.0.0.1:{mock_port}"
+            public_object_url = f"http://{public_host}:{mock_port}/{MOCK_BUCKET}"
+            print(f"被测服务: {target}（{server}），模拟上游: {mock_url}")
+            print(f"模拟任务: 排队 {args.queue_time}，运行 {args.run_time}，失败率 {args.failure_rate}，"
+                  f"429比例 {args.throttle_rate}，500比例 {args.error_rate}")
+
+        load_test = LoadTest(args, target, public_object_url)
+        results = asyncio.run(run_all(args, load_test, scenarios, capacity, server_stats, mock_url))
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+请求热路径日志开销基准测试
+
+模拟一次试衣请求产生的日志（提交一次 + 轮询若干次），分别在独立子进程中测量:
+  - legacy: 原来的方式（全局DEBUG、f-string + json.dumps(indent=2)、记录请求头，同步写stdout和app.log）
+  - async:  utils.logging_setup（INFO、延迟格式化、轮询日志按任务采样、队列 + 后台线程写JSON日志）
+统计请求线程中花在日志上的时间（每个请求的平均值和p99），以及写完全部日志所需的总时间。
+stdout重定向到/dev/null，日志文件写在临时目录中。
+
+用法:
+    cd backend
+    python benchmarks/bench_logging.py --requests 2000 --polls 6 --threads 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+API_KEY = 'sk-benchmark0123456789abcdef'
+
+
+def make_messages(index):
+    """构造与真实请求相近的请求体和响应"""
+    task_id = f"{index:08x}-6f1b-4c52-9a3e-bench{index:06d}"
+    payload = {
+        'model': 'aitryon-plus',
+        'input': {
+            'person_image_url': f'https://bucket.oss-cn-beijing.aliyuncs.com/uploads/{index:064x}.jpg',
+            'top_garment_url': f'https://bucket.oss-cn-beijing.aliyuncs.com/uploads/{index + 1:064x}.jpg'
+        },
+        'parameters': {'resolution': -1, 'restore_face': True}
+    }
+    submit_result = {'output': {'task_id': task_id, 'task_status': 'PENDING'}, 'request_id': f'req-{index}'}
+    poll_result = {
+        'output': {
+            'task_id': task_id, 'task_status': 'RUNNING',
+            'submit_time': '2024-05-20 16:08:02.123', 'scheduled_time': '2024-05-20 16:08:02.456'
+        },
+        'request_id': f'req-{index}-poll'
+    }
+    return task_id, payload, submit_result, poll_result
+
+
+def legacy_request(logger, index, polls):
+    task_id, payload, submit_result, poll_result = make_messages(index)
+    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {API_KEY}', 'X-DashScope-Async': 'enable'}
+    logger.info(f"提交试衣任务: {payload['input']['person_image_url']} + {payload['input']['top_garment_url']} (top)")
+    logger.info(f"请求头: {headers}")
+    logger.info(f"请求体: {json.dumps(payload, indent=2)}")
+    logger.info(f"阿里云响应: {json.dumps(submit_result, indent=2)}")
+    logger.info(f"任务提交成功，任务ID: {task_id}")
+    for _ in range(polls):
+        logger.info(f"查询任务状态: {task_id}")
+        logger.info(f"任务状态响应: {json.dumps(poll_result, indent=2)}")
+
+
+def async_request(logger, index, polls):
+    task_id, payload, submit_result, poll_result = make_messages(index)
+    logger.info("提交试衣任务: %s + %s (%s)", payload['input']['person_image_url'], payload['input']['top_garment_url'], 'top')
+    logger.debug("请求体: %s", payload)
+    logger.debug("阿里云响应: %s", submit_result)
+    logger.info("任务提交成功，任务ID: %s，request_id: %s", task_id, submit_result['request_id'])
+    for _ in range(polls):
+        logger.info("查询任务状态: %s -> %s", task_id, poll_result['output']['task_status'],
+                    extra={'task_id': task_id, 'sample_key': task_id})
+        logger.debug("任务状态响应: %s", poll_result, extra={'task_id': task_id, 'sample_key': task_id})
+
+
+def run_child(mode, requests_count, polls, threads, log_dir):
+    """子进程：配置日志并在多个线程中模拟请求"""
+    import logging
+    sys.path.insert(0, BACKEND_DIR)
+    log_file = os.path.join(log_dir, f'{mode}.log')
+
+    if mode == 'legacy':
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=[logging.StreamHandler(sys.stdout), logging.FileHandler(log_file)]
+        )
+        simulate = legacy_request
+    else:
+        os.environ.update({'LOG_FILE': log_file, 'LOG_FORMAT': 'json', 'LOG_LEVEL': 'INFO', 'LOG_ASYNC': 'True',
+                           'LOG_QUEUE_SIZE': str(requests_count * (polls + 5) + 1000)})
+        from utils.logging_setup import configure_logging, flush_logging
+        configure_logging()
+        simulate = async_request
+
+    logger = logging.getLogger('app')
+    durations = []
+    lock = threading.Lock()
+
+    def worker(indexes):
+        local = []
+        for index in indexes:
+            started = time.perf_counter()
+            simulate(logger, index, polls)
+            local.append(time.perf_counter() - started)
+        with lock:
+            durations.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(range(t, requests_count, threads),)) for t in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    produced = time.perf_counter() - started
+    if mode != 'legacy':
+        flush_logging()
+    drained = time.perf_counter() - started
+
+    durations.sort()
+    with open(log_file, encoding='utf-8') as f:
+        content = f.read()
+    return {
+        'mean_us': sum(durations) / len(durations) * 1e6,
+        'p99_us': durations[int(len(durations) * 0.99) - 1] * 1e6,
+        'produced_s': produced,
+        'drained_s': drained,
+        'log_bytes': len(content.encode()),
+        'leaked_key': API_KEY in content
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='请求热路径日志开销基准测试')
+    parser.add_argument('--requests', type=int, default=2000, help='模拟请求数')
+    parser.add_argument('--polls', type=int, default=6, help='每个请求的轮询次数')
+    parser.add_argument('--threads', type=int, default=8, help='并发线程数（模拟gthread worker）')
+    parser.add_argument('--child', choices=['legacy', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--log-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(args.child, args.requests, args.polls, args.threads, args.log_dir)
+        sys.stderr.write(json.dumps(result) + "\n")
+        return
+
+    log_dir = tempfile.mkdtemp(prefix='bench-logging-')
+    print(f"{args.requests} 个请求，每个请求轮询 {args.polls} 次，{args.threads} 个线程")
+    results = {}
+    for mode in ('legacy', 'async'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', mode, '--log-dir', log_dir,
+             '--requests', str(args.requests), '--polls', str(args.polls), '--threads', str(args.threads)],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=600
+        )
+        if output.returncode != 0:
+            raise RuntimeError(output.stderr.strip())
+        result = json.loads(output.stderr.strip().splitlines()[-1])
+        results[mode] = result
+        print(f"{mode:>6}: 请求线程日志开销 平均 {result['mean_us']:.1f}us / p99 {result['p99_us']:.1f}us，"
+              f"请求完成 {result['produced_s']:.3f}s，日志写完 {result['drained_s']:.3f}s，"
+              f"日志文件 {result['log_bytes'] / 1024:.0f}KB，API密钥泄露: {'是' if result['leaked_key'] else '否'}")
+
+    print(f"请求线程日志开销降低 {results['legacy']['mean_us'] / results['async']['mean_us']:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+整套搭配（上装+下装）端到端延迟基准测试
+
+用本地模拟上游（benchmarks/mock_upstream.py）对比三种完成一套搭配的方式：
+  two-call  基线：浏览器先调用一次 direct 试穿上装，拿到结果后再以结果图为人物图调用一次 direct 试穿下装
+  single    一次 direct 请求同时提交上装和下装（TRYON_OUTFIT_MODE=single，一个上游任务）
+  chain     一次 direct 请求，由服务端先试穿上装、上装结果一出现立即提交下装（TRYON_OUTFIT_MODE=chain）
+
+每种方式由固定数量的并发虚拟用户各完成若干套搭配，报告每套搭配的p50/p95/平均延迟、失败数和每套搭配的上游提交次数。
+模拟上游中同时包含上装和下装的任务运行时长乘以 --outfit-run-factor（真实服务一次生成两件服装通常比一件慢）。
+
+用法:
+    cd backend
+    python benchmarks/bench_outfit.py --concurrency 8 --outfits 5 --run-time lognormal:6,0.3 --outfit-run-factor 1.3
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import subprocess
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_load import BACKEND_DIR, MOCK_BUCKET, HTTPConnection, fetch_json, free_port, percentile, start_app, wait_until_ready
+
+MODES = ('two-call', 'single', 'chain')
+
+
+def start_mock(args, public_host):
+    port = free_port()
+    command = [sys.executable, os.path.join(BACKEND_DIR, 'benchmarks', 'mock_upstream.py'),
+               '--host', '0.0.0.0', '--port', str(port), '--public-host', f"{public_host}:{port}",
+               '--submit-latency', args.submit_latency, '--query-latency', args.query_latency,
+               '--queue-time', args.queue_time, '--run-time', args.run_time,
+               '--outfit-run-factor', str(args.outfit_run_factor)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    wait_until_ready(f"http://127.0.0.1:{port}/_stats")
+    return process, port
+
+
+async def direct(connection, person_url, garment_url, garment_type='top', bottom_garment_url=None):
+    """调用一次 direct 接口，成功时返回结果信息，否则返回None"""
+    body = {'person_image_url': person_url, 'garment_image_url': garment_url, 'garment_type': garment_type}
+    if bottom_garment_url:
+        body['bottom_garment_image_url'] = bottom_garment_url
+    status, data = await connection.request('POST', '/api/tryon/direct', json.dumps(body).encode(),
+                                            {'Content-Type': 'application/json'})
+    if status != 200:
+        return None
+    result = json.loads(data)
+    return result if result.get('status') == 'success' else None
+
+
+async def outfit(connection, mode, object_url):
+    # 每套搭配使用不同的服装地址，避免命中进行中任务的复用
+    person_url = f"{object_url}/uploads/bench-person.jpg"
+    top_url = f"{object_url}/uploads/bench-top-{uuid.uuid4().hex}.jpg"
+    bottom_url = f"{object_url}/uploads/bench-bottom-{uuid.uuid4().hex}.jpg"
+    if mode != 'two-call':
+        return await direct(connection, person_url, top_url, bottom_garment_url=bottom_url) is not None
+
+    top = await direct(connection, person_url, top_url)
+    if top is None:
+        return False
+    # 浏览器拿到上装结果后再发起第二次请求（代理地址指向本服务，提交给上游的是DashScope的结果地址）
+    result_url = top.get('source_image_url') or top['image_url']
+    return await direct(connection, result_url, bottom_url, 'bottom') is not None
+
+
+async def run_mode(mode, target, object_url, concurrency, outfits):
+    parts = urlsplit(target)
+    latencies = []
+    failures = 0
+
+    async def user():
+        nonlocal failures
+        connection = HTTPConnection(parts.hostname, parts.port)
+        for _ in range(outfits):
+            started = time.perf_counter()
+            try:
+                ok = await outfit(connection, mode, object_url)
+            except Exception:
+                ok = False
+                connection.close()
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures += 1
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'mode': mode,
+        'outfits': len(latencies) + failures,
+        'failures': failures,
+        'elapsed': elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'mean': sum(latencies) / len(latencies) if latencies else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='整套搭配端到端延迟基准测试')
+    parser.add_argument('--modes', default=','.join(MODES), help='要测试的方式，逗号分隔')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发虚拟用户数')
+    parser.add_argument('--outfits', type=int, default=5, help='每个虚拟用户完成的搭配数')
+    parser.add_argument('--server', choices=['sync', 'asgi'], default='sync', help='被测应用的部署方式')
+    parser.add_argument('--workers', type=int, default=1, help='worker进程数')
+    parser.add_argument('--threads', type=int, default=64, help='每个gunicorn worker的线程数')
+    parser.add_argument('--submit-latency', default='lognormal:0.15,0.3', help='模拟提交接口延迟分布')
+    parser.add_argument('--query-latency', default='lognormal:0.05,0.3', help='模拟查询接口延迟分布')
+    parser.add_argument('--queue-time', default='uniform:0.5,2', help='模拟任务排队时长分布')
+    parser.add_argument('--run-time', default='lognormal:6,0.3', help='模拟任务运行时长分布')
+    parser.add_argument('--outfit-run-factor', type=float, default=1.3, help='同时包含上装和下装的任务的运行时长倍数')
+    parser.add_argument('--app-env', action='append', default=[], metavar='NAME=VALUE', help='覆盖被测应用的环境变量')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    args = parser.parse_args()
+    modes = [value.strip() for value in args.modes.split(',') if value.strip()]
+
+    public_host = socket.gethostname()
+    processes = []
+    results = []
+    try:
+        mock_process, mock_port = start_mock(args, public_host)
+        processes.append(mock_process)
+        mock_url = f"http://127.0.0.1:{mock_port}"
+        object_url = f"http://{public_host}:{mock_port}/{MOCK_BUCKET}"
+        print(f"模拟任务: 排队 {args.queue_time}，运行 {args.run_time}，整套搭配运行时长 x{args.outfit_run_factor}")
+
+        for mode in modes:
+            app_args = argparse.Namespace(**vars(args))
+            app_args.concurrency = [args.concurrency]
+            app_args.app_env = [f"TRYON_OUTFIT_MODE={'chain' if mode == 'chain' else 'single'}"] + args.app_env
+            app_process, target, _, server = start_app(app_args, mock_port, public_host)
+            try:
+                before = fetch_json(f"{mock_url}/_stats")
+                result = asyncio.run(run_mode(mode, target, object_url, args.concurrency, args.outfits))
+                after = fetch_json(f"{mock_url}/_stats")
+            finally:
+                app_process.terminate()
+                app_process.wait(timeout=10)
+            completed = result['outfits'] or 1
+            result['submits_per_outfit'] = (after.get('submits', 0) - before.get('submits', 0)) / completed
+            results.append(result)
+            print(f"{mode:>9}  搭配 {result['outfits']:>4}  失败 {result['failures']:>3}  p50 {result['p50']:6.2f}s  "
+                  f"p95 {result['p95']:6.2f}s  平均 {result['mean']:6.2f}s  每套提交 {result['submits_per_outfit']:.1f} 次"
+                  f"（{server}）", flush=True)
+
+        baseline = next((result for result in results if result['mode'] == 'two-call'), None)
+        if baseline and baseline['p50']:
+            for result in results:
+                if result is not baseline:
+                    print(f"{result['mode']:>9}  p50 为两次调用基线的 {result['p50'] / baseline['p50']:.0%}")
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+应用启动耗时基准测试
+
+在全新的子进程中导入 app 模块并通过测试客户端发出首个请求，分别统计导入耗时和首个请求耗时，
+超过目标值时以非零状态码退出（可用于CI）。默认把OSS指向一个不可达的地址，
+验证导入阶段不会因为探测OSS而卡住。
+
+用法:
+    cd backend
+    python benchmarks/bench_startup.py --rounds 5 --target 3.0
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行：导入应用并发出首个请求
+CHILD_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(PATH)
+finished = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first_request': finished - imported, 'status': response.status_code}))
+"""
+
+
+def run_once(path, env):
+    output = subprocess.run(
+        [sys.executable, '-c', f"PATH = {path!r}\n{CHILD_SCRIPT}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1] if output.stderr else '子进程异常退出')
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用启动耗时基准测试')
+    parser.add_argument('--rounds', type=int, default=5, help='启动次数')
+    parser.add_argument('--target', type=float, default=3.0, help='导入+首个请求的目标耗时上限(秒)')
+    parser.add_argument('--path', default='/api/health', help='首个请求的路径')
+    parser.add_argument('--oss-endpoint', default='http://10.255.255.1',
+                        help='OSS地址（默认为不可达地址；传空字符串表示不配置OSS）')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = BACKEND_DIR
+    # 避免写入项目目录
+    env.setdefault('TASK_STORE_PATH', os.path.join(tempfile.mkdtemp(prefix='bench-startup-'), 'tasks.db'))
+    if args.oss_endpoint:
+        env.update({
+            'OSS_ACCESS_KEY_ID': 'bench',
+            'OSS_ACCESS_KEY_SECRET': 'bench',
+            'OSS_ENDPOINT': args.oss_endpoint,
+            'OSS_BUCKET_NAME': 'bench'
+        })
+
+    totals = []
+    print(f"首个请求: {args.path}，OSS: {args.oss_endpoint or '未配置'}，目标: {args.target:.2f}s")
+    for round_index in range(args.rounds):
+        result = run_once(args.path, env)
+        total = result['import'] + result['first_request']
+        totals.append(total)
+        print(f"第 {round_index + 1} 次: 导入 {result['import']:.3f}s，首个请求 {result['first_request']:.3f}s "
+              f"(HTTP {result['status']})，合计 {total:.3f}s")
+
+    totals.sort()
+    print(f"合计耗时: 中位数 {totals[len(totals) // 2]:.3f}s，最大 {totals[-1]:.3f}s")
+    if totals[-1] > args.target:
+        print(f"超过目标耗时 {args.target:.2f}s")
+        sys.exit(1)
+    print("满足目标耗时")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+共享轮询调度器基准测试
+
+在本地启动一个模拟DashScope服务，提交N个模拟任务（每个任务随机运行若干秒），
+由单个TaskPoller统一轮询，统计上游请求次数和完成延迟分位数，
+并与"每个任务独立按固定间隔轮询"的旧方式估算值对比。
+
+用法:
+    cd backend
+    python benchmarks/bench_task_poller.py --tasks 1000
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class MockDashScope(BaseHTTPRequestHandler):
+    """只实现提交和查询两个接口的模拟DashScope服务"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    tasks = {}
+    lock = threading.Lock()
+    min_duration = 2.0
+    max_duration = 8.0
+    query_count = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        now = time.time()
+        with self.lock:
+            task_id = f"task-{len(self.tasks)}"
+            self.tasks[task_id] = (now, now + random.uniform(self.min_duration, self.max_duration))
+        self._send_json({'output': {'task_id': task_id, 'task_status': 'PENDING'}})
+
+    def do_GET(self):
+        task_id = self.path.rsplit('/', 1)[-1]
+        with self.lock:
+            MockDashScope.query_count += 1
+            created, finish = self.tasks[task_id]
+        output = {'task_id': task_id}
+        if time.time() >= finish:
+            output.update(task_status='SUCCEEDED', image_url=f'https://example.com/{task_id}.png')
+        else:
+            output['task_status'] = 'RUNNING'
+        self._send_json({'output': output})
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(math.ceil(pct / 100 * len(values))) - 1)
+    return values[max(index, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='共享轮询调度器基准测试')
+    parser.add_argument('--tasks', type=int, default=1000, help='模拟任务数量')
+    parser.add_argument('--min-duration', type=float, default=2.0, help='任务最短运行时间(秒)')
+    parser.add_argument('--max-duration', type=float, default=8.0, help='任务最长运行时间(秒)')
+    parser.add_argument('--initial-interval', type=float, default=0.5, help='首次检查间隔(秒)')
+    parser.add_argument('--max-interval', type=float, default=2.0, help='最大检查间隔(秒)')
+    parser.add_argument('--max-qps', type=float, default=500, help='对上游的最大查询QPS')
+    parser.add_argument('--legacy-interval', type=float, default=1.0, help='旧方式的固定轮询间隔(秒)，仅用于估算对比')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    MockDashScope.min_duration = args.min_duration
+    MockDashScope.max_duration = args.max_duration
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockDashScope)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['DASHSCOPE_BASE_URL'] = f'http://127.0.0.1:{server.server_port}'
+
+    from utils.aliyun_client import AliyunAITryOnClient
+    from utils.task_poller import TaskPoller
+    from utils.task_tracker import TaskTracker
+
+    client = AliyunAITryOnClient(api_key='bench')
+    tracker = TaskTracker(client, max_wait=args.max_duration * 10)
+    tracker.poller = TaskPoller(
+        client.query_task_status, tracker._apply_result,
+        initial_interval=args.initial_interval, max_interval=args.max_interval,
+        max_qps=args.max_qps
+    )
+
+    completed = {}
+    done = threading.Event()
+
+    def on_result(task_id, result):
+        finished = tracker._apply_result(task_id, result)
+        if finished:
+            completed[task_id] = time.time()
+            if len(completed) == args.tasks:
+                done.set()
+        return finished
+
+    tracker.poller.on_result = on_result
+
+    started = time.time()
+    for _ in range(args.tasks):
+        task_id = client.submit_tryon_task('https://example.com/p.png', 'https://example.com/g.png')
+        tracker.track(task_id)
+    submit_time = time.time() - started
+
+    done.wait(timeout=args.max_duration * 10)
+    elapsed = time.time() - started
+
+    latencies = []
+    lags = []
+    legacy_requests = 0
+    for task_id, seen_at in completed.items():
+        created, finish = MockDashScope.tasks[task_id]
+        latencies.append(seen_at - created)
+        lags.append(seen_at - finish)
+        legacy_requests += math.ceil((finish - created) / args.legacy_interval) + 1
+
+    print(f"任务数: {args.tasks}，已完成: {len(completed)}，提交耗时: {submit_time:.2f}s，总耗时: {elapsed:.2f}s")
+    print(f"上游查询次数: {MockDashScope.query_count}（平均每任务 {MockDashScope.query_count / max(len(completed), 1):.2f} 次）")
+    print(f"旧方式估算查询次数(固定间隔 {args.legacy_interval}s): {legacy_requests}")
+    print(f"峰值QPS上限: {args.max_qps}，实际平均QPS: {MockDashScope.query_count / elapsed:.1f}")
+    for name, values in (('完成延迟', latencies), ('发现延迟', lags)):
+        print(f"{name}: p50={percentile(values, 50):.3f}s p95={percentile(values, 95):.3f}s "
+              f"p99={percentile(values, 99):.3f}s max={max(values):.3f}s")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
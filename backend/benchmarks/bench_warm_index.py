@@ -0,0 +1,163 @@
+"""
+热门商品预计算索引（WarmIndex）查找延迟基准测试
+
+在临时目录中创建索引并写入 --entries 个条目（每批 --batch 个），然后用内容寻址的图片URL调用
+WarmIndex.lookup（直接试衣接口在提交上游任务前调用的方法），分别测量命中和未命中的查找，
+报告每次查找的p50/p99/最大延迟和吞吐，并与亚毫秒目标（--target-ms，默认1ms）比较。
+--threads 大于1时多个线程同时查找（模拟gthread worker），每个线程使用独立的SQLite连接。
+
+用法:
+    cd backend
+    python benchmarks/bench_warm_index.py --entries 100000 --lookups 20000 --threads 1,8
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from bench_load import percentile
+
+OBJECT_URL = 'https://bucket.oss-cn-beijing.aliyuncs.com/uploads'
+MODEL = 'bench-model'
+GARMENT_TYPES = ('top', 'bottom')
+
+
+def digest(kind, index):
+    return hashlib.sha256(f"{kind}-{index}".encode()).hexdigest()
+
+
+def fill(index, entries, persons, batch):
+    """写入entries个条目：persons个人物图 x 若干服装，返回写入耗时(秒)"""
+    started = time.perf_counter()
+    rows = []
+    for number in range(entries):
+        person, garment = digest('person', number % persons), digest('garment', number // persons)
+        rows.append((person, garment, GARMENT_TYPES[number % 2], MODEL, f"task-{number}",
+                     f"{OBJECT_URL}/results/task-{number}.png"))
+        if len(rows) >= batch:
+            index.put_many(rows)
+            rows = []
+    if rows:
+        index.put_many(rows)
+    return time.perf_counter() - started
+
+
+def make_queries(count, entries, persons, hit_ratio, seed):
+    """生成 (人物URL, 服装URL, 服装类型, 是否应命中) 的列表"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        if rng.random() < hit_ratio:
+            number = rng.randrange(entries)
+            person, garment = digest('person', number % persons), digest('garment', number // persons)
+            queries.append((f"{OBJECT_URL}/{person}.jpg", f"{OBJECT_URL}/{garment}.jpg", GARMENT_TYPES[number % 2], True))
+        else:
+            garment = digest('missing', rng.randrange(1 << 30))
+            queries.append((f"{OBJECT_URL}/{digest('person', rng.randrange(persons))}.jpg",
+                            f"{OBJECT_URL}/{garment}.jpg", 'top', False))
+    return queries
+
+
+def run_lookups(index, queries, threads):
+    """在threads个线程中执行查找，返回 (命中延迟, 未命中延迟, 总耗时, 结果错误数)"""
+    hits, misses = [], []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(chunk):
+        nonlocal errors
+        # 预热本线程的连接，连接建立不计入查找延迟
+        index.count()
+        local_hits, local_misses, local_errors = [], [], 0
+        for person_url, garment_url, garment_type, expected in chunk:
+            started = time.perf_counter()
+            entry = index.lookup(person_url, garment_url, garment_type, MODEL)
+            elapsed = time.perf_counter() - started
+            (local_hits if expected else local_misses).append(elapsed)
+            if (entry is not None) != expected:
+                local_errors += 1
+        with lock:
+            hits.extend(local_hits)
+            misses.extend(local_misses)
+            errors += local_errors
+
+    workers = [threading.Thread(target=worker, args=(queries[t::threads],)) for t in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    hits.sort()
+    misses.sort()
+    return hits, misses, elapsed, errors
+
+
+def summarize(latencies):
+    return {
+        'lookups': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热门商品预计算索引查找延迟基准测试')
+    parser.add_argument('--entries', type=int, default=100000, help='索引中的条目数')
+    parser.add_argument('--persons', type=int, default=50, help='不同人物图的数量（其余维度为服装）')
+    parser.add_argument('--batch', type=int, default=5000, help='写入时每批的条目数')
+    parser.add_argument('--lookups', type=int, default=20000, help='每轮查找次数')
+    parser.add_argument('--hit-ratio', type=float, default=0.8, help='查找中应命中的比例')
+    parser.add_argument('--threads', default='1,8', help='并发查找的线程数，逗号分隔，每个值测一轮')
+    parser.add_argument('--target-ms', type=float, default=1.0, help='查找p99的目标延迟(毫秒)')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    args = parser.parse_args()
+    thread_counts = [int(value) for value in args.threads.split(',') if value.strip()]
+
+    workdir = tempfile.mkdtemp(prefix='bench-warm-index-')
+    from utils.warm_index import WarmIndex
+    results = []
+    try:
+        index = WarmIndex(os.path.join(workdir, 'warm-index.db'))
+        fill_seconds = fill(index, args.entries, args.persons, args.batch)
+        size = os.path.getsize(index.path)
+        print(f"写入 {index.count()} 个条目，耗时 {fill_seconds:.2f}s（{args.entries / fill_seconds:.0f} 条/秒），"
+              f"数据库 {size / 1024 / 1024:.1f}MB")
+        queries = make_queries(args.lookups, args.entries, args.persons, args.hit_ratio, args.seed)
+        # 先完整查找一遍，使数据库页进入操作系统缓存，测量的是常驻状态下的查找
+        run_lookups(index, queries, 1)
+
+        for threads in thread_counts:
+            hits, misses, elapsed, errors = run_lookups(index, queries, threads)
+            result = {'threads': threads, 'throughput': len(queries) / elapsed, 'errors': errors,
+                      'hit': summarize(hits), 'miss': summarize(misses)}
+            worst = max(result['hit']['p99_ms'], result['miss']['p99_ms'])
+            result['meets_target'] = worst < args.target_ms
+            results.append(result)
+            for name in ('hit', 'miss'):
+                stats = result[name]
+                print(f"{threads:>3} 线程 {'命中' if name == 'hit' else '未命中':>3}  查找 {stats['lookups']:>6}  "
+                      f"p50 {stats['p50_ms']:.3f}ms  p99 {stats['p99_ms']:.3f}ms  最大 {stats['max_ms']:.3f}ms")
+            print(f"{threads:>3} 线程  吞吐 {result['throughput']:.0f} 次/秒  结果错误 {errors}  "
+                  f"p99 {'达到' if result['meets_target'] else '未达到'} {args.target_ms}ms 目标", flush=True)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'entries': args.entries, 'fill_seconds': fill_seconds, 'db_bytes': size,
+                           'target_ms': args.target_ms, 'results': results}, f, ensure_ascii=False, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
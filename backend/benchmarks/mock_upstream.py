@@ -0,0 +1,402 @@
+"""
+本地DashScope / OSS模拟服务（用于负载测试和无凭证的本地联调）
+
+模拟的接口:
+  - POST /api/v1/services/aigc/image2image/image-synthesis  提交试衣任务
+  - GET  /api/v1/tasks/<task_id>                            查询任务（PENDING -> RUNNING -> SUCCEEDED/FAILED，
+                                                             带submit_time/scheduled_time/end_time）
+  - GET  /api/v1/models                                     API密钥校验
+  - GET  /results/<task_id>.png                             结果图片
+  - PUT/HEAD/GET /<bucket>/<key>、GET /<bucket>/            OSS兼容的对象读写和列举（路径风格，不校验签名，
+                                                             不支持分片上传；支持x-oss-forbid-overwrite和浏览器
+                                                             直传的跨域预检）
+  - POST /<bucket>/                                         OSS PostObject表单上传（浏览器直传；不校验签名，
+                                                             但执行policy中的content-length-range和eq条件）
+  - GET  /_stats                                            请求计数（负载测试用）
+
+HTTP延迟、任务排队和运行时长都可以配置为随机分布，格式为 "类型:参数"：
+  fixed:0.05、uniform:2,8、normal:5,1、lognormal:5,0.4（中位数5秒）、exp:0.1（均值0.1秒）
+同时包含上装和下装的任务（整套搭配）运行时长乘以 --outfit-run-factor。
+
+用法:
+    cd backend
+    python benchmarks/mock_upstream.py --port 18080 --run-time lognormal:5,0.4 --throttle-rate 0.02
+
+应用端配置:
+    DASHSCOPE_BASE_URL=http://127.0.0.1:18080
+    OSS_ENDPOINT=http://127.0.0.1:18080 OSS_BUCKET_NAME=mock-bucket OSS_ACCESS_KEY_ID=mock OSS_ACCESS_KEY_SECRET=mock
+"""
+import io
+import re
+import json
+import math
+import time
+import uuid
+import random
+import base64
+import argparse
+import threading
+from datetime import datetime
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import unquote, urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUBMIT_PATH = '/api/v1/services/aigc/image2image/image-synthesis'
+TASK_PATH = re.compile(r'^/api/v1/tasks/([A-Za-z0-9-]+)$')
+RESULT_PATH = re.compile(r'^/results/([A-Za-z0-9-]+)\.png$')
+
+
+class Distribution:
+    """可配置的随机分布，sample()返回非负秒数"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, _, args = spec.partition(':')
+        self.kind = kind
+        self.args = [float(value) for value in args.split(',')] if args else []
+        samplers = {
+            'fixed': lambda a: a[0],
+            'uniform': lambda a: random.uniform(a[0], a[1]),
+            'normal': lambda a: random.gauss(a[0], a[1]),
+            # 参数为中位数和对数标准差
+            'lognormal': lambda a: random.lognormvariate(math.log(a[0]), a[1]),
+            'exp': lambda a: random.expovariate(1 / a[0]) if a[0] > 0 else 0.0
+        }
+        if kind not in samplers:
+            raise ValueError(f"未知的分布类型: {spec}")
+        self._sampler = samplers[kind]
+
+    def sample(self):
+        return max(self._sampler(self.args), 0.0)
+
+    def __repr__(self):
+        return self.spec
+
+
+def _make_result_image():
+    """结果图片：安装了Pillow时生成一张768x1024的PNG，否则使用1x1的PNG"""
+    try:
+        from PIL import Image
+        image = Image.new('RGB', (768, 1024), (235, 225, 210))
+        image.paste((90, 110, 160), (160, 200, 608, 900))
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+    except ImportError:
+        return bytes.fromhex(
+            '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+            '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+        )
+
+
+def _upstream_time(timestamp):
+    """DashScope返回的时间格式（本地时间，精确到毫秒）"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+class MockUpstream:
+    """模拟服务的状态：任务、对象和请求计数"""
+
+    def __init__(self, submit_latency='fixed:0.05', query_latency='fixed:0.02', oss_latency='fixed:0.01',
+                 queue_time='uniform:0.2,1', run_time='lognormal:5,0.4', failure_rate=0.0,
+                 throttle_rate=0.0, error_rate=0.0, public_host=None, outfit_run_factor=1.0):
+        self.submit_latency = Distribution(submit_latency)
+        self.query_latency = Distribution(query_latency)
+        self.oss_latency = Distribution(oss_latency)
+        self.queue_time = Distribution(queue_time)
+        self.run_time = Distribution(run_time)
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.public_host = public_host
+        self.outfit_run_factor = outfit_run_factor
+        self.result_image = _make_result_image()
+
+        self.tasks = {}
+        self.objects = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['tasks'] = len(self.tasks)
+            stats['objects'] = len(self.objects)
+            return stats
+
+    def create_task(self, outfit=False):
+        now = time.time()
+        scheduled = now + self.queue_time.sample()
+        run_time = self.run_time.sample() * (self.outfit_run_factor if outfit else 1.0)
+        task = {
+            'task_id': str(uuid.uuid4()),
+            'submitted': now,
+            'scheduled': scheduled,
+            'finished': scheduled + run_time,
+            'failed': random.random() < self.failure_rate
+        }
+        with self.lock:
+            self.tasks[task['task_id']] = task
+        return task
+
+    def task_output(self, task_id, base_url):
+        with self.lock:
+            task = self.tasks.get(task_id)
+        if task is None:
+            return {'task_id': task_id, 'task_status': 'UNKNOWN'}
+
+        now = time.time()
+        output = {'task_id': task_id, 'submit_time': _upstream_time(task['submitted'])}
+        if now < task['scheduled']:
+            output['task_status'] = 'PENDING'
+            return output
+        output['scheduled_time'] = _upstream_time(task['scheduled'])
+        if now < task['finished']:
+            output['task_status'] = 'RUNNING'
+            return output
+        output['end_time'] = _upstream_time(task['finished'])
+        if task['failed']:
+            output.update(task_status='FAILED', code='InternalError.Algo', message='模拟的任务失败')
+        else:
+            # 与真实服务一样返回带过期参数的签名地址
+            output.update(task_status='SUCCEEDED',
+                          image_url=f"{base_url}/results/{task_id}.png?Expires={int(now) + 86400}&Signature=mock")
+        return output
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    upstream = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None, head=False):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('x-oss-request-id', uuid.uuid4().hex)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and not head:
+            self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _base_url(self):
+        host = self.upstream.public_host or self.headers.get('Host') or f"127.0.0.1:{self.server.server_port}"
+        return f"http://{host}"
+
+    def _dashscope_fault(self):
+        """按配置的比例返回限流（429）或服务端错误（500），返回True表示已发送错误响应"""
+        upstream = self.upstream
+        draw = random.random()
+        if draw < upstream.throttle_rate:
+            upstream.count('throttled')
+            self._send(429, {'code': 'Throttling.RateQuota', 'request_id': uuid.uuid4().hex,
+                             'message': 'Requests rate limit exceeded, please try again later.'})
+            return True
+        if draw < upstream.throttle_rate + upstream.error_rate:
+            upstream.count('errors')
+            self._send(500, {'code': 'InternalError', 'request_id': uuid.uuid4().hex, 'message': '模拟的服务端错误'})
+            return True
+        return False
+
+    # DashScope
+    def do_POST(self):
+        body = self._read_body()
+        if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            return self._oss_post_object(body)
+        if self.path != SUBMIT_PATH:
+            return self._send(404, {'code': 'NotFound'})
+        upstream = self.upstream
+        time.sleep(upstream.submit_latency.sample())
+        upstream.count('submits')
+        if self._dashscope_fault():
+            return
+        try:
+            garments = json.loads(body or b'{}').get('input', {})
+        except ValueError:
+            garments = {}
+        outfit = bool(garments.get('top_garment_url') and garments.get('bottom_garment_url'))
+        if outfit:
+            upstream.count('outfit_submits')
+        task = upstream.create_task(outfit)
+        self._send(200, {'output': {'task_id': task['task_id'], 'task_status': 'PENDING'},
+                         'request_id': uuid.uuid4().hex})
+
+    def do_GET(self):
+        upstream = self.upstream
+        path = urlsplit(self.path).path
+        if path == '/_stats':
+            return self._send(200, upstream.snapshot())
+        if path == '/api/v1/models':
+            return self._send(200, {'data': [{'id': 'aitryon-plus'}]})
+
+        match = TASK_PATH.match(path)
+        if match:
+            time.sleep(upstream.query_latency.sample())
+            upstream.count('queries')
+            if self._dashscope_fault():
+                return
+            return self._send(200, {'output': upstream.task_output(match.group(1), self._base_url()),
+                                    'request_id': uuid.uuid4().hex})
+
+        match = RESULT_PATH.match(path)
+        if match:
+            upstream.count('result_downloads')
+            return self._send(200, upstream.result_image, content_type='image/png')
+
+        self._oss_get(path)
+
+    # OSS
+    def _oss_key(self, path):
+        # oss2会把对象键中的"/"编码为%2F
+        return unquote(path)
+
+    def do_PUT(self):
+        body = self._read_body()
+        upstream = self.upstream
+        time.sleep(upstream.oss_latency.sample())
+        upstream.count('oss_puts')
+        key = self._oss_key(urlsplit(self.path).path)
+        cors = {'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag'}
+        with upstream.lock:
+            if key in upstream.objects and self.headers.get('x-oss-forbid-overwrite', '').lower() == 'true':
+                return self._send(409, b'<Error><Code>FileAlreadyExists</Code></Error>', 'application/xml', cors)
+            upstream.objects[key] = (body, self.headers.get('Content-Type') or 'application/octet-stream')
+        self._send(200, headers={'ETag': f'"{uuid.uuid4().hex}"', **cors})
+
+    def _oss_post_object(self, body):
+        """PostObject：按policy检查表单字段和文件大小后保存对象"""
+        upstream = self.upstream
+        time.sleep(upstream.oss_latency.sample())
+        upstream.count('oss_posts')
+        cors = {'Access-Control-Allow-Origin': '*'}
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        fields, content = {}, None
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'file':
+                content = part.get_payload(decode=True)
+            else:
+                fields[name] = part.get_payload(decode=True).decode()
+        if content is None or 'key' not in fields or 'policy' not in fields:
+            return self._send(400, b'<Error><Code>InvalidArgument</Code></Error>', 'application/xml', cors)
+        for condition in json.loads(base64.b64decode(fields['policy'])).get('conditions', []):
+            if isinstance(condition, list) and condition[0] == 'content-length-range':
+                if not condition[1] <= len(content) <= condition[2]:
+                    return self._send(400, b'<Error><Code>EntityTooLarge</Code></Error>', 'application/xml', cors)
+            elif isinstance(condition, list) and condition[0] == 'eq':
+                if fields.get(condition[1].lstrip('$')) != condition[2]:
+                    return self._send(403, b'<Error><Code>AccessDenied</Code></Error>', 'application/xml', cors)
+        key = f"{self._oss_key(urlsplit(self.path).path).rstrip('/')}/{fields['key']}"
+        with upstream.lock:
+            if key in upstream.objects and fields.get('x-oss-forbid-overwrite', '').lower() == 'true':
+                return self._send(409, b'<Error><Code>FileAlreadyExists</Code></Error>', 'application/xml', cors)
+            upstream.objects[key] = (content, fields.get('Content-Type') or 'application/octet-stream')
+        self._send(int(fields.get('success_action_status') or 204), headers={'ETag': f'"{uuid.uuid4().hex}"', **cors})
+
+    def do_OPTIONS(self):
+        """浏览器通过签名URL直传对象前的跨域预检（相当于存储桶配置了允许所有来源的CORS规则）"""
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, HEAD, PUT, POST')
+        self.send_header('Access-Control-Allow-Headers', self.headers.get('Access-Control-Request-Headers') or '*')
+        self.send_header('Access-Control-Max-Age', '600')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        upstream = self.upstream
+        time.sleep(upstream.oss_latency.sample())
+        upstream.count('oss_heads')
+        with upstream.lock:
+            stored = upstream.objects.get(self._oss_key(urlsplit(self.path).path))
+        if stored is None:
+            return self._send(404, head=True)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(stored[0])))
+        self.send_header('Content-Type', stored[1])
+        self.send_header('x-oss-request-id', uuid.uuid4().hex)
+        self.end_headers()
+
+    def _oss_get(self, path):
+        upstream = self.upstream
+        time.sleep(upstream.oss_latency.sample())
+        key = self._oss_key(path)
+        bucket_path = key.rstrip('/')
+        if bucket_path.count('/') <= 1:
+            # 列举对象（存储连通性检查）
+            upstream.count('oss_lists')
+            query = parse_qs(urlsplit(self.path).query)
+            body = (
+                '<?xml version="1.0" encoding="UTF-8"?><ListBucketResult>'
+                f'<Name>{bucket_path.lstrip("/")}</Name><Prefix></Prefix><Marker></Marker>'
+                f'<MaxKeys>{query.get("max-keys", ["100"])[0]}</MaxKeys><Delimiter></Delimiter>'
+                '<IsTruncated>false</IsTruncated></ListBucketResult>'
+            ).encode()
+            return self._send(200, body, content_type='application/xml')
+
+        upstream.count('oss_gets')
+        with upstream.lock:
+            stored = upstream.objects.get(key)
+        if stored is None:
+            return self._send(404, b'<Error><Code>NoSuchKey</Code></Error>', content_type='application/xml')
+        self._send(200, stored[0], content_type=stored[1])
+
+
+def start_server(upstream, host='127.0.0.1', port=0):
+    """在后台线程中启动模拟服务，返回server（server.server_port为实际端口）"""
+    handler = type('BoundMockHandler', (MockHandler,), {'upstream': upstream})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mock-upstream', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地DashScope / OSS模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--public-host', help='结果图片地址中使用的主机名（默认取请求的Host头）')
+    parser.add_argument('--submit-latency', default='fixed:0.05', help='提交接口响应延迟分布')
+    parser.add_argument('--query-latency', default='fixed:0.02', help='查询接口响应延迟分布')
+    parser.add_argument('--oss-latency', default='fixed:0.01', help='OSS接口响应延迟分布')
+    parser.add_argument('--queue-time', default='uniform:0.2,1', help='任务排队时长分布（PENDING）')
+    parser.add_argument('--run-time', default='lognormal:5,0.4', help='任务运行时长分布（RUNNING）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='任务以FAILED结束的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='提交/查询返回429的比例')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='提交/查询返回500的比例')
+    parser.add_argument('--outfit-run-factor', type=float, default=1.0, help='同时包含上装和下装的任务的运行时长倍数')
+    args = parser.parse_args()
+
+    upstream = MockUpstream(
+        submit_latency=args.submit_latency, query_latency=args.query_latency, oss_latency=args.oss_latency,
+        queue_time=args.queue_time, run_time=args.run_time, failure_rate=args.failure_rate,
+        throttle_rate=args.throttle_rate, error_rate=args.error_rate, public_host=args.public_host,
+        outfit_run_factor=args.outfit_run_factor
+    )
+    server = start_server(upstream, args.host, args.port)
+    print(f"模拟服务已启动: http://{args.host}:{server.server_port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,45 @@
 import os
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
 
 class Config:
     # 阿里云API配置
     DASHSCOPE_API_KEY = os.environ.get('DASHSCOPE_API_KEY')
+    # DashScope服务地址（测试时可指向本地模拟服务器）
+    DASHSCOPE_BASE_URL = os.environ.get('DASHSCOPE_BASE_URL', 'https://dashscope.aliyuncs.com').rstrip('/')
+    
+    # 上游HTTP连接池配置（DashScope / OSS）
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))  # 每个主机保持的最大连接数
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))  # 连接超时(秒)
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 30))  # 提交任务的读取超时(秒)
+    HTTP_QUERY_TIMEOUT = float(os.environ.get('HTTP_QUERY_TIMEOUT', 10))  # 查询任务的读取超时(秒)
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))  # 429/5xx（提交任务只重试429）及连接错误的最大重试次数
+    HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))  # 重试退避系数
+
+    # ASGI模式（uvicorn asgi:app）配置
+    ASYNC_HTTP_POOL_SIZE = int(os.environ.get('ASYNC_HTTP_POOL_SIZE', 100))  # 每个异步客户端的最大连接数
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))  # 执行阻塞操作（图片预处理、本地存储及其余同步接口）的线程数
+
+    # Redis配置（结果缓存等可选使用）
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # 试衣结果缓存配置
+    RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'memory')  # memory / disk / redis / none
+    RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 23 * 3600))  # 结果URL有效期约24小时，缓存时间略短于此
+    RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 10000))  # 进程内缓存最大条目数
+    RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'results'))
+    # 下载外部图片计算得到的内容哈希的保留时间(秒)：外部URL的内容可能被替换，过期后重新下载（上传到本服务的图片不受影响）
+    RESULT_CACHE_URL_DIGEST_TTL = int(os.environ.get('RESULT_CACHE_URL_DIGEST_TTL', 600))
+    # 允许本服务下载的内网主机（逗号分隔，如内网MinIO），其余主机解析到内网、本机、链路本地等地址时拒绝下载
+    IMAGE_FETCH_ALLOWED_HOSTS = os.environ.get('IMAGE_FETCH_ALLOWED_HOSTS', '')
+    
+    # 接口限流开关（负载测试时可关闭）
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True').lower() == 'true'
+    
+    # 就绪检查中OSS连通性探测结果的缓存时间(秒)
+    READINESS_PROBE_TTL = float(os.environ.get('READINESS_PROBE_TTL', 30))
     
     # 服务器配置
     HOST = '0.0.0.0'
@@ -14,11 +51,136 @@ class Config:
     
     # 文件上传配置
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+    UPLOAD_TMP_DIR = os.environ.get('UPLOAD_TMP_DIR') or None  # 上传临时文件目录，默认使用系统临时目录
+    UPLOAD_CHUNK_SIZE = 256 * 1024  # 流式读取上传文件的块大小
+    UPLOAD_INDEX_MAX_ENTRIES = 100000  # 进程内已上传对象索引的最大条目数
+    
+    # 上传图片存储后端
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'auto')  # auto / oss / s3 / local，auto表示配置了OSS时使用OSS
+    OSS_ACCESS_KEY_ID = os.environ.get('OSS_ACCESS_KEY_ID')
+    OSS_ACCESS_KEY_SECRET = os.environ.get('OSS_ACCESS_KEY_SECRET')
+    OSS_ENDPOINT = os.environ.get('OSS_ENDPOINT')
+    OSS_BUCKET_NAME = os.environ.get('OSS_BUCKET_NAME')
+    OSS_PUBLIC_URL = os.environ.get('OSS_PUBLIC_URL')  # 对象访问地址（如CDN域名），默认为 https://<bucket>.<endpoint>
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # S3兼容服务地址（如MinIO），AWS S3留空
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+    S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL')
+    # 本地存储的文件发送方式：send_file（WSGI服务器sendfile）/ x-accel-redirect（nginx）/ x-sendfile（Apache等）
+    LOCAL_STORAGE_SERVE_MODE = os.environ.get('LOCAL_STORAGE_SERVE_MODE', 'send_file')
+    LOCAL_STORAGE_ACCEL_PREFIX = os.environ.get('LOCAL_STORAGE_ACCEL_PREFIX', '/protected-uploads')  # nginx中对应上传目录的internal location
+    LOCAL_STORAGE_PUBLIC_URL = os.environ.get('LOCAL_STORAGE_PUBLIC_URL')  # 本地文件的访问地址前缀，默认为 <当前站点>/uploads
+    OSS_MULTIPART_THRESHOLD = int(os.environ.get('OSS_MULTIPART_THRESHOLD', 5 * 1024 * 1024))  # 超过该大小使用分片上传
+    OSS_MULTIPART_PART_SIZE = int(os.environ.get('OSS_MULTIPART_PART_SIZE', 1024 * 1024))  # 分片大小
+    OSS_MULTIPART_THREADS = int(os.environ.get('OSS_MULTIPART_THREADS', 4))  # 分片上传并发数
+    # 浏览器直传：由本服务签发短时签名表单，浏览器缩放压缩后直接上传到OSS/S3（存储桶需配置允许POST的CORS规则）
+    DIRECT_UPLOAD_ENABLED = os.environ.get('DIRECT_UPLOAD_ENABLED', 'True').lower() == 'true'
+    DIRECT_UPLOAD_EXPIRES = int(os.environ.get('DIRECT_UPLOAD_EXPIRES', 300))  # 签名表单有效期(秒)
+    DIRECT_UPLOAD_MAX_BYTES = int(os.environ.get('DIRECT_UPLOAD_MAX_BYTES', 5 * 1024 * 1024))  # 直传图片大小上限（浏览器已缩放压缩，超过时改为经本服务上传并预处理）
+    
+    # 上传图片预处理配置（EXIF方向校正、缩放、去除元数据、重新编码）
+    IMAGE_PREPROCESS_ENABLED = os.environ.get('IMAGE_PREPROCESS_ENABLED', 'True').lower() == 'true'
+    IMAGE_MAX_SIDE = int(os.environ.get('IMAGE_MAX_SIDE', 2048))  # 最长边像素上限
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 90))  # 编码质量
+    IMAGE_OUTPUT_FORMAT = os.environ.get('IMAGE_OUTPUT_FORMAT', 'JPEG').upper()  # JPEG / PNG / WEBP
+    IMAGE_PREPROCESS_WORKERS = int(os.environ.get('IMAGE_PREPROCESS_WORKERS', 2))  # 预处理进程数
+    IMAGE_PREPROCESS_TIMEOUT = float(os.environ.get('IMAGE_PREPROCESS_TIMEOUT', 20))  # 单张图片处理超时(秒)
+    
+    # 试衣结果图片代理（结果完成后下载一次，保存原图和缩略图，由本服务长期提供访问）
+    RESULT_PROXY_ENABLED = os.environ.get('RESULT_PROXY_ENABLED', 'True').lower() == 'true'
+    RESULT_THUMBNAIL_WIDTHS = [int(w) for w in os.environ.get('RESULT_THUMBNAIL_WIDTHS', '320,640,1024').split(',')]
+    RESULT_THUMBNAIL_FORMATS = [f.strip().upper() for f in os.environ.get('RESULT_THUMBNAIL_FORMATS', 'WEBP,JPEG').split(',')]
+    RESULT_THUMBNAIL_QUALITY = int(os.environ.get('RESULT_THUMBNAIL_QUALITY', 80))
+    RESULT_IMAGE_CACHE_DIR = os.environ.get('RESULT_IMAGE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'result-images'))
+    RESULT_IMAGE_CACHE_MAX_BYTES = int(os.environ.get('RESULT_IMAGE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))  # 磁盘缓存大小上限，超过后按LRU淘汰
+    
+    # 热门商品的预计算试衣结果索引（直接试衣接口提交上游任务前先查找）
+    WARM_INDEX_ENABLED = os.environ.get('WARM_INDEX_ENABLED', 'True').lower() == 'true'
+    WARM_INDEX_PATH = os.environ.get('WARM_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'warm-index.db'))
+    WARM_INDEX_BATCH_SIZE = int(os.environ.get('WARM_INDEX_BATCH_SIZE', 4))  # 预热时每批提交的任务数，应小于GOVERNOR_MAX_INFLIGHT
+    WARM_INDEX_MAX_PAIRS = int(os.environ.get('WARM_INDEX_MAX_PAIRS', 10000))  # 单个预热任务最多的组合数
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or None  # 管理接口（/api/admin/*）的访问令牌，未设置时管理接口不可用
+    
+    # 状态接口的进程内缓存，同一任务的并发查询合并为一次读取（见 utils.status_cache）
+    STATUS_CACHE_TTL = float(os.environ.get('STATUS_CACHE_TTL', 1.5))  # 进行中状态的缓存时长(秒)，已结束的状态长期缓存
+    STATUS_CACHE_MAX_ENTRIES = int(os.environ.get('STATUS_CACHE_MAX_ENTRIES', 10000))  # 缓存最大条目数，超过后按LRU淘汰
+    STATUS_CACHE_MAX_AGE = int(os.environ.get('STATUS_CACHE_MAX_AGE', 300))  # 已结束状态的响应允许浏览器缓存的时长(秒)
     
     # 任务状态检查间隔(秒)和最大重试次数
     TASK_CHECK_INTERVAL = 5
     MAX_TASK_CHECK_RETRIES = 30
+    # 整套搭配（同时试穿上装和下装）的提交方式：single为一次提交上下装（aitryon-plus支持），
+    # chain为先试穿上装、再以上装结果为人物图提交下装（由服务端衔接，用于只支持单件服装的模型）
+    TRYON_OUTFIT_MODE = os.environ.get('TRYON_OUTFIT_MODE', 'single').lower()
+    # 试衣客户端批量接口（submit_many / wait_many）同时进行的最大请求数
+    TRYON_CLIENT_CONCURRENCY = int(os.environ.get('TRYON_CLIENT_CONCURRENCY', 16))
+    
+    # 后台任务跟踪配置
+    TASK_MAX_WAIT = int(os.environ.get('TASK_MAX_WAIT', 150))  # 单个任务最长跟踪时间(秒)
+    TASK_RESULT_TTL = int(os.environ.get('TASK_RESULT_TTL', 3600))  # 已结束任务状态的保留时间(秒)
+    
+    # 持久化任务登记表（worker重启或跨节点时接管未完成的任务）
+    TASK_STORE_BACKEND = os.environ.get('TASK_STORE_BACKEND', 'sqlite')  # sqlite / redis / none
+    TASK_STORE_PATH = os.environ.get('TASK_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'tasks.db'))
+    TASK_STORE_RETENTION = int(os.environ.get('TASK_STORE_RETENTION', 7 * 24 * 3600))  # 任务记录保留时间(秒)
+    TASK_STORE_SWEEP_INTERVAL = int(os.environ.get('TASK_STORE_SWEEP_INTERVAL', 600))  # 清理过期记录的间隔(秒)
+    TASK_STORE_POLL_INTERVAL = float(os.environ.get('TASK_STORE_POLL_INTERVAL', 1))  # 等待其他worker负责的任务时读取登记表的间隔(秒)
+    TASK_LEASE_TIMEOUT = int(os.environ.get('TASK_LEASE_TIMEOUT', 60))  # 轮询租约时长(秒)，worker退出后超过该时间任务由其他worker接管
+    
+    # 批量试衣配置
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 50))  # 单个批次最多服装数
+    BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))  # 每个进程同时进行的批量子任务数
+    
+    SSE_KEEPALIVE_INTERVAL = float(os.environ.get('SSE_KEEPALIVE_INTERVAL', 15))  # 状态推送连接的心跳间隔(秒)
+    
+    # 上游配额调节器（所有worker共享的令牌桶 + 在途任务上限）
+    GOVERNOR_BACKEND = os.environ.get('GOVERNOR_BACKEND', 'file')  # local / file / redis
+    GOVERNOR_STATE_FILE = os.environ.get('GOVERNOR_STATE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'governor.json'))
+    GOVERNOR_SUBMIT_QPS = float(os.environ.get('GOVERNOR_SUBMIT_QPS', 2))  # 全局提交任务QPS
+    GOVERNOR_QUERY_QPS = float(os.environ.get('GOVERNOR_QUERY_QPS', 20))  # 全局查询任务QPS
+    GOVERNOR_MAX_INFLIGHT = int(os.environ.get('GOVERNOR_MAX_INFLIGHT', 10))  # 同时在途的最大任务数
+    GOVERNOR_MAX_WAIT = float(os.environ.get('GOVERNOR_MAX_WAIT', 30))  # 排队等待配额的最长时间(秒)
+    
+    # 提交配额的调度：按优先级类别（interactive / batch / prefetch）和租户加权公平排队，预计排队超过GOVERNOR_MAX_WAIT时返回429
+    SCHEDULER_CLASS_WEIGHTS = os.environ.get('SCHEDULER_CLASS_WEIGHTS', 'interactive=8,batch=2,prefetch=1')  # 各优先级类别的权重
+    SCHEDULER_TENANT_WEIGHTS = os.environ.get('SCHEDULER_TENANT_WEIGHTS', '')  # 租户权重，如 "acme=2,bulk=0.5"，未列出的租户为1
+    TENANT_API_KEYS = os.environ.get('TENANT_API_KEYS', '')  # API密钥（请求头X-API-Key）到租户的映射，如 "key1=acme,key2=bulk"
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))  # 服务前的可信反向代理层数，>0时按X-Forwarded-For识别客户端IP
+    
+    # 推测性预取：直接试衣成功后按prefetch类别在后台提交请求中给出的候选服装（prefetch_garments），结果写入结果缓存
+    PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'False').lower() == 'true'
+    PREFETCH_TOP_K = int(os.environ.get('PREFETCH_TOP_K', 3))  # 每次最多预取的候选数
+    PREFETCH_TENANT_BUDGET = int(os.environ.get('PREFETCH_TENANT_BUDGET', 30))  # 每个租户（API密钥或客户端IP）在时间窗口内最多预取提交的任务数
+    PREFETCH_SESSION_BUDGET = int(os.environ.get('PREFETCH_SESSION_BUDGET', 10))  # 租户内每个会话（X-Session-Id）在时间窗口内最多预取提交的任务数
+    PREFETCH_BUDGET_WINDOW = int(os.environ.get('PREFETCH_BUDGET_WINDOW', 3600))  # 预算的时间窗口(秒)
+    PREFETCH_MAX_QUEUE_WAIT = float(os.environ.get('PREFETCH_MAX_QUEUE_WAIT', 2))  # 预计排队超过该秒数时放弃预取（只使用空闲配额）
+    PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))  # 每个进程执行预取的线程数
+    
+    # 日志配置
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()  # text / json（结构化日志，每条一行）
+    LOG_FILE = os.environ.get('LOG_FILE', 'app.log')  # 日志文件，空字符串表示只输出到stdout
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 50 * 1024 * 1024))  # 日志文件按大小轮转的阈值
+    LOG_ROTATE_WHEN = os.environ.get('LOG_ROTATE_WHEN', '')  # 按时间轮转（如 midnight、H），设置后不再按大小轮转
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))  # 保留的历史日志文件数
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', 'True').lower() == 'true'  # 经队列由后台线程写日志，请求线程不等待I/O
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # 日志队列长度，满了之后丢弃新日志
+    LOG_POLL_SAMPLE_RATE = float(os.environ.get('LOG_POLL_SAMPLE_RATE', 0.1))  # 轮询状态日志的采样比例（按任务采样）
+    
+    # 链路追踪：配置OTLP收集器地址（如 http://localhost:4318）后导出OpenTelemetry span
+    OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT', '')
+    OTEL_SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'paida-tryon')
+    
+    # 共享轮询调度器配置（先密后疏的自适应间隔 + 随机抖动）
+    TASK_POLL_INITIAL_INTERVAL = float(os.environ.get('TASK_POLL_INITIAL_INTERVAL', 2))  # 首次检查间隔(秒)
+    TASK_POLL_MAX_INTERVAL = float(os.environ.get('TASK_POLL_MAX_INTERVAL', 10))  # 最大检查间隔(秒)
+    TASK_POLL_BACKOFF = float(os.environ.get('TASK_POLL_BACKOFF', 1.5))  # 间隔增长倍数
+    TASK_POLL_JITTER = float(os.environ.get('TASK_POLL_JITTER', 0.2))  # 随机抖动比例
+    TASK_POLL_MAX_QPS = float(os.environ.get('TASK_POLL_MAX_QPS', 20))  # 每个进程对上游的最大查询QPS
+    TASK_POLL_CONCURRENCY = int(os.environ.get('TASK_POLL_CONCURRENCY', 16))  # 同时进行的最大查询数
 
 
 class ProductionConfig:
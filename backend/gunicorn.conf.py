@@ -0,0 +1,23 @@
+# gunicorn配置：gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+# gthread工作模式：状态推送等长连接只占用线程，不占用整个worker进程；
+# ASGI部署使用 GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker 并以 asgi:app 启动
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# 每个worker同时保持的连接数上限；超过后gthread主循环不再接受新连接，需大于预期的并发长连接数
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = 180
+
+# 在master中导入一次应用后再fork各worker，导入阶段不访问网络，除日志线程（fork后在各worker中自动重建）外不启动线程，
+# OSS、DashScope客户端、任务跟踪器等组件由各worker按需创建
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+
+def post_worker_init(worker):
+    """worker启动后在后台线程中初始化各组件，首个请求无需等待"""
+    import threading
+    from app import warm_up
+    threading.Thread(target=warm_up, name='tryon-warm-up', daemon=True).start()
@@ -0,0 +1,407 @@
+"""
+离线批量预渲染：按清单将一组模特照片与整个服装目录逐对试衣，结果图片保存到存储后端
+
+用法（在backend目录下运行）:
+    python prerender.py catalog.csv --inflight 10 --upload-workers 8 --output results.jsonl
+
+清单为带表头的CSV或JSONL（.jsonl），每行一对输入:
+    person,garment,garment_type,id
+person / garment 为公网URL或本地图片路径（相对于清单所在目录）；garment_type 默认为 top；id 可选，原样写入结果。
+本地图片经过与上传接口相同的预处理，按内容哈希上传到存储后端，同一张图片只上传一次。
+
+  - 相同的（人物, 服装, 类型）只处理一次
+  - 本地图片由 --upload-workers 个线程并行上传，与试衣任务同时进行
+  - 最多 --inflight 个任务同时在途，提交前经上游配额调节器排队（与在线服务共同遵守QPS和在途任务上限）
+  - 每一步的进展立即追加到检查点文件（默认为 <清单>.state.jsonl）。中断或崩溃后以相同参数重新运行即可继续：
+    已完成的跳过，已提交的继续等待原任务而不重复提交，已上传的图片不再上传
+  - --retry-failed 重新处理失败的输入对；任务已成功、只是保存结果图片失败的输入对只重新保存，不重新提交
+  - 成功的结果图片（及缩略图）保存到存储后端的 results/ 下，--output 导出每对输入的最终状态和结果地址
+"""
+import os
+import csv
+import sys
+import json
+import time
+import queue
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import Config
+from utils.aliyun_client import AliyunAITryOnClient, TaskResult
+from utils.governor import UpstreamGovernor
+from utils.http_session import get_session
+from utils.image_preprocess import preprocess_upload
+from utils.result_images import ResultImageStore
+from utils.storage import LocalStorage, create_storage_backend
+from utils.upload_store import spool_upload
+
+logger = logging.getLogger('prerender')
+
+GARMENT_TYPES = {'top', 'bottom', 'dress'}
+
+# 清单中可以使用的列名
+PERSON_COLUMNS = ('person', 'person_image', 'person_image_url')
+GARMENT_COLUMNS = ('garment', 'garment_image', 'garment_image_url')
+TYPE_COLUMNS = ('garment_type', 'type')
+
+# 提交失败后的重试间隔(秒)，按指数增长
+SUBMIT_RETRY_DELAY = 5
+SUBMIT_RETRY_MAX_DELAY = 60
+
+
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+
+def pair_key(person, garment, garment_type):
+    """一对输入的唯一标识（去重和检查点使用）"""
+    return hashlib.sha1(f"{person}\n{garment}\n{garment_type}".encode('utf-8')).hexdigest()[:20]
+
+
+def _column(row, names, default=None):
+    for name in names:
+        value = row.get(name)
+        if value:
+            return str(value).strip()
+    return default
+
+
+def read_manifest(path):
+    """
+    读取清单并去重
+
+    返回:
+        (jobs, duplicates): 按清单顺序排列的任务列表（字典：key、id、person、garment、garment_type）和重复的行数
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = {}
+    duplicates = 0
+    for index, row in enumerate(rows, 1):
+        person = _column(row, PERSON_COLUMNS)
+        garment = _column(row, GARMENT_COLUMNS)
+        garment_type = _column(row, TYPE_COLUMNS, 'top').lower()
+        if not person or not garment or garment_type not in GARMENT_TYPES:
+            raise ValueError(f"清单第 {index} 条无效: {row}")
+        person, garment = [value if is_url(value) else os.path.normpath(os.path.join(base_dir, value))
+                           for value in (person, garment)]
+
+        key = pair_key(person, garment, garment_type)
+        if key in jobs:
+            duplicates += 1
+            continue
+        jobs[key] = {'key': key, 'id': _column(row, ('id',), key), 'person': person,
+                     'garment': garment, 'garment_type': garment_type}
+    return list(jobs.values()), duplicates
+
+
+class Checkpoint:
+    """
+    追加写入的检查点文件（JSONL），每行一个事件:
+        {"event": "upload", "source": 本地路径, "url": 上传后的URL}
+        {"event": "submitted" / "done" / "failed", "key": 输入对标识, "task_id": ..., ...}
+        {"event": "save_failed", "key": ..., "task_id": ..., "source_image_url": 上游结果地址}（任务成功但保存结果图片失败）
+
+    打开时按顺序回放，得到每张图片的URL和每对输入的最新状态；每个事件写入后立即fsync，
+    进程崩溃最多丢失正在写入的一行（回放时跳过）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.uploads = {}
+        self.pairs = {}
+        self._lock = threading.Lock()
+
+        complete = True
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    complete = line.endswith('\n')
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"跳过检查点中不完整的一行: {line[:80]!r}")
+        self._file = open(path, 'a', encoding='utf-8')
+        if not complete:
+            self._file.write('\n')
+
+    def _apply(self, event):
+        if event['event'] == 'upload':
+            self.uploads[event['source']] = event['url']
+        else:
+            self.pairs[event['key']] = event
+
+    def record(self, event, **fields):
+        fields = {'event': event, **fields, 'at': round(time.time(), 3)}
+        line = json.dumps(fields, ensure_ascii=False)
+        with self._lock:
+            self._apply(fields)
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def status(self, key):
+        """输入对的最新状态：done / failed / save_failed / submitted，未处理过时返回None"""
+        event = self.pairs.get(key)
+        return event['event'] if event else None
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    """进度统计：完成数、失败数、在途数、吞吐量和预计剩余时间"""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.inflight = 0
+        self.uploads = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def line(self):
+        elapsed = time.time() - self.started
+        finished = self.done + self.failed
+        rate = finished / elapsed * 60 if elapsed > 0 else 0
+        remaining = self.total - self.skipped - finished
+        eta = f"{remaining / rate:.0f} 分钟" if rate > 0 else '-'
+        return (f"[{time.strftime('%H:%M:%S')}] 已完成 {self.skipped + self.done}/{self.total}"
+                f"（本次 {self.done}，失败 {self.failed}），在途 {self.inflight}，已上传图片 {self.uploads}，"
+                f"吞吐 {rate:.1f} 对/分钟，预计剩余 {eta}")
+
+
+class Prerenderer:
+    """按清单执行试衣：上传输入 -> 提交（受配额限制）-> 等待结果 -> 保存结果图片，每一步记录到检查点"""
+
+    def __init__(self, checkpoint, progress, upload_workers, submit_retries=3, public_base_url=None):
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.submit_retries = submit_retries
+        self.public_base_url = public_base_url
+        self.storage = create_storage_backend()
+        self.client = AliyunAITryOnClient(governor=UpstreamGovernor())
+        self.result_images = ResultImageStore(self.storage, get_session('assets'))
+        self.stopping = threading.Event()
+
+        self._upload_executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix='prerender-upload')
+        self._uploads = {}
+        self._uploads_lock = threading.Lock()
+
+    def upload(self, source):
+        """
+        返回输入图片URL的Future：URL原样返回，已上传过的本地图片直接使用检查点中的URL，
+        其余在上传线程池中上传（同一文件只上传一次）
+        """
+        with self._uploads_lock:
+            future = self._uploads.get(source)
+            if future is None:
+                url = source if is_url(source) else self.checkpoint.uploads.get(source)
+                if url is not None:
+                    future = Future()
+                    future.set_result(url)
+                else:
+                    future = self._upload_executor.submit(self._upload, source)
+                self._uploads[source] = future
+            return future
+
+    def _upload(self, source):
+        with open(source, 'rb') as f:
+            upload = preprocess_upload(spool_upload(f, os.path.basename(source)))
+        try:
+            key = self.storage.store(upload)
+        finally:
+            upload.cleanup()
+        url = self.storage.url(key, base_url=self.public_base_url)
+        self.checkpoint.record('upload', source=source, url=url)
+        self.progress.add(uploads=1)
+        return url
+
+    def submit(self, job):
+        """上传输入并提交任务，配额排队超时等提交失败按退避重试，返回SubmitResult"""
+        person_url = self.upload(job['person']).result()
+        garment_url = self.upload(job['garment']).result()
+        for attempt in range(self.submit_retries + 1):
+            submitted = self.client.submit(person_url, garment_url, job['garment_type'])
+            if submitted.ok or attempt == self.submit_retries or self.stopping.is_set():
+                return submitted
+            time.sleep(min(SUBMIT_RETRY_MAX_DELAY, SUBMIT_RETRY_DELAY * (2 ** attempt)))
+
+    def save_result(self, result):
+        """将结果图片（及缩略图）保存到存储后端，返回长期有效的URL"""
+        variant = ResultImageStore.original_variant(result.image_url)
+        if self.result_images.open(result.task_id, variant, result.image_url) is None:
+            raise RuntimeError('保存结果图片失败')
+        return self.storage.url(f"{ResultImageStore.prefix}{result.task_id}.{variant}", base_url=self.public_base_url)
+
+    def finish(self, key, result):
+        """保存成功任务的结果图片；保存失败时记录save_failed（保留任务ID和上游结果地址，重试时只重新保存）"""
+        try:
+            image_url = self.save_result(result)
+        except Exception as e:
+            logger.error(f"保存任务 {result.task_id} 的结果图片失败: {e!r}")
+            self.checkpoint.record('save_failed', key=key, task_id=result.task_id, source_image_url=result.image_url,
+                                   message=str(e))
+            self.progress.add(failed=1)
+            return
+        self.checkpoint.record('done', key=key, task_id=result.task_id, image_url=image_url)
+        self.progress.add(done=1)
+
+    def run_job(self, job):
+        key = job['key']
+        result = None
+        state = self.checkpoint.pairs.get(key)
+        if state and state['event'] == 'save_failed':
+            # 任务已在上游成功，只重新保存结果图片，不重新提交付费的试衣任务
+            self.finish(key, TaskResult(state['task_id'], 'SUCCEEDED', state['source_image_url'], None, None, None))
+            return
+        if state and state['event'] == 'submitted':
+            # 上次运行已提交：继续等待原任务；上游已不认识该任务（过期）时重新提交
+            result = self.client.wait(state['task_id'])
+            if result.status == 'UNKNOWN':
+                logger.warning(f"任务 {state['task_id']} 已无法查询，重新提交")
+                result = None
+
+        if result is None:
+            submitted = self.submit(job)
+            if not submitted.ok:
+                self.checkpoint.record('failed', key=key, task_id=None, message=submitted.error)
+                self.progress.add(failed=1)
+                return
+            self.checkpoint.record('submitted', key=key, task_id=submitted.task_id)
+            result = self.client.wait(submitted.task_id)
+
+        if result.succeeded:
+            self.finish(key, result)
+        else:
+            self.checkpoint.record('failed', key=key, task_id=result.task_id, status=result.status,
+                                   code=result.code, message=result.message)
+            self.progress.add(failed=1)
+
+    def _worker(self, pending):
+        while not self.stopping.is_set():
+            try:
+                job = pending.get_nowait()
+            except queue.Empty:
+                return
+            self.progress.add(inflight=1)
+            try:
+                self.run_job(job)
+            except Exception as e:
+                # 输入文件不存在等预期内的错误只记录原因
+                logger.error(f"处理 {job['id']} 时出错: {e!r}", exc_info=not isinstance(e, OSError))
+                self.checkpoint.record('failed', key=job['key'], task_id=None, message=str(e))
+                self.progress.add(failed=1)
+            finally:
+                self.progress.add(inflight=-1)
+
+    def run(self, jobs, inflight, report_interval):
+        """用inflight个工作线程处理jobs，每report_interval秒输出一次进度"""
+        pending = queue.Queue()
+        for job in jobs:
+            pending.put(job)
+            # 尚未提交的任务提前安排上传输入，上传与在途任务重叠进行
+            if self.checkpoint.status(job['key']) not in ('submitted', 'save_failed'):
+                self.upload(job['person'])
+                self.upload(job['garment'])
+
+        workers = [threading.Thread(target=self._worker, args=(pending,), name=f'prerender-{index}', daemon=True)
+                   for index in range(inflight)]
+        for worker in workers:
+            worker.start()
+        reported = time.time()
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(0.5)
+            if time.time() - reported >= report_interval:
+                print(self.progress.line(), flush=True)
+                reported = time.time()
+        print(self.progress.line(), flush=True)
+        self.stop()
+
+    def stop(self):
+        """停止领取新的输入对，取消尚未开始的上传"""
+        self.stopping.set()
+        self._upload_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def export_results(path, jobs, checkpoint):
+    """按清单顺序导出每对输入的最终状态（JSONL）"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for job in jobs:
+            event = checkpoint.pairs.get(job['key'], {})
+            status = {'done': 'success', 'failed': 'failed', 'save_failed': 'failed'}.get(event.get('event'), 'pending')
+            f.write(json.dumps({
+                'id': job['id'], 'person': job['person'], 'garment': job['garment'],
+                'garment_type': job['garment_type'], 'status': status, 'task_id': event.get('task_id'),
+                'image_url': event.get('image_url'), 'message': event.get('message')
+            }, ensure_ascii=False) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线批量预渲染试衣结果（可断点续跑）')
+    parser.add_argument('manifest', help='清单文件（CSV或JSONL）')
+    parser.add_argument('--state', help='检查点文件，默认为 <清单>.state.jsonl')
+    parser.add_argument('--output', help='导出每对输入的最终状态和结果URL（JSONL）')
+    parser.add_argument('--inflight', type=int, default=Config.GOVERNOR_MAX_INFLIGHT, help='同时在途的最大任务数')
+    parser.add_argument('--upload-workers', type=int, default=Config.TRYON_CLIENT_CONCURRENCY, help='并行上传输入图片的线程数')
+    parser.add_argument('--submit-retries', type=int, default=3, help='提交失败（如配额排队超时）时的重试次数')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='重新处理检查点中已失败的输入对（任务已成功、只是保存结果失败的只重新保存）')
+    parser.add_argument('--public-base-url', help='使用本地存储时图片的公网访问地址（站点地址，上游需要能访问）')
+    parser.add_argument('--report-interval', type=float, default=10, help='输出进度的间隔(秒)')
+    parser.add_argument('--log-level', default='WARNING', help='日志级别')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    jobs, duplicates = read_manifest(args.manifest)
+    checkpoint = Checkpoint(args.state or f"{args.manifest}.state.jsonl")
+    finished = {'done', 'failed', 'save_failed'} if not args.retry_failed else {'done'}
+    todo = [job for job in jobs if checkpoint.status(job['key']) not in finished]
+    progress = Progress(len(jobs), len(jobs) - len(todo))
+    print(f"清单 {len(jobs) + duplicates} 条，去重后 {len(jobs)} 对，已处理 {len(jobs) - len(todo)} 对，"
+          f"待处理 {len(todo)} 对（其中 {sum(checkpoint.status(job['key']) == 'submitted' for job in todo)} 对继续等待上次提交的任务）",
+          flush=True)
+
+    prerenderer = Prerenderer(checkpoint, progress, args.upload_workers, args.submit_retries, args.public_base_url)
+    if isinstance(prerenderer.storage, LocalStorage) and not (prerenderer.storage.public_url or args.public_base_url):
+        logger.warning("使用本地存储且未配置公网地址（LOCAL_STORAGE_PUBLIC_URL / --public-base-url），上游可能无法读取上传的图片")
+
+    interrupted = False
+    try:
+        prerenderer.run(todo, max(1, args.inflight), args.report_interval)
+    except KeyboardInterrupt:
+        # 已提交的任务都已记录在检查点中，下次运行继续等待
+        prerenderer.stop()
+        interrupted = True
+        print("已中断，重新运行相同的命令即可继续", flush=True)
+    finally:
+        if args.output:
+            export_results(args.output, jobs, checkpoint)
+        checkpoint.close()
+
+    elapsed = time.time() - progress.started
+    print(f"本次完成 {progress.done} 对，失败 {progress.failed} 对，耗时 {elapsed:.0f}s"
+          f"（{(progress.done + progress.failed) / elapsed * 60 if elapsed else 0:.1f} 对/分钟）", flush=True)
+    if interrupted:
+        sys.exit(130)
+    sys.exit(1 if progress.failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from config import Config
+from utils.aliyun_client import AliyunAITryOnClient, PollingPolicy
+
+PERSON = 'https://cdn.example.com/person.jpg'
+GARMENT = 'https://cdn.example.com/garment.jpg'
+
+
+@pytest.fixture
+def polling():
+    return PollingPolicy(initial_interval=0.05, max_interval=0.1, jitter=0, timeout=5)
+
+
+def test_submit_and_wait(mock_upstream, polling):
+    client = AliyunAITryOnClient(polling=polling)
+    submitted = client.submit(PERSON, GARMENT, 'top')
+    assert submitted.ok and submitted.request_id
+
+    result = client.wait(submitted.task_id)
+    assert result.succeeded
+    assert result.task_id == submitted.task_id
+    assert f"/results/{submitted.task_id}.png" in result.image_url
+
+
+def test_failed_task(mock_upstream, polling):
+    mock_upstream.failure_rate = 1.0
+    client = AliyunAITryOnClient(polling=polling)
+    result = client.wait(client.submit(PERSON, GARMENT).task_id)
+    assert result.status == 'FAILED'
+    assert result.code == 'InternalError.Algo'
+
+
+def test_submit_many_and_wait_many(mock_upstream, polling):
+    client = AliyunAITryOnClient(polling=polling)
+    submitted = client.submit_many([(PERSON, f"https://cdn.example.com/g{n}.jpg") for n in range(4)]
+                                   + [{'person_image_url': PERSON, 'garment_image_url': GARMENT,
+                                       'garment_type': 'outfit', 'bottom_garment_image_url': GARMENT}])
+    assert all(result.ok for result in submitted)
+
+    task_ids = [result.task_id for result in submitted]
+    results = client.wait_many(task_ids + task_ids[:1], timeout=5)
+    assert list(results) == task_ids
+    assert all(result.succeeded for result in results.values())
+    assert mock_upstream.snapshot()['outfit_submits'] == 1
+
+
+def test_submit_not_retried_on_server_error(mock_upstream):
+    mock_upstream.error_rate = 1.0
+    result = AliyunAITryOnClient().submit(PERSON, GARMENT)
+    assert not result.ok and result.error
+    # 5xx可能发生在上游已经创建任务之后，提交只发一次
+    assert mock_upstream.snapshot()['submits'] == 1
+
+
+def test_submit_retried_on_throttle(mock_upstream):
+    mock_upstream.throttle_rate = 1.0
+    result = AliyunAITryOnClient().submit(PERSON, GARMENT)
+    assert not result.ok
+    assert mock_upstream.snapshot()['submits'] == Config.HTTP_MAX_RETRIES + 1
+
+
+def test_query_retried_on_server_error(mock_upstream):
+    client = AliyunAITryOnClient()
+    task_id = client.submit(PERSON, GARMENT).task_id
+    mock_upstream.error_rate = 1.0
+    assert client.get_task(task_id) is None
+    assert mock_upstream.snapshot()['queries'] == Config.HTTP_MAX_RETRIES + 1
+
+
+def test_async_client(mock_upstream, polling):
+    from utils.aliyun_client import AsyncAliyunAITryOnClient
+    from utils.async_http import close_async_clients
+
+    async def run():
+        client = AsyncAliyunAITryOnClient(polling=polling)
+        try:
+            submitted = await client.submit_many([(PERSON, GARMENT), (PERSON, f"{GARMENT}?v=2")])
+            return await client.wait_many([result.task_id for result in submitted], timeout=5)
+        finally:
+            await close_async_clients()
+
+    results = asyncio.run(run())
+    assert len(results) == 2
+    assert all(result.succeeded for result in results.values())
@@ -0,0 +1,125 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import app
+
+
+@pytest.fixture
+def job(mock_upstream):
+    """模拟存储中的一组人物和服装图片，返回jobs接口的请求体"""
+    for name in ('person.jpg', 'garment.jpg'):
+        mock_upstream.objects[f"/bucket/{name}"] = (name.encode() * 64, 'image/jpeg')
+    return {'person_image_url': f"{mock_upstream.base_url}/bucket/person.jpg",
+            'garment_image_url': f"{mock_upstream.base_url}/bucket/garment.jpg", 'garment_type': 'top'}
+
+
+def poll_status(client, task_id, timeout=5):
+    deadline = time.time() + timeout
+    while True:
+        response = client.get(f"/api/tryon/status/{task_id}")
+        if response.status_code == 200 and response.get_json()['task_status'] in ('SUCCEEDED', 'FAILED'):
+            return response
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+def test_submit_job_and_poll_status(app_client, job, mock_upstream):
+    response = app_client.post('/api/tryon/jobs', json=job)
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body['status'] == 'submitted'
+    assert body['status_url'] == f"/api/tryon/status/{body['task_id']}"
+
+    response = poll_status(app_client, body['task_id'])
+    assert response.get_json()['status'] == 'success'
+    assert response.get_json()['image_url']
+
+    # 相同输入再次提交命中结果缓存，不再提交上游
+    response = app_client.post('/api/tryon/jobs', json=job)
+    assert response.get_json()['cached'] is True
+    assert mock_upstream.snapshot()['submits'] == 1
+
+
+def test_status_etag_and_not_modified(app_client, job):
+    task_id = app_client.post('/api/tryon/jobs', json=job).get_json()['task_id']
+
+    response = app_client.get(f"/api/tryon/status/{task_id}")
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+    assert etag.startswith('W/"')
+    # 状态未变化时返回304（进行中的状态短时缓存，两次读取相同）
+    response = app_client.get(f"/api/tryon/status/{task_id}", headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+
+    response = poll_status(app_client, task_id)
+    assert response.headers['ETag'] != etag
+    assert response.headers['Cache-Control'] == f"private, max-age={app.Config.STATUS_CACHE_MAX_AGE}"
+    response = app_client.get(f"/api/tryon/status/{task_id}", headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_concurrent_identical_jobs_share_one_task(app_client, job, mock_upstream):
+    def submit(_):
+        return app_client.post('/api/tryon/jobs', json=job).get_json()['task_id']
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        task_ids = set(executor.map(submit, range(8)))
+    assert len(task_ids) == 1
+    assert mock_upstream.snapshot()['submits'] == 1
+
+
+def test_governor_busy_returns_retry_after(app_client, job, mock_upstream):
+    governor = app.get_tryon_client().governor
+    queue = governor._queue('submit')
+    # 前面有一个预计取得配额需要100秒的等待者
+    queue.service_time = 100
+    queue.push(('batch', 'other'), 1.0, lambda: None)
+    try:
+        response = app_client.post('/api/tryon/jobs', json=job)
+    finally:
+        queue.done()
+    assert response.status_code == 429
+    retry_after = math.ceil(100 - governor.max_wait)
+    assert response.headers['Retry-After'] == str(retry_after)
+    assert response.get_json()['retry_after'] == retry_after
+    assert mock_upstream.snapshot()['tasks'] == 0
+
+
+def test_direct_tryon_waits_for_result(app_client, job):
+    response = app_client.post('/api/tryon/direct', json=job)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['status'] == 'success' and body['image_url']
+
+
+@pytest.mark.parametrize('url', [
+    'http://localhost/person.jpg',
+    'http://10.0.0.1/person.jpg',
+    'ftp://cdn.example.com/person.jpg',
+])
+def test_jobs_rejects_private_urls(app_client, job, url):
+    response = app_client.post('/api/tryon/jobs', json=dict(job, person_image_url=url))
+    assert response.status_code == 400
+
+
+def test_check_direct_upload_rejects_non_canonical_keys(app_client):
+    storage = app.get_storage()
+    directory = storage.url(f"{storage.prefix}direct/")
+    name = '0' * 32 + '.jpg'
+    rejected = [
+        directory + name + '?x=1',
+        directory + 'other.jpg',
+        directory + '%30' + name[1:],
+        directory + 'sub/../' + name,
+    ]
+    for url in rejected:
+        assert app.check_direct_upload(url), url
+    # 形式正确但对象不存在
+    assert app.check_direct_upload(directory + name)
+    # 不在直传目录下的URL不检查
+    assert app.check_direct_upload(storage.url('person.jpg')) is None
+    assert app.check_direct_upload('https://cdn.example.com/direct/' + name) is None
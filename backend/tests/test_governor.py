@@ -0,0 +1,168 @@
+import time
+import asyncio
+import threading
+import pytest
+from utils.governor import (FairQueue, FileGovernorState, GovernorTimeout, LocalGovernorState, UpstreamGovernor,
+                            parse_weights, schedule)
+
+
+@pytest.fixture(params=['local', 'file'])
+def state(request, tmp_path):
+    if request.param == 'local':
+        return LocalGovernorState()
+    return FileGovernorState(str(tmp_path / 'governor.json'))
+
+
+def drain(queue, pushes):
+    """先让一个占位者占住队首，按顺序登记等待者，再逐个放行，返回放行顺序"""
+    order = []
+    queue.push(('holder', None), 1.0, lambda: None)
+    for flow, weight, name in pushes:
+        queue.push(flow, weight, lambda name=name: order.append(name))
+    for _ in range(len(pushes) + 1):
+        queue.done()
+    return order
+
+
+def test_fair_queue_single_flow_is_fifo():
+    flow = ('interactive', None)
+    assert drain(FairQueue(), [(flow, 1.0, n) for n in range(5)]) == list(range(5))
+
+
+def test_fair_queue_shares_by_weight():
+    batch = [(('batch', 'integrator'), 2.0, f"b{n}") for n in range(8)]
+    interactive = [(('interactive', 'shop'), 8.0, f"i{n}") for n in range(2)]
+    order = drain(FairQueue(), batch + interactive)
+    # 后到的在线请求只排在批量流的少数几个任务之后，批量流也没有被饿死
+    assert order.index('i1') < 3
+    assert order[-1].startswith('b')
+    assert sorted(order) == sorted(name for _, _, name in batch + interactive)
+
+
+def test_fair_queue_skips_cancelled_waiters():
+    queue = FairQueue()
+    order = []
+    queue.push(('holder', None), 1.0, lambda: None)
+    first = queue.push(('a', None), 1.0, lambda: order.append('first'))
+    second = queue.push(('a', None), 1.0, lambda: order.append('second'))
+    assert queue.depth() == 2
+    assert queue.cancel(first)
+    queue.done()
+    assert order == ['second']
+    # 已经轮到的等待者不能再取消
+    assert not queue.cancel(second)
+    assert queue.depth() == 0
+
+
+def test_parse_weights():
+    assert parse_weights('interactive=8, batch=2,bad,zero=0,neg=-1,x=y') == {'interactive': 8.0, 'batch': 2.0}
+
+
+def test_inflight_limit(state):
+    governor = UpstreamGovernor(state=state, submit_qps=100, max_inflight=2, max_wait=0.3)
+    for task_id in ('task-1', 'task-2'):
+        with governor.submit_slot() as slot:
+            slot['task_id'] = task_id
+    assert state.inflight() == 2
+
+    started = time.time()
+    with pytest.raises(GovernorTimeout):
+        with governor.submit_slot():
+            pass
+    assert 0.25 < time.time() - started < 2
+
+    governor.task_finished('task-1')
+    governor.task_finished('task-1')
+    with governor.submit_slot():
+        # 提交失败（没有绑定任务ID）时槽位自动释放
+        assert state.inflight() == 2
+    assert state.inflight() == 1
+
+
+def test_token_bucket_limits_rate(state):
+    governor = UpstreamGovernor(state=state, submit_qps=10, max_inflight=100, max_wait=5)
+    started = time.time()
+    # 突发10个之后按10 QPS放行
+    for n in range(15):
+        with governor.submit_slot() as slot:
+            slot['task_id'] = f"task-{n}"
+    assert time.time() - started >= 0.4
+
+
+def test_admit_estimates_queue_wait():
+    governor = UpstreamGovernor(state=LocalGovernorState(), submit_qps=100, max_wait=5)
+    assert governor.admit() == 0
+
+    queue = governor._queue('submit')
+    queue.service_time = 4.0
+    with schedule('batch', 'other'):
+        for _ in range(3):
+            queue.push(('batch', 'other'), 1.0, lambda: None)
+        # 前面有3个等待者，每个约4秒，可接受5秒：建议7秒后重试
+        assert governor.admit() == 7
+        assert governor.admit(max_wait=20) == 0
+
+
+def test_submit_slots_queue_across_threads_and_coroutines(state):
+    governor = UpstreamGovernor(state=state, submit_qps=100, max_inflight=1, max_wait=5)
+    order = []
+
+    def thread_worker():
+        with governor.submit_slot() as slot:
+            order.append('thread')
+            slot['task_id'] = 'task-thread'
+        time.sleep(0.1)
+        governor.task_finished('task-thread')
+
+    async def main():
+        async with governor.submit_slot_async() as slot:
+            slot['task_id'] = 'task-first'
+        thread = threading.Thread(target=thread_worker)
+        thread.start()
+        await asyncio.sleep(0.05)
+        await governor.task_finished_async('task-first')
+        # 槽位满时协程排队等待，不阻塞事件循环
+        async with governor.submit_slot_async() as slot:
+            order.append('coroutine')
+            slot['task_id'] = 'task-coroutine'
+        await asyncio.to_thread(thread.join)
+        await governor.task_finished_async('task-coroutine')
+
+    asyncio.run(main())
+    assert order == ['thread', 'coroutine']
+    assert state.inflight() == 0
+
+
+def test_cancelled_async_acquire_releases_slot(state):
+    take_token = state.take_token
+
+    def slow_take_token(*args):
+        time.sleep(0.2)
+        return take_token(*args)
+
+    state.take_token = slow_take_token
+    governor = UpstreamGovernor(state=state, submit_qps=100, max_inflight=1, max_wait=5)
+
+    async def hold():
+        async with governor.submit_slot_async():
+            await asyncio.sleep(10)
+
+    async def main():
+        # 在线程池中占用槽位和令牌期间被取消
+        task = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert state.inflight() == 0
+
+        # 持有槽位期间被取消
+        task = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.4)
+        assert state.inflight() == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert state.inflight() == 0
+
+    asyncio.run(main())
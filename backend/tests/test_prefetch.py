@@ -0,0 +1,40 @@
+import time
+from utils.prefetch import PrefetchBudget
+from utils.result_cache import DiskCacheBackend
+
+
+def test_session_budget_within_tenant_budget():
+    budget = PrefetchBudget(tenant_limit=3, session_limit=2, window=60)
+    assert budget.take('tenant', 'session-1')
+    assert budget.take('tenant', 'session-1')
+    assert not budget.take('tenant', 'session-1')
+    # 更换会话标识不能获得新的租户预算
+    assert budget.take('tenant', 'session-2')
+    assert not budget.take('tenant', 'session-3')
+    assert not budget.take('tenant')
+    # 其他租户不受影响
+    assert budget.take('other', 'session-1')
+
+
+def test_rejected_take_consumes_nothing():
+    budget = PrefetchBudget(tenant_limit=2, session_limit=1, window=60)
+    assert budget.take('tenant', 'a')
+    assert not budget.take('tenant', 'a')
+    assert budget.take('tenant', 'b')
+
+
+def test_budget_resets_after_window():
+    budget = PrefetchBudget(tenant_limit=1, session_limit=1, window=0.2)
+    assert budget.take('tenant', 'session')
+    assert not budget.take('tenant', 'session')
+    time.sleep(0.25)
+    assert budget.take('tenant', 'session')
+
+
+def test_budget_shared_through_backend(tmp_path):
+    # 磁盘后端的计数由所有worker共享
+    first = PrefetchBudget(DiskCacheBackend(str(tmp_path)), tenant_limit=2, session_limit=2, window=60)
+    second = PrefetchBudget(DiskCacheBackend(str(tmp_path)), tenant_limit=2, session_limit=2, window=60)
+    assert first.take('tenant')
+    assert second.take('tenant')
+    assert not first.take('tenant')
@@ -0,0 +1,168 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils.http_session import get_session
+from utils.result_cache import DiskCacheBackend, MemoryCacheBackend, ResultCache
+from utils.url_guard import UnsafeURLError
+
+MODEL = {'model': 'aitryon-plus', 'parameters': {}}
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryCacheBackend(max_entries=100)
+    return DiskCacheBackend(str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def images(mock_upstream):
+    """在模拟的对象存储中放入图片，返回 名称 -> URL 的函数"""
+    def put(name, content=None):
+        mock_upstream.objects[f"/bucket/{name}"] = (content or name.encode() * 64, 'image/jpeg')
+        return f"{mock_upstream.base_url}/bucket/{name}"
+    return put
+
+
+def test_backend_add_is_exclusive_until_expiry(backend):
+    assert backend.add('k', 'a', ttl=1)
+    assert not backend.add('k', 'b', ttl=1)
+    assert backend.get('k') == 'a'
+    backend.delete('k')
+    assert backend.get('k') is None
+    assert backend.add('k', 'c', ttl=1)
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    backend.get('a')
+    backend.set('c', 3)
+    assert (backend.get('a'), backend.get('b'), backend.get('c')) == (1, None, 3)
+
+
+def test_cache_key_is_content_addressed(mock_upstream, images):
+    cache = ResultCache(MemoryCacheBackend(), session=get_session('assets'))
+    person = images('person.jpg')
+    same_person = images('person-copy.jpg', b'person.jpg' * 64)
+    garment = images('garment.jpg')
+
+    key = cache.make_key(person, garment, 'top', MODEL)
+    assert cache.make_key(same_person, garment, 'top', MODEL) == key
+    assert cache.make_key(person, garment, 'bottom', MODEL) != key
+    assert cache.make_key(person, garment, 'top', {'model': 'other'}) != key
+    assert cache.make_key(person, garment, 'outfit', MODEL, bottom_garment_url=images('bottom.jpg')) != key
+    # 每个URL只下载一次，之后使用登记的哈希
+    assert mock_upstream.snapshot()['oss_gets'] == 4
+
+    cache.register_digest('https://cdn.example.com/uploaded.jpg', cache.known_digest(person))
+    assert cache.make_key('https://cdn.example.com/uploaded.jpg', garment, 'top', MODEL) == key
+
+
+def test_content_digest_refuses_private_addresses():
+    cache = ResultCache(MemoryCacheBackend(), session=get_session('assets'))
+    with pytest.raises(UnsafeURLError):
+        cache.content_digest('http://169.254.169.254/latest/meta-data')
+    with pytest.raises(UnsafeURLError):
+        cache.content_digest('http://localhost/x.jpg')
+
+
+def test_single_flight_under_concurrent_callers(backend):
+    cache = ResultCache(backend)
+    submitted = []
+
+    def submit_or_reuse():
+        with cache.lock('key'):
+            task_id, owner = cache.reserve_inflight('key')
+            if owner:
+                time.sleep(0.05)
+                task_id = f"task-{len(submitted)}"
+                submitted.append(task_id)
+                cache.set_inflight('key', task_id)
+            return task_id
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: submit_or_reuse(), range(32)))
+    assert submitted == ['task-0']
+    assert set(results) == {'task-0'}
+    assert cache.get_inflight('key') == 'task-0'
+
+
+def test_inflight_shared_across_workers(backend):
+    # 两个ResultCache共用一个后端，相当于两个worker进程
+    first, second = ResultCache(backend), ResultCache(backend)
+    assert first.reserve_inflight('key') == (None, True)
+
+    def submit():
+        time.sleep(0.3)
+        first.set_inflight('key', 'task-1')
+
+    threading.Thread(target=submit).start()
+    started = time.monotonic()
+    # 另一个worker正在提交：等待其拿到任务ID后复用
+    assert second.reserve_inflight('key') == ('task-1', False)
+    assert time.monotonic() - started >= 0.2
+
+    first.clear_inflight('key')
+    assert second.reserve_inflight('key') == (None, True)
+
+
+def test_key_lock_is_shared_by_threads_and_coroutines():
+    cache = ResultCache(MemoryCacheBackend())
+    events = []
+
+    def worker():
+        with cache.lock('key'):
+            events.append('thread-start')
+            time.sleep(0.2)
+            events.append('thread-end')
+
+    async def main():
+        thread = threading.Thread(target=worker)
+        thread.start()
+        await asyncio.sleep(0.05)
+        # 锁被线程占用时协程挂起等待，不阻塞事件循环
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        async with cache.lock_async('key'):
+            events.append('coroutine')
+        ticker.cancel()
+        thread.join()
+        return ticks
+
+    assert asyncio.run(main()) >= 5
+    assert events == ['thread-start', 'thread-end', 'coroutine']
+    # 没有等待者之后不保留该键的锁
+    assert cache._locks == {}
+
+
+def test_key_lock_cancelled_waiter_passes_the_lock_on():
+    cache = ResultCache(MemoryCacheBackend())
+
+    async def main():
+        order = []
+        async with cache.lock_async('key'):
+            cancelled = asyncio.ensure_future(cache.lock_async('key').__aenter__())
+
+            async def second():
+                async with cache.lock_async('key'):
+                    order.append('second')
+
+            waiting = asyncio.ensure_future(second())
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(waiting, 1)
+        return order
+
+    assert asyncio.run(main()) == ['second']
@@ -0,0 +1,114 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from config import Config
+from utils.status_cache import StatusCache, StatusUnavailable
+
+
+def counting_loader(status, delay=0):
+    calls = []
+
+    def load():
+        calls.append(status)
+        time.sleep(delay)
+        return {'task_status': status, 'n': len(calls)}, status
+    return load, calls
+
+
+def test_running_status_is_cached_briefly():
+    cache = StatusCache(ttl=0.1)
+    load, calls = counting_loader('RUNNING')
+    assert cache.get('task', load) == cache.get('task', load)
+    assert len(calls) == 1
+    time.sleep(0.15)
+    assert cache.get('task', load)['n'] == 2
+
+
+def test_final_status_is_kept():
+    cache = StatusCache(ttl=0.01)
+    load, calls = counting_loader('SUCCEEDED')
+    cache.get('task', load)
+    time.sleep(0.05)
+    cache.get('task', load)
+    assert len(calls) == 1
+    cache.invalidate('task')
+    cache.get('task', load)
+    assert len(calls) == 2
+
+
+def test_failed_load_is_not_cached():
+    cache = StatusCache()
+    assert cache.get('task', lambda: (None, None)) is None
+    load, calls = counting_loader('RUNNING')
+    assert cache.get('task', load)['n'] == 1
+
+
+def test_lru_eviction():
+    cache = StatusCache(max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.get(key, counting_loader('SUCCEEDED')[0])
+    load, calls = counting_loader('SUCCEEDED')
+    cache.get('a', load)
+    assert calls == ['SUCCEEDED']
+
+
+def test_concurrent_reads_are_coalesced():
+    cache = StatusCache()
+    load, calls = counting_loader('RUNNING', delay=0.2)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: cache.get('task', load), range(16)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_loader_error_reaches_waiters():
+    cache = StatusCache()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError('upstream')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        owner = executor.submit(cache.get, 'task', failing)
+        started.wait()
+        waiter = executor.submit(cache.get, 'task', failing)
+        for future in (owner, waiter):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+
+def test_coalesced_wait_times_out(monkeypatch):
+    monkeypatch.setattr(Config, 'GOVERNOR_MAX_WAIT', 0.1)
+    monkeypatch.setattr(Config, 'HTTP_CONNECT_TIMEOUT', 0)
+    monkeypatch.setattr(Config, 'HTTP_QUERY_TIMEOUT', 0)
+    cache = StatusCache()
+    load, _ = counting_loader('RUNNING', delay=0.5)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        owner = executor.submit(cache.get, 'task', load)
+        time.sleep(0.05)
+        with pytest.raises(StatusUnavailable) as excinfo:
+            cache.get('task', load)
+        assert excinfo.value.retry_after >= 1
+        assert owner.result()['task_status'] == 'RUNNING'
+
+
+def test_get_async_coalesces_with_threads():
+    cache = StatusCache()
+    load, calls = counting_loader('RUNNING', delay=0.2)
+
+    async def load_async():
+        return await asyncio.to_thread(load)
+
+    async def main():
+        thread = asyncio.ensure_future(asyncio.to_thread(cache.get, 'task', load))
+        await asyncio.sleep(0.05)
+        results = await asyncio.gather(*(cache.get_async('task', load_async) for _ in range(8)))
+        return [await thread] + results
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,125 @@
+import io
+import os
+import socket
+import ipaddress
+import pytest
+from utils import url_guard
+from utils.http_session import get_session
+from utils.storage import LocalStorage, IMMUTABLE_CACHE_CONTROL
+from utils.upload_store import spool_upload
+from utils.url_guard import UnsafeURLError, check_url, check_url_syntax, guarded_get
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(folder=str(tmp_path / 'uploads'), public_url='https://img.example.com/uploads/')
+
+
+def test_spool_upload_is_content_addressed():
+    first = spool_upload(io.BytesIO(b'image' * 1000), 'a.JPG', chunk_size=7)
+    second = spool_upload(io.BytesIO(b'image' * 1000), 'b.jpg')
+    try:
+        assert first.key == second.key
+        assert first.key.endswith('.jpg') and first.size == 5000
+    finally:
+        first.cleanup()
+        second.cleanup()
+
+
+def test_local_store_deduplicates(storage):
+    key = storage.store(spool_upload(io.BytesIO(b'image'), 'a.png'))
+    assert storage.exists(key)
+    assert storage.url(key) == f"https://img.example.com/uploads/{key}"
+    assert storage.head(key) == {'size': 5, 'content_type': 'image/png'}
+
+    # 相同内容不再写入（临时文件原样保留，由调用方清理）
+    upload = spool_upload(io.BytesIO(b'image'), 'b.png')
+    try:
+        assert storage.store(upload) == key
+        assert os.path.exists(upload.path)
+    finally:
+        upload.cleanup()
+    assert storage.head('missing.png') is None
+
+
+def test_check_upload(storage):
+    # 由浏览器直传的对象：本进程没有写入过
+    key = LocalStorage(folder=storage.folder).store(spool_upload(io.BytesIO(b'x' * 100), 'a.png'), prefix='direct/')
+    assert storage.check_upload('direct/missing.png', {'image/png'}, 1000) == '对象不存在'
+    assert storage.check_upload(key, {'image/jpeg'}, 1000).startswith('不支持的类型')
+    assert storage.check_upload(key, {'image/png'}, 10).startswith('文件太大')
+    assert storage.check_upload(key, {'image/png'}, 1000) is None
+    # 确认过的键不再检查
+    assert storage.check_upload(key, {'image/jpeg'}, 10) is None
+    assert storage.presign_upload(key, 'image/png', 1000, 60) is None
+
+
+def test_uploaded_file_is_served_with_immutable_cache(app_client):
+    import app
+    key = app.get_local_storage().store(spool_upload(io.BytesIO(b'image'), 'a.png'))
+    response = app_client.get(f"/uploads/{key}")
+    assert response.status_code == 200 and response.data == b'image'
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    response = app_client.get(f"/uploads/{key}", headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert app_client.get('/uploads/missing.png').status_code == 404
+
+
+@pytest.mark.parametrize('url', [
+    'ftp://cdn.example.com/a.jpg',
+    'http:///a.jpg',
+    'http://localhost/a.jpg',
+    'http://api.localhost/a.jpg',
+    'http://10.0.0.1/a.jpg',
+    'http://169.254.169.254/latest/meta-data',
+    'http://[::1]/a.jpg',
+    'http://[::ffff:10.0.0.1]/a.jpg',
+    'http://2130706433/a.jpg',
+    'http://0x7f.1/a.jpg',
+])
+def test_check_url_syntax_rejects(url):
+    with pytest.raises(UnsafeURLError):
+        check_url_syntax(url)
+
+
+def test_check_url_syntax_accepts_public_and_allowed_hosts():
+    check_url_syntax('https://cdn.example.com/a.jpg')
+    check_url_syntax('http://93.184.216.34/a.jpg')
+    # IMAGE_FETCH_ALLOWED_HOSTS中的主机（测试环境为模拟服务）
+    check_url_syntax('http://127.0.0.1:8080/a.jpg')
+
+
+def fake_resolver(monkeypatch, answers):
+    """将主机名按answers中依次给出的地址解析，其余主机名正常解析；返回解析次数计数"""
+    resolve = socket.getaddrinfo
+    calls = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in answers:
+            return resolve(host, port, *args, **kwargs)
+        calls.append(host)
+        address = answers[host][min(len(calls), len(answers[host])) - 1]
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (address, port))]
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    return calls
+
+
+def test_check_url_rejects_private_resolution(monkeypatch):
+    fake_resolver(monkeypatch, {'internal.example.com': ['10.1.2.3']})
+    with pytest.raises(UnsafeURLError):
+        check_url('https://internal.example.com/a.jpg')
+
+
+def test_guarded_get_pins_checked_address(monkeypatch, mock_upstream):
+    mock_upstream.objects['/bucket/a.jpg'] = (b'image', 'image/jpeg')
+    port = mock_upstream.base_url.rsplit(':', 1)[1]
+    # 检查时解析到（视为公网的）模拟服务地址，之后改为解析到内网地址
+    calls = fake_resolver(monkeypatch, {'images.example.com': ['127.0.0.1', '10.1.2.3']})
+    monkeypatch.setattr(url_guard, 'is_public_address',
+                        lambda address: address == ipaddress.ip_address('127.0.0.1'))
+
+    response = guarded_get(get_session('assets'), f"http://images.example.com:{port}/bucket/a.jpg", timeout=5)
+    assert response.status_code == 200 and response.content == b'image'
+    # 连接使用检查过的地址，没有再次解析域名
+    assert calls == ['images.example.com']
@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import threading
+import pytest
+from config import Config
+from utils.aliyun_client import AliyunAITryOnClient
+from utils.task_poller import TaskPoller
+from utils.task_store import SQLiteTaskStore, RedisTaskStore
+from utils.task_tracker import TaskTracker
+
+PERSON = 'https://cdn.example.com/person.jpg'
+GARMENT = 'https://cdn.example.com/garment.jpg'
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteTaskStore(str(tmp_path / 'tasks.db'))
+    pytest.importorskip('redis')
+    if not os.environ.get('TEST_REDIS_URL'):
+        pytest.skip('未设置TEST_REDIS_URL')
+    return RedisTaskStore(os.environ['TEST_REDIS_URL'], prefix=f"test:{tmp_path.name}:")
+
+
+def new_record(task_id, status='PENDING', updated_at=None):
+    now = time.time()
+    return {'task_id': task_id, 'task_status': status, 'image_url': None, 'message': '',
+            'submitted_at': now, 'updated_at': updated_at or now, 'meta': {'garment_type': 'top'}}
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_poller_backoff_is_capped():
+    poller = TaskPoller(lambda task_id: None, lambda task_id, result: True,
+                        initial_interval=1, max_interval=5, backoff=2, jitter=0)
+    assert [poller.next_interval(attempt) for attempt in range(5)] == [1, 2, 4, 5, 5]
+
+
+def test_poller_multiplexes_tasks():
+    queries = {}
+    finished = {}
+    lock = threading.Lock()
+
+    def query(task_id):
+        with lock:
+            queries[task_id] = queries.get(task_id, 0) + 1
+            return {'output': {'task_status': 'SUCCEEDED' if queries[task_id] >= 3 else 'RUNNING'}}
+
+    def on_result(task_id, result):
+        done = result['output']['task_status'] == 'SUCCEEDED'
+        if done:
+            finished[task_id] = threading.current_thread().name
+        return done
+
+    poller = TaskPoller(query, on_result, initial_interval=0.01, max_interval=0.02, jitter=0, max_qps=1000)
+    for n in range(20):
+        poller.schedule(f"task-{n}")
+    assert wait_until(lambda: len(finished) == 20)
+    assert all(count == 3 for count in queries.values())
+    assert poller.requests_sent == 60
+    # 同步回调在线程池中执行，不占用调度协程所在的线程
+    assert all(name.startswith('tryon-poll') for name in finished.values())
+
+
+def test_poller_slow_callback_does_not_delay_other_tasks():
+    finished = []
+
+    def on_result(task_id, result):
+        finished.append((task_id, time.time()))
+        if task_id == 'slow':
+            time.sleep(1)
+        return True
+
+    poller = TaskPoller(lambda task_id: {}, on_result, initial_interval=0.01, jitter=0, concurrency=4)
+    started = time.time()
+    poller.schedule('slow', delay=0)
+    poller.schedule('fast', delay=0.1)
+    assert wait_until(lambda: len(finished) == 2)
+    assert dict(finished)['fast'] - started < 0.5
+
+
+def test_track_poll_finish_with_listeners(mock_upstream, store):
+    client = AliyunAITryOnClient()
+    tracker = TaskTracker(client, store=store)
+    finished = []
+    tracker.add_listener(finished.append)
+
+    task_id = client.submit(PERSON, GARMENT).task_id
+    record = tracker.track(task_id, inputs_hash='inputs', garment_type='top')
+    assert record['task_status'] == 'PENDING'
+    # 重复登记返回已有记录，不会重复轮询
+    assert tracker.track(task_id)['task_id'] == task_id
+
+    record = tracker.wait(task_id, timeout=5)
+    assert record['task_status'] == 'SUCCEEDED'
+    assert record['image_url'].split('?')[0].endswith(f"/results/{task_id}.png")
+    assert record['meta'] == {'garment_type': 'top'}
+
+    assert wait_until(lambda: finished)
+    assert [r['task_id'] for r in finished] == [task_id]
+    assert finished[0]['task_status'] == 'SUCCEEDED'
+    stored = store.get(task_id)
+    assert stored['task_status'] == 'SUCCEEDED' and stored['image_url'] == record['image_url']
+    assert tracker.pending_count() == 0
+
+
+def test_wait_for_change_reports_each_status(mock_upstream):
+    client = AliyunAITryOnClient()
+    tracker = TaskTracker(client)
+    task_id = client.submit(PERSON, GARMENT).task_id
+    tracker.track(task_id)
+
+    seen = ['PENDING']
+    while seen[-1] not in ('SUCCEEDED', 'FAILED'):
+        record = tracker.wait_for_change(task_id, seen[-1], timeout=5)
+        assert record['task_status'] != seen[-1]
+        seen.append(record['task_status'])
+    assert seen == ['PENDING', 'RUNNING', 'SUCCEEDED']
+
+
+def test_wait_async(mock_upstream):
+    client = AliyunAITryOnClient()
+    tracker = TaskTracker(client)
+    task_ids = [client.submit(PERSON, f"{GARMENT}?n={n}").task_id for n in range(3)]
+    for task_id in task_ids:
+        tracker.track(task_id)
+
+    async def wait_all():
+        return await asyncio.gather(*(tracker.wait_async(task_id, timeout=5) for task_id in task_ids))
+
+    records = asyncio.run(wait_all())
+    assert [record['task_status'] for record in records] == ['SUCCEEDED'] * 3
+
+
+def test_lease_handoff_between_workers(store):
+    record = new_record('task-1')
+    assert store.create(record, 'inputs', 'worker-a', lease=0.2)
+    assert not store.create(record, 'inputs', 'worker-b', lease=0.2)
+
+    # 租约有效期内其他worker不能接管
+    assert store.claim('task-1', 'worker-b', lease=5) is None
+    assert store.claim_orphans('worker-b', lease=5) == []
+    # 持有者续租后仍然有效
+    store.renew(['task-1'], 'worker-a', lease=0.3)
+    time.sleep(0.2)
+    assert store.claim_orphans('worker-b', lease=5) == []
+
+    time.sleep(0.2)
+    claimed = store.claim_orphans('worker-b', lease=5)
+    assert [r['task_id'] for r in claimed] == ['task-1']
+
+    # 暂停后恢复的原持有者不能再写入
+    running = dict(record, task_status='RUNNING', updated_at=time.time())
+    assert store.update(running, 'worker-a', lease=5) is False
+    assert store.update(running, 'worker-b', lease=5) is True
+
+    # 结束后释放租约，不再被接管或改写
+    done = dict(running, task_status='SUCCEEDED', image_url='https://cdn.example.com/r.png')
+    assert store.update(done, 'worker-b', lease=5) is True
+    assert store.claim('task-1', 'worker-a', lease=5) is None
+    assert store.update(dict(done, task_status='FAILED'), 'worker-b', lease=5) is False
+    assert store.get('task-1')['task_status'] == 'SUCCEEDED'
+
+
+def test_tracker_resumes_orphaned_task(mock_upstream, store):
+    client = AliyunAITryOnClient()
+    task_id = client.submit(PERSON, GARMENT).task_id
+    # 提交该任务的worker已退出，租约过期
+    store.create(new_record(task_id), 'inputs', 'dead-worker', lease=-1)
+
+    tracker = TaskTracker(client, store=store)
+    assert tracker.resume() == 1
+    assert tracker.wait(task_id, timeout=5)['task_status'] == 'SUCCEEDED'
+    # 等待者先被唤醒，随后写入登记表
+    assert wait_until(lambda: store.get(task_id)['task_status'] == 'SUCCEEDED')
+
+
+def test_waiter_takes_over_stalled_worker(mock_upstream, store, monkeypatch):
+    monkeypatch.setattr(Config, 'TASK_STORE_POLL_INTERVAL', 0.05)
+    client = AliyunAITryOnClient()
+    task_id = client.submit(PERSON, GARMENT).task_id
+    # 另一个worker持有租约但长时间没有更新状态
+    store.create(new_record(task_id, updated_at=time.time() - 60), 'inputs', 'stalled-worker', lease=0.1)
+
+    tracker = TaskTracker(client, store=store)
+    tracker.lease = 1
+    assert tracker.get(task_id)['task_status'] == 'PENDING'
+    assert tracker.wait(task_id, timeout=5)['task_status'] == 'SUCCEEDED'
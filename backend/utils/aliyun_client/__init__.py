@@ -0,0 +1,34 @@
+"""
+阿里云AI试衣（DashScope aitryon-plus）客户端
+
+同步客户端（requests长连接会话）和异步客户端（httpx，需要安装 requirements-asgi.txt）共用
+请求体构建、任务状态定义和等待任务结束的状态机，查询结果以类型化对象返回。
+除Web服务外，也可以在离线批处理脚本中直接使用（在backend目录下运行）:
+
+    from utils.aliyun_client import AliyunAITryOnClient
+
+    client = AliyunAITryOnClient()
+    submitted = client.submit_many([(person_url, garment_url, 'top'), ...])
+    results = client.wait_many(s.task_id for s in submitted if s.ok)
+    for task_id, result in results.items():
+        print(task_id, result.status, result.image_url)
+
+AsyncAliyunAITryOnClient 提供相同的接口（各方法为协程），首次访问时才导入httpx
+"""
+from utils.aliyun_client.states import IN_PROGRESS_STATES, TERMINAL_STATES
+from utils.aliyun_client.models import SubmitResult, TaskResult, TryOnRequest
+from utils.aliyun_client.polling import PollingPolicy, TaskWatch
+from utils.aliyun_client.sync import AliyunAITryOnClient
+
+__all__ = [
+    'AliyunAITryOnClient', 'AsyncAliyunAITryOnClient', 'IN_PROGRESS_STATES', 'PollingPolicy',
+    'SubmitResult', 'TERMINAL_STATES', 'TaskResult', 'TaskWatch', 'TryOnRequest'
+]
+
+
+def __getattr__(name):
+    # httpx是可选依赖，只有使用异步客户端时才需要
+    if name == 'AsyncAliyunAITryOnClient':
+        from utils.aliyun_client.aio import AsyncAliyunAITryOnClient
+        return AsyncAliyunAITryOnClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+import httpx
+from config import Config
+from utils import tracing
+from utils.async_http import get_async_client, request_with_retry
+from utils.governor import GovernorTimeout
+from utils.aliyun_client.base import BaseTryOnClient
+from utils.aliyun_client.models import SubmitResult, TaskResult, TryOnRequest
+from utils.aliyun_client.polling import TaskWatch
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAliyunAITryOnClient(BaseTryOnClient):
+    """
+    阿里云AI试衣客户端（asyncio，需要安装httpx）
+
+    接口与同步客户端一致：请求通过当前事件循环共享的httpx连接池发出（utils.async_http），
+    等待任务结束使用同一个状态机（TaskWatch），排队等待配额和两次查询之间都不占用线程
+    """
+
+    @asynccontextmanager
+    async def _submit_slot(self):
+        if self.governor is None:
+            yield {'task_id': None}
+            return
+        async with self.governor.submit_slot_async() as slot:
+            yield slot
+
+    @asynccontextmanager
+    async def _query_slot(self):
+        if self.governor is None:
+            yield
+            return
+        async with self.governor.query_slot_async():
+            yield
+
+    async def submit(self, person_image_url, garment_image_url, garment_type="top", bottom_garment_image_url=None):
+        """提交试衣任务，返回SubmitResult（见同步客户端的submit）"""
+        payload = self.build_payload(person_image_url, garment_image_url, garment_type, bottom_garment_image_url)
+        try:
+            logger.info("提交试衣任务: %s + %s (%s)", person_image_url, garment_image_url, garment_type)
+            logger.debug("请求体: %s", payload)
+
+            async with self._submit_slot() as slot:
+                with tracing.stage('submit', model=self.model, garment_type=garment_type) as span:
+                    response = await request_with_retry(get_async_client('dashscope'), 'POST', self.submit_url,
+                                                        headers=self.submit_headers(), json=payload)
+                    span['http.status_code'] = response.status_code
+                response.raise_for_status()
+                result = self._submitted(response.json())
+                slot['task_id'] = result.task_id
+            return result
+
+        except GovernorTimeout as e:
+            logger.error(f"提交试衣任务时{e}")
+            return SubmitResult.failed(str(e))
+        except httpx.HTTPError as e:
+            logger.error(f"提交试衣任务时请求出错: {e!r}")
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"响应内容: {e.response.text}")
+            return SubmitResult.failed(repr(e))
+        except Exception as e:
+            logger.error(f"提交试衣任务时发生未知错误: {e}")
+            return SubmitResult.failed(str(e))
+
+    async def query_task_status(self, task_id):
+        """查询任务状态，返回上游的原始响应，查询失败时返回None"""
+        try:
+            async with self._query_slot():
+                response = await request_with_retry(
+                    get_async_client('dashscope'), 'GET', self.query_url_template.format(task_id),
+                    headers=self.query_headers(),
+                    timeout=httpx.Timeout(Config.HTTP_QUERY_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+                )
+            response.raise_for_status()
+            result = response.json()
+            logger.info("查询任务状态: %s -> %s", task_id, result.get('output', {}).get('task_status'),
+                        extra={'task_id': task_id, 'sample_key': task_id})
+            logger.debug("任务状态响应: %s", result, extra={'task_id': task_id, 'sample_key': task_id})
+            return result
+        except GovernorTimeout as e:
+            logger.error(f"查询任务状态时{e}")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"查询任务状态时出错: {e!r}")
+            return None
+
+    async def get_task(self, task_id):
+        """查询任务状态，返回TaskResult，查询失败时返回None"""
+        result = await self.query_task_status(task_id)
+        return TaskResult.from_response(task_id, result) if result else None
+
+    async def wait(self, task_id, timeout=None, polling=None):
+        """等待任务结束，返回最终的TaskResult，等待超时时状态为UNKNOWN"""
+        return await self._wait(task_id, timeout, polling or self.polling, None)
+
+    async def _wait(self, task_id, timeout, polling, semaphore):
+        watch = TaskWatch(task_id, polling, timeout)
+        while True:
+            await asyncio.sleep(watch.delay())
+            if semaphore is None:
+                response = await self.query_task_status(task_id)
+            else:
+                async with semaphore:
+                    response = await self.query_task_status(task_id)
+            result = watch.advance(response)
+            if result is not None:
+                # 释放槽位要访问配额状态后端（文件锁 / redis），不在事件循环中阻塞执行
+                if self.governor is not None and result.finished:
+                    await self.governor.task_finished_async(result.task_id)
+                return self._finished(result, released=True)
+
+    async def submit_many(self, items, concurrency=None):
+        """批量提交试衣任务，返回与输入顺序一致的SubmitResult列表"""
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def submit(item):
+            async with semaphore:
+                return await self.submit(item.person_image_url, item.garment_image_url, item.garment_type,
+                                         item.bottom_garment_image_url)
+
+        return list(await asyncio.gather(*(submit(TryOnRequest.coerce(item)) for item in items)))
+
+    async def wait_many(self, task_ids, timeout=None, concurrency=None):
+        """
+        等待一批任务结束
+
+        每个任务是一个按退避间隔查询的协程，同时进行的查询数不超过concurrency
+
+        返回:
+            dict: 任务ID -> TaskResult，与输入顺序一致
+        """
+        task_ids = list(dict.fromkeys(task_id for task_id in task_ids if task_id))
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+        results = await asyncio.gather(*(self._wait(task_id, timeout, self.polling, semaphore) for task_id in task_ids))
+        return dict(zip(task_ids, results))
+
+    async def submit_tryon_task(self, person_image_url, garment_image_url, garment_type="top", bottom_garment_image_url=None):
+        """提交试衣任务（兼容旧接口），返回任务ID，失败时返回None"""
+        return (await self.submit(person_image_url, garment_image_url, garment_type, bottom_garment_image_url)).task_id
@@ -0,0 +1,87 @@
+import logging
+from config import Config
+from utils.aliyun_client.models import SubmitResult
+from utils.aliyun_client.polling import PollingPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class BaseTryOnClient:
+    """同步/异步客户端共用的部分：接口地址、鉴权、请求体、提交响应解析和在途槽位的释放"""
+
+    def __init__(self, api_key=None, base_url=None, governor=None, polling=None, concurrency=None):
+        """
+        参数:
+            api_key: DashScope API密钥，默认使用 DASHSCOPE_API_KEY
+            base_url: DashScope服务地址，默认使用 DASHSCOPE_BASE_URL
+            governor: 上游配额调节器（utils.governor.UpstreamGovernor），None表示不限制
+            polling: 等待任务结束时的查询节奏（PollingPolicy）
+            concurrency: submit_many / wait_many 同时进行的最大请求数
+        """
+        self.api_key = api_key or Config.DASHSCOPE_API_KEY
+        base_url = (base_url or Config.DASHSCOPE_BASE_URL).rstrip('/')
+        self.submit_url = f'{base_url}/api/v1/services/aigc/image2image/image-synthesis'
+        self.query_url_template = f'{base_url}/api/v1/tasks/{{}}'
+        self.governor = governor
+        self.polling = polling or PollingPolicy()
+        self.concurrency = concurrency or Config.TRYON_CLIENT_CONCURRENCY
+        # 模型及参数（同时作为结果缓存键的一部分）
+        self.model = 'aitryon-plus'
+        self.parameters = {
+            "resolution": -1,
+            "restore_face": True
+        }
+        # 模型能否在一次提交中同时试穿上装和下装（garment_type="outfit"），不能时由服务端分两步提交
+        self.supports_outfit = Config.TRYON_OUTFIT_MODE == 'single'
+
+    def submit_headers(self):
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+            "X-DashScope-Async": "enable"
+        }
+
+    def query_headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def build_payload(self, person_image_url, garment_image_url, garment_type="top", bottom_garment_image_url=None):
+        """构建提交试衣任务的请求体"""
+        payload = {
+            "model": self.model,
+            "input": {
+                "person_image_url": person_image_url,
+            },
+            "parameters": dict(self.parameters)
+        }
+
+        # 根据服装类型设置不同的输入字段（连衣裙作为上装提交，不设置下装；整套搭配同时设置上装和下装）
+        if garment_type == "top":
+            payload["input"]["top_garment_url"] = garment_image_url
+        elif garment_type == "bottom":
+            payload["input"]["bottom_garment_url"] = garment_image_url
+        elif garment_type == "dress":
+            payload["input"]["top_garment_url"] = garment_image_url
+        elif garment_type == "outfit":
+            payload["input"]["top_garment_url"] = garment_image_url
+            payload["input"]["bottom_garment_url"] = bottom_garment_image_url
+        return payload
+
+    def _submitted(self, result):
+        """解析提交接口的响应"""
+        logger.debug("阿里云响应: %s", result)
+        task_id = result.get('output', {}).get('task_id')
+        if task_id:
+            logger.info("任务提交成功，任务ID: %s，request_id: %s", task_id, result.get('request_id'))
+            return SubmitResult(task_id, result.get('request_id'), None)
+        logger.error(f"响应中未找到task_id: {result}")
+        return SubmitResult(None, result.get('request_id'), '响应中未找到task_id')
+
+    def _finished(self, result, released=False):
+        """等待到任务结束后释放其在途槽位（调节器的task_finished可重复调用；released表示调用方已经释放）"""
+        if self.governor is not None and result.finished and not released:
+            self.governor.task_finished(result.task_id)
+        if result.succeeded:
+            logger.info(f"任务 {result.task_id} 完成")
+        elif result.status == 'FAILED':
+            logger.error(f"任务 {result.task_id} 失败: {result.message or '未知错误'}")
+        return result
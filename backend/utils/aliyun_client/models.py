@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from utils.aliyun_client.states import TERMINAL_STATES
+
+
+@dataclass(init=False)
+class TryOnRequest:
+    """一次试衣的输入（garment_type为 "outfit" 时garment_image_url为上装，bottom_garment_image_url为下装）"""
+    __slots__ = ('person_image_url', 'garment_image_url', 'garment_type', 'bottom_garment_image_url')
+    person_image_url: str
+    garment_image_url: str
+    garment_type: str
+    bottom_garment_image_url: str
+
+    def __init__(self, person_image_url, garment_image_url, garment_type='top', bottom_garment_image_url=None):
+        self.person_image_url = person_image_url
+        self.garment_image_url = garment_image_url
+        self.garment_type = garment_type
+        self.bottom_garment_image_url = bottom_garment_image_url
+
+    @classmethod
+    def coerce(cls, item):
+        """接受TryOnRequest、(人物URL, 服装URL[, 服装类型[, 下装URL]]) 元组或同名字段的字典"""
+        if isinstance(item, cls):
+            return item
+        if isinstance(item, dict):
+            return cls(item['person_image_url'], item['garment_image_url'], item.get('garment_type', 'top'),
+                       item.get('bottom_garment_image_url'))
+        return cls(*item)
+
+
+@dataclass
+class SubmitResult:
+    """提交结果：成功时task_id非空，失败时error为错误说明"""
+    __slots__ = ('task_id', 'request_id', 'error')
+    task_id: str
+    request_id: str
+    error: str
+
+    @property
+    def ok(self):
+        return bool(self.task_id)
+
+    @classmethod
+    def failed(cls, error):
+        return cls(None, None, error)
+
+
+@dataclass
+class TaskResult:
+    """
+    一次任务状态查询（或等待结束）的结果
+
+    raw为上游返回的原始响应，查询失败或本地等待超时时为None
+    """
+    __slots__ = ('task_id', 'status', 'image_url', 'code', 'message', 'raw')
+    task_id: str
+    status: str
+    image_url: str
+    code: str
+    message: str
+    raw: dict
+
+    @classmethod
+    def from_response(cls, task_id, response):
+        output = response.get('output', {})
+        return cls(output.get('task_id') or task_id, output.get('task_status') or 'UNKNOWN',
+                   output.get('image_url'), output.get('code'), output.get('message'), response)
+
+    @classmethod
+    def timed_out(cls, task_id, last=None):
+        """本地等待超时：状态记为UNKNOWN，保留最后一次查询到的原始响应"""
+        return cls(task_id, 'UNKNOWN', None, None, '任务超时', last.raw if last else None)
+
+    @property
+    def succeeded(self):
+        return self.status == 'SUCCEEDED'
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATES
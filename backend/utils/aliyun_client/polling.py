@@ -0,0 +1,92 @@
+import time
+import random
+import logging
+from config import Config
+from utils.aliyun_client.models import TaskResult
+from utils.aliyun_client.states import IN_PROGRESS_STATES
+
+logger = logging.getLogger(__name__)
+
+
+class PollingPolicy:
+    """等待任务结束时的查询节奏：先密后疏的指数退避 + 随机抖动，默认值与共享轮询调度器一致"""
+
+    __slots__ = ('initial_interval', 'max_interval', 'backoff', 'jitter', 'timeout', 'max_attempts')
+
+    def __init__(self, initial_interval=None, max_interval=None, backoff=None, jitter=None,
+                 timeout=None, max_attempts=None):
+        """
+        参数:
+            initial_interval: 首次查询前的等待时间(秒)
+            max_interval: 退避后的最大查询间隔(秒)
+            backoff: 每次查询后间隔的增长倍数（1表示固定间隔）
+            jitter: 随机抖动比例 (0.2 表示 ±20%)
+            timeout: 最长等待时间(秒)，超过后结果记为UNKNOWN
+            max_attempts: 最大查询次数，None表示只受timeout限制
+        """
+        self.initial_interval = Config.TASK_POLL_INITIAL_INTERVAL if initial_interval is None else initial_interval
+        self.max_interval = Config.TASK_POLL_MAX_INTERVAL if max_interval is None else max_interval
+        self.backoff = Config.TASK_POLL_BACKOFF if backoff is None else backoff
+        self.jitter = Config.TASK_POLL_JITTER if jitter is None else jitter
+        self.timeout = Config.TASK_MAX_WAIT if timeout is None else timeout
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def fixed(cls, interval, max_attempts):
+        """固定间隔、固定次数（旧版 wait_for_task_completion 的行为）"""
+        return cls(initial_interval=interval, max_interval=interval, backoff=1, jitter=0,
+                   timeout=interval * (max_attempts + 1), max_attempts=max_attempts)
+
+    def interval(self, attempt):
+        """计算第attempt次查询之后的等待时间"""
+        interval = min(self.max_interval, self.initial_interval * (self.backoff ** attempt))
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return interval
+
+
+class TaskWatch:
+    """
+    单个任务的等待状态机，同步和异步客户端共用
+
+    调用方负责发出查询和等待，每次查询后把响应交给advance()：
+    任务结束或等待超时时得到最终结果，否则按delay()等待后再次查询
+    """
+
+    __slots__ = ('task_id', 'policy', 'deadline', 'attempts', 'last')
+
+    def __init__(self, task_id, policy, timeout=None):
+        self.task_id = task_id
+        self.policy = policy
+        self.deadline = time.monotonic() + (policy.timeout if timeout is None else timeout)
+        self.attempts = 0
+        self.last = None
+
+    def advance(self, response):
+        """
+        记录一次查询结果
+
+        参数:
+            response: 上游的原始响应，查询失败时为None（不改变状态，继续等待）
+
+        返回:
+            TaskResult: 任务已结束或等待超时时返回最终结果，否则返回None
+        """
+        self.attempts += 1
+        if response:
+            result = TaskResult.from_response(self.task_id, response)
+            if result.finished:
+                return result
+            if result.status not in IN_PROGRESS_STATES:
+                logger.warning(f"任务 {self.task_id} 未知的任务状态: {result.status}")
+            self.last = result
+
+        if time.monotonic() >= self.deadline or (
+                self.policy.max_attempts is not None and self.attempts >= self.policy.max_attempts):
+            logger.error(f"任务 {self.task_id} 在 {self.attempts} 次查询后仍未完成")
+            return TaskResult.timed_out(self.task_id, self.last)
+        return None
+
+    def delay(self):
+        """下次查询前的等待时间（首次查询前为initial_interval，不超过剩余的等待时间）"""
+        return max(0.0, min(self.policy.interval(self.attempts), self.deadline - time.monotonic()))
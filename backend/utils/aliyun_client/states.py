@@ -0,0 +1,12 @@
+"""
+DashScope异步任务的状态
+
+同步/异步客户端、任务跟踪器和任务登记表共用同一组状态定义，
+避免各处对“哪些状态仍在处理中”的判断不一致
+"""
+
+# 排队或处理中（PRE-PROCESSING / POST-PROCESSING 为试衣模型的前后处理阶段）
+IN_PROGRESS_STATES = frozenset({'PENDING', 'PRE-PROCESSING', 'RUNNING', 'POST-PROCESSING'})
+
+# 已结束：UNKNOWN 表示上游已不认识该任务（不存在或已过期），或本地等待超时
+TERMINAL_STATES = frozenset({'SUCCEEDED', 'FAILED', 'CANCELED', 'UNKNOWN'})
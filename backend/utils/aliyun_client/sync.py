@@ -0,0 +1,264 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+import requests
+from config import Config
+from utils import tracing
+from utils.http_session import get_session
+from utils.governor import GovernorTimeout
+from utils.task_poller import TaskPoller
+from utils.aliyun_client.base import BaseTryOnClient
+from utils.aliyun_client.models import SubmitResult, TaskResult, TryOnRequest
+from utils.aliyun_client.polling import PollingPolicy, TaskWatch
+
+logger = logging.getLogger(__name__)
+
+
+class AliyunAITryOnClient(BaseTryOnClient):
+    """
+    阿里云AI试衣客户端（同步）
+
+    提交/查询复用进程内共享的长连接会话；配置了调节器时，请求先排队获取上游配额。
+    submit / get_task / wait 返回类型化的结果对象，submit_many / wait_many 用于离线批量处理：
+    批量等待由一个共享轮询调度器统一查询，不为每个任务占用线程。
+    """
+
+    def __init__(self, api_key=None, session=None, governor=None, polling=None, concurrency=None, base_url=None):
+        super().__init__(api_key=api_key, base_url=base_url, governor=governor, polling=polling, concurrency=concurrency)
+        # 进程内共享的长连接会话，避免每次提交/轮询都重新建立TCP+TLS连接
+        self.session = session or get_session('dashscope')
+
+        # wait_many 使用的轮询调度器（首次使用时创建）；等待中的任务 -> (TaskWatch, 各调用方的Future列表)
+        self._poller = None
+        self._watches = {}
+        self._changed = threading.Condition()
+
+    @contextmanager
+    def _submit_slot(self):
+        if self.governor is None:
+            yield {'task_id': None}
+            return
+        with self.governor.submit_slot() as slot:
+            yield slot
+
+    @contextmanager
+    def _query_slot(self):
+        if self.governor is None:
+            yield
+            return
+        with self.governor.query_slot():
+            yield
+
+    def submit(self, person_image_url, garment_image_url, garment_type="top", bottom_garment_image_url=None):
+        """
+        提交试衣任务到阿里云AI试衣Plus API
+
+        参数:
+            person_image_url: 人物图像的URL
+            garment_image_url: 服装图像的URL
+            garment_type: 服装类型 ("top", "bottom", "dress", "outfit")
+            bottom_garment_image_url: 整套搭配（"outfit"）的下装图像URL，garment_image_url为上装
+
+        返回:
+            SubmitResult: 成功时task_id非空，失败时error为错误说明
+        """
+        payload = self.build_payload(person_image_url, garment_image_url, garment_type, bottom_garment_image_url)
+
+        try:
+            logger.info("提交试衣任务: %s + %s (%s)", person_image_url, garment_image_url, garment_type)
+            # 请求头含API密钥，不记录；请求体和响应只在DEBUG级别记录（参数在日志线程中才格式化）
+            logger.debug("请求体: %s", payload)
+
+            # 排队获取提交配额和在途任务槽位，提交成功后槽位绑定到任务ID
+            with self._submit_slot() as slot:
+                # 只统计HTTP往返时间，排队等待配额的时间由调节器的指标单独统计
+                with tracing.stage('submit', model=self.model, garment_type=garment_type) as span:
+                    response = self.session.post(self.submit_url, headers=self.submit_headers(), json=payload,
+                                                 timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT))
+                    span['http.status_code'] = response.status_code
+                response.raise_for_status()
+                result = self._submitted(response.json())
+                slot['task_id'] = result.task_id
+            return result
+
+        except GovernorTimeout as e:
+            logger.error(f"提交试衣任务时{e}")
+            return SubmitResult.failed(str(e))
+        except requests.exceptions.RequestException as e:
+            logger.error(f"提交试衣任务时请求出错: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"响应内容: {e.response.text}")
+            return SubmitResult.failed(str(e))
+        except Exception as e:
+            logger.error(f"提交试衣任务时发生未知错误: {e}")
+            return SubmitResult.failed(str(e))
+
+    def query_task_status(self, task_id):
+        """
+        查询任务状态
+
+        参数:
+            task_id: 任务ID
+
+        返回:
+            dict: 上游返回的原始响应，查询失败时为None
+        """
+        query_url = self.query_url_template.format(task_id)
+
+        try:
+            with self._query_slot():
+                response = self.session.get(query_url, headers=self.query_headers(),
+                                            timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_QUERY_TIMEOUT))
+            response.raise_for_status()
+            result = response.json()
+            # 轮询日志量大：按任务采样（LOG_POLL_SAMPLE_RATE），状态变化由任务跟踪器单独记录
+            logger.info("查询任务状态: %s -> %s", task_id, result.get('output', {}).get('task_status'),
+                        extra={'task_id': task_id, 'sample_key': task_id})
+            logger.debug("任务状态响应: %s", result, extra={'task_id': task_id, 'sample_key': task_id})
+            return result
+        except GovernorTimeout as e:
+            logger.error(f"查询任务状态时{e}")
+            return None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"查询任务状态时出错: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"响应内容: {e.response.text}")
+            return None
+
+    def get_task(self, task_id):
+        """查询任务状态，返回TaskResult，查询失败时返回None"""
+        result = self.query_task_status(task_id)
+        return TaskResult.from_response(task_id, result) if result else None
+
+    def wait(self, task_id, timeout=None, polling=None):
+        """
+        等待任务结束
+
+        参数:
+            task_id: 任务ID
+            timeout: 最长等待时间(秒)，默认使用查询节奏中的timeout
+            polling: 本次等待使用的查询节奏，默认使用客户端的配置
+
+        返回:
+            TaskResult: 最终结果，等待超时时状态为UNKNOWN
+        """
+        watch = TaskWatch(task_id, polling or self.polling, timeout)
+        while True:
+            time.sleep(watch.delay())
+            result = watch.advance(self.query_task_status(task_id))
+            if result is not None:
+                return self._finished(result)
+
+    def submit_many(self, items, concurrency=None):
+        """
+        批量提交试衣任务
+
+        参数:
+            items: TryOnRequest、(人物URL, 服装URL[, 服装类型]) 元组或字典的序列
+            concurrency: 同时进行的最大提交数，默认使用客户端的配置
+
+        返回:
+            list[SubmitResult]: 与输入顺序一致
+        """
+        items = [TryOnRequest.coerce(item) for item in items]
+        with ThreadPoolExecutor(max_workers=concurrency or self.concurrency, thread_name_prefix='tryon-submit') as executor:
+            # 复制调用方的上下文，提交线程沿用其trace id和配额调度的优先级类别、租户
+            futures = [executor.submit(contextvars.copy_context().run, self.submit, item.person_image_url,
+                                       item.garment_image_url, item.garment_type, item.bottom_garment_image_url)
+                       for item in items]
+            return [future.result() for future in futures]
+
+    def wait_many(self, task_ids, timeout=None):
+        """
+        等待一批任务结束
+
+        所有任务交给同一个轮询调度器按退避间隔统一查询（限制总QPS和并发），调用线程只等待结果。
+        多个调用方等待同一个任务时共用一次轮询，每个调用方各自得到结果。
+
+        参数:
+            task_ids: 任务ID序列
+            timeout: 每个任务的最长等待时间(秒)，默认使用查询节奏中的timeout
+
+        返回:
+            dict: 任务ID -> TaskResult，与输入顺序一致；超过等待时间仍未结束的任务状态为UNKNOWN
+        """
+        task_ids = list(dict.fromkeys(task_id for task_id in task_ids if task_id))
+        wait_timeout = self.polling.timeout if timeout is None else timeout
+        poller = self._get_poller()
+        futures = {}
+        scheduled = []
+        with self._changed:
+            for task_id in task_ids:
+                entry = self._watches.get(task_id)
+                if entry is None:
+                    entry = self._watches[task_id] = (TaskWatch(task_id, self.polling, timeout), [])
+                    scheduled.append(task_id)
+                futures[task_id] = Future()
+                entry[1].append(futures[task_id])
+        for task_id in scheduled:
+            poller.schedule(task_id)
+
+        # 轮询调度器在每个任务的等待时间到达后给出超时结果，这里多留一个查询间隔和查询请求的时间
+        wait_futures(futures.values(), timeout=wait_timeout + self.polling.max_interval + Config.HTTP_QUERY_TIMEOUT)
+        results = {}
+        with self._changed:
+            for task_id, future in futures.items():
+                if future.done():
+                    results[task_id] = future.result()
+                    continue
+                results[task_id] = TaskResult.timed_out(task_id)
+                entry = self._watches.get(task_id)
+                if entry is not None and future in entry[1]:
+                    entry[1].remove(future)
+                    # 没有其他调用方等待时停止轮询
+                    if not entry[1]:
+                        del self._watches[task_id]
+        return results
+
+    def _get_poller(self):
+        if self._poller is None:
+            with self._changed:
+                if self._poller is None:
+                    policy = self.polling
+                    self._poller = TaskPoller(self.query_task_status, self._on_poll,
+                                              initial_interval=policy.initial_interval, max_interval=policy.max_interval,
+                                              backoff=policy.backoff, jitter=policy.jitter, concurrency=self.concurrency)
+        return self._poller
+
+    def _on_poll(self, task_id, response):
+        """轮询调度器的回调，返回True表示任务已结束"""
+        with self._changed:
+            entry = self._watches.get(task_id)
+            if entry is None:
+                return True
+            result = entry[0].advance(response)
+            if result is None:
+                return False
+            del self._watches[task_id]
+        result = self._finished(result)
+        for future in entry[1]:
+            future.set_result(result)
+        return True
+
+    def submit_tryon_task(self, person_image_url, garment_image_url, garment_type="top", bottom_garment_image_url=None):
+        """
+        提交试衣任务（兼容旧接口）
+
+        返回:
+            task_id: 任务ID (成功时) 或 None (失败时)
+        """
+        return self.submit(person_image_url, garment_image_url, garment_type, bottom_garment_image_url).task_id
+
+    def wait_for_task_completion(self, task_id, max_retries=None, interval=None):
+        """
+        等待任务完成（兼容旧接口：固定间隔、固定次数）
+
+        返回:
+            dict: 成功时为上游的原始响应，失败或超时时为None
+        """
+        polling = PollingPolicy.fixed(interval or Config.TASK_CHECK_INTERVAL, max_retries or Config.MAX_TASK_CHECK_RETRIES)
+        result = self.wait(task_id, polling=polling)
+        return result.raw if result.succeeded else None
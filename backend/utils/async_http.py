@@ -0,0 +1,88 @@
+import os
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from config import Config
+from utils.http_session import POST_RETRY_STATUS_CODES, RETRY_STATUS_CODES
+
+logger = logging.getLogger(__name__)
+
+# 按 (名称, 进程, 事件循环) 缓存的httpx.AsyncClient
+_clients = {}
+
+
+def get_async_client(name='dashscope'):
+    """
+    获取当前事件循环共享的异步HTTP客户端（ASGI模式使用，需要安装httpx）
+
+    与 utils.http_session.get_session 对应：每个上游一个长连接池，连接错误由传输层重试，
+    429/5xx的重试见 request_with_retry
+
+    参数:
+        name: 客户端名称，不同上游使用不同的连接池
+
+    返回:
+        httpx.AsyncClient实例
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    key = (name, os.getpid(), id(loop))
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=Config.ASYNC_HTTP_POOL_SIZE,
+                              max_keepalive_connections=Config.ASYNC_HTTP_POOL_SIZE)
+        client = httpx.AsyncClient(
+            limits=limits,
+            timeout=httpx.Timeout(Config.HTTP_READ_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(retries=Config.HTTP_MAX_RETRIES, limits=limits)
+        )
+        _clients[key] = client
+        logger.info(f"已创建异步HTTP连接池: {name}")
+    return client
+
+
+def _retry_after(response):
+    """解析Retry-After响应头（秒数或HTTP日期），没有时返回None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+async def request_with_retry(client, method, url, max_retries=None, backoff_factor=None, **kwargs):
+    """
+    发送请求，429/5xx响应按与同步会话相同的策略退避重试（优先使用Retry-After）；
+    POST只在429时重试，5xx可能发生在上游已经创建任务之后
+
+    返回:
+        httpx.Response，重试用尽后返回最后一次响应
+    """
+    max_retries = Config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+    backoff_factor = Config.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+    retry_status_codes = POST_RETRY_STATUS_CODES if method.upper() == 'POST' else RETRY_STATUS_CODES
+    for attempt in range(max_retries + 1):
+        response = await client.request(method, url, **kwargs)
+        if response.status_code not in retry_status_codes or attempt == max_retries:
+            return response
+        delay = _retry_after(response)
+        if delay is None:
+            delay = backoff_factor * (2 ** attempt) if attempt else 0
+        logger.warning(f"{method} {url.split('?')[0]} 返回 {response.status_code}，{delay:.1f}s 后重试")
+        await response.aclose()
+        await asyncio.sleep(delay)
+
+
+async def close_async_clients():
+    """关闭当前事件循环创建的所有异步客户端（服务停止时调用）"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [key for key in _clients if key[2] == loop_id]:
+        await _clients.pop(key).aclose()
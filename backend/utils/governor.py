@@ -0,0 +1,583 @@
+import os
+import json
+import math
+import time
+import uuid
+import fcntl
+import heapq
+import logging
+import asyncio
+import threading
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from config import Config
+from utils import metrics as tryon_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class GovernorTimeout(Exception):
+    """排队等待上游配额超时"""
+
+
+class GovernorBusy(Exception):
+    """准入控制：预计排队等待提交配额的时间过长，请求被拒绝"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"上游配额排队过长，建议 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class LocalGovernorState:
+    """单进程内的配额状态（令牌桶 + 在途任务槽位）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._slots = {}
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            yield
+
+    def take_token(self, name, rate, burst):
+        """
+        从令牌桶中取一个令牌
+
+        返回:
+            float: 0表示取得令牌，否则为预计还需等待的秒数
+        """
+        with self._transaction():
+            now = time.time()
+            tokens, updated = self._buckets.get(name, (burst, now))
+            tokens = min(burst, tokens + max(0, now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[name] = (tokens - 1, now)
+                return 0
+            self._buckets[name] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def acquire_slot(self, lease, limit, ttl):
+        """占用一个在途任务槽位，已满时返回False；槽位在ttl秒后自动过期，防止进程崩溃后泄漏"""
+        with self._transaction():
+            now = time.time()
+            self._purge(now)
+            if len(self._slots) >= limit:
+                return False
+            self._slots[lease] = now + ttl
+            return True
+
+    def rename_slot(self, lease, task_id):
+        """将占位的槽位改为以任务ID标识，任意进程观察到任务结束后都可以释放"""
+        with self._transaction():
+            expires_at = self._slots.pop(lease, None)
+            if expires_at is not None:
+                self._slots[task_id] = expires_at
+
+    def release_slot(self, name):
+        with self._transaction():
+            self._slots.pop(name, None)
+
+    def inflight(self):
+        with self._transaction():
+            self._purge(time.time())
+            return len(self._slots)
+
+    def _purge(self, now):
+        for name in [name for name, expires_at in self._slots.items() if expires_at <= now]:
+            del self._slots[name]
+
+
+class FileGovernorState(LocalGovernorState):
+    """同一台机器上多个gunicorn worker共享的配额状态，保存在加了文件锁的JSON文件中"""
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or Config.GOVERNOR_STATE_FILE
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {}
+                self._buckets = {name: tuple(value) for name, value in state.get('buckets', {}).items()}
+                self._slots = state.get('slots', {})
+                yield
+                f.seek(0)
+                f.truncate()
+                json.dump({'buckets': self._buckets, 'slots': self._slots}, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# 令牌桶：使用Redis服务器时间，避免各节点时钟不一致
+_TAKE_TOKEN_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(data[1]) or burst
+local updated = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+# 在途任务槽位：有序集合，分数为过期时间
+_ACQUIRE_SLOT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+    return 1
+end
+return 0
+"""
+
+_RENAME_SLOT_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('ZADD', KEYS[1], score, ARGV[2])
+end
+return 1
+"""
+
+
+class RedisGovernorState:
+    """多节点共享的配额状态（需要安装redis包）"""
+
+    def __init__(self, url=None, prefix='paida:governor:'):
+        import redis
+        self.client = redis.Redis.from_url(url or Config.REDIS_URL)
+        self.prefix = prefix
+        self._take_token = self.client.register_script(_TAKE_TOKEN_SCRIPT)
+        self._acquire_slot = self.client.register_script(_ACQUIRE_SLOT_SCRIPT)
+        self._rename_slot = self.client.register_script(_RENAME_SLOT_SCRIPT)
+
+    def take_token(self, name, rate, burst):
+        return float(self._take_token(keys=[f"{self.prefix}bucket:{name}"], args=[rate, burst]))
+
+    def acquire_slot(self, lease, limit, ttl):
+        return bool(self._acquire_slot(keys=[f"{self.prefix}slots"], args=[lease, limit, ttl]))
+
+    def rename_slot(self, lease, task_id):
+        self._rename_slot(keys=[f"{self.prefix}slots"], args=[lease, task_id])
+
+    def release_slot(self, name):
+        self.client.zrem(f"{self.prefix}slots", name)
+
+    def inflight(self):
+        return self.client.zcount(f"{self.prefix}slots", time.time(), '+inf')
+
+
+def create_governor_state(name=None):
+    """
+    根据配置创建配额状态后端
+
+    参数:
+        name: "local"（单进程）、"file"（同机多进程）或 "redis"（多节点），默认使用 Config.GOVERNOR_BACKEND
+    """
+    name = (name or Config.GOVERNOR_BACKEND).lower()
+    if name == 'redis':
+        try:
+            return RedisGovernorState()
+        except Exception as e:
+            logger.error(f"Redis配额状态初始化失败，改用本机文件: {e}")
+            name = 'file'
+    if name == 'file':
+        return FileGovernorState()
+    return LocalGovernorState()
+
+
+# 提交配额的优先级类别（从高到低）：在线请求 / 批量试衣和预热 / 推测性预取
+PRIORITY_CLASSES = ('interactive', 'batch', 'prefetch')
+DEFAULT_PRIORITY = 'interactive'
+
+# 当前请求（或后台任务）提交上游任务时使用的 (优先级类别, 租户)
+_schedule = contextvars.ContextVar('governor_schedule', default=None)
+
+
+def parse_weights(value):
+    """解析 "名称=权重,名称=权重" 格式的配置，忽略无效或非正的条目"""
+    weights = {}
+    for part in (value or '').split(','):
+        name, _, weight = part.partition('=')
+        try:
+            weight = float(weight)
+        except ValueError:
+            continue
+        if name.strip() and weight > 0:
+            weights[name.strip()] = weight
+    return weights
+
+
+def set_schedule(priority, tenant=None):
+    """设置当前请求提交任务时的优先级类别和租户（在请求开始时调用）"""
+    _schedule.set((priority if priority in PRIORITY_CLASSES else DEFAULT_PRIORITY, tenant))
+
+
+def current_schedule():
+    """返回 (优先级类别, 租户)，未设置时为在线请求、无租户"""
+    return _schedule.get() or (DEFAULT_PRIORITY, None)
+
+
+@contextmanager
+def schedule(priority, tenant=None):
+    """在代码块内以指定的优先级类别提交任务（用于预热等后台任务），tenant为None时沿用当前租户"""
+    token = _schedule.set((priority, tenant if tenant is not None else current_schedule()[1]))
+    try:
+        yield
+    finally:
+        _schedule.reset(token)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    __slots__ = ('finish', 'seq', 'priority', 'notify', 'granted', 'cancelled')
+
+    def __init__(self, finish, seq, priority, notify):
+        self.finish = finish
+        self.seq = seq
+        self.priority = priority
+        self.notify = notify
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.finish, self.seq) < (other.finish, other.seq)
+
+
+class FairQueue:
+    """
+    同一进程内等待上游配额的队列：按流（优先级类别 + 租户）加权公平排队（自计时的WFQ）
+
+    等待者到达时得到虚拟完成时间 max(当前虚拟时间, 同一流上一个等待者的完成时间) + 1 / 权重，
+    权重为类别权重 × 租户权重，每次放行完成时间最小的等待者。积压的流按权重比例分得配额：
+    一个批量集成方排再多的任务，新到的在线请求也只排在它少数几个任务之后，低优先级的流也不会被完全饿死。
+    只有一个流时退化为FIFO。同步线程和协程共用同一个队列，轮到协程时通过其事件循环唤醒。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._busy = False
+        self._seq = 0
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._waiting = {}
+        # 队首每次取得配额所需时间(秒)的指数滑动平均，用于估算排队等待时间
+        self.service_time = 0.0
+
+    def push(self, flow, weight, notify):
+        """登记一个等待者，轮到它时调用notify()（持有内部锁时调用，不能阻塞）"""
+        with self._lock:
+            finish = self._finish_tag(flow, weight)
+            self._last_finish[flow] = finish
+            waiter = _Waiter(finish, self._seq, flow[0], notify)
+            self._seq += 1
+            heapq.heappush(self._heap, waiter)
+            self._waiting[flow[0]] = self._waiting.get(flow[0], 0) + 1
+            self._dispatch()
+            return waiter
+
+    def _finish_tag(self, flow, weight):
+        return max(self._virtual_time, self._last_finish.get(flow, 0.0)) + 1.0 / weight
+
+    def _dispatch(self):
+        while not self._busy and self._heap:
+            waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            self._waiting[waiter.priority] -= 1
+            self._busy = True
+            self._virtual_time = waiter.finish
+            waiter.granted = True
+            waiter.notify()
+        # 完成时间已落后于虚拟时间的流与新到的流等价，清理掉以免租户很多时无限增长
+        if len(self._last_finish) > 1024:
+            self._last_finish = {flow: finish for flow, finish in self._last_finish.items()
+                                 if finish > self._virtual_time}
+
+    def cancel(self, waiter):
+        """放弃等待；已经轮到该等待者时返回False，调用方应照常继续并在之后调用done()"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            self._waiting[waiter.priority] -= 1
+            return True
+
+    def done(self, service_time=None):
+        """队首取得配额（或放弃）后调用，放行下一个等待者；service_time为队首取得配额所用的时间"""
+        with self._lock:
+            if service_time is not None:
+                self.service_time += 0.2 * (service_time - self.service_time)
+            self._busy = False
+            self._dispatch()
+
+    def ahead(self, flow, weight):
+        """该流新到的等待者前面会有多少个等待者（含正在争取配额的队首）"""
+        with self._lock:
+            finish = self._finish_tag(flow, weight)
+            return sum(1 for waiter in self._heap if not waiter.cancelled and waiter.finish <= finish) + self._busy
+
+    def depth(self, priority=None):
+        """等待中的请求数（不含队首），priority为None时统计所有类别"""
+        with self._lock:
+            if priority is None:
+                return sum(self._waiting.values())
+            return self._waiting.get(priority, 0)
+
+
+class UpstreamGovernor:
+    """
+    上游配额调节器：令牌桶限制提交/查询QPS，槽位限制同时在途的任务数
+
+    同一进程内的等待者在公平队列（FairQueue）中排队：提交按当前请求的优先级类别和租户加权公平排队，
+    查询只有一个流（FIFO）；配额状态保存在共享后端中，所有worker共同遵守同一个上限。
+    """
+
+    def __init__(self, state=None, submit_qps=None, query_qps=None, max_inflight=None, max_wait=None,
+                 class_weights=None, tenant_weights=None):
+        self.state = state or create_governor_state()
+        self.submit_qps = submit_qps or Config.GOVERNOR_SUBMIT_QPS
+        self.query_qps = query_qps or Config.GOVERNOR_QUERY_QPS
+        self.max_inflight = max_inflight or Config.GOVERNOR_MAX_INFLIGHT
+        self.max_wait = max_wait or Config.GOVERNOR_MAX_WAIT
+        self.slot_ttl = Config.TASK_MAX_WAIT
+        self.class_weights = class_weights or parse_weights(Config.SCHEDULER_CLASS_WEIGHTS)
+        self.tenant_weights = parse_weights(Config.SCHEDULER_TENANT_WEIGHTS) if tenant_weights is None else tenant_weights
+
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, kind):
+        with self._lock:
+            if kind not in self._queues:
+                self._queues[kind] = FairQueue()
+            return self._queues[kind]
+
+    def _flow(self, kind):
+        """提交按当前的 (优先级类别, 租户) 排队，查询只有一个流"""
+        if kind != 'submit':
+            return (DEFAULT_PRIORITY, None), 1.0
+        priority, tenant = current_schedule()
+        return (priority, tenant), self.class_weights.get(priority, 1.0) * self.tenant_weights.get(tenant, 1.0)
+
+    def _try_quota(self, kind, rate, lease):
+        """队首尝试占用在途槽位并取得令牌，返回0表示成功，否则为建议的重试间隔(秒)"""
+        if lease is not None and not self.state.acquire_slot(lease, self.max_inflight, self.slot_ttl):
+            return 0.5
+        wait = self.state.take_token(kind, rate, max(1.0, rate))
+        if wait > 0 and lease is not None:
+            self.state.release_slot(lease)
+        return wait
+
+    def _observe_depth(self, kind, queue):
+        tryon_metrics.GOVERNOR_QUEUE_DEPTH.labels(kind=kind).set(queue.depth())
+        if kind == 'submit':
+            for priority in PRIORITY_CLASSES:
+                tryon_metrics.SCHEDULER_QUEUE_DEPTH.labels(priority=priority).set(queue.depth(priority))
+
+    def _timeout(self, kind):
+        tryon_metrics.GOVERNOR_TIMEOUTS.labels(kind=kind).inc()
+        return GovernorTimeout(f"等待上游配额超时({kind})")
+
+    def _acquired(self, kind, flow, started, inflight=None):
+        waited = time.time() - started
+        tryon_metrics.GOVERNOR_WAIT.labels(kind=kind).observe(waited)
+        if kind == 'submit':
+            tryon_metrics.SCHEDULER_QUEUE_WAIT.labels(priority=flow[0]).observe(waited)
+        if inflight is not None:
+            tryon_metrics.GOVERNOR_INFLIGHT.set(inflight)
+        return waited
+
+    @staticmethod
+    async def _state_call(func, *args):
+        """
+        在线程池中执行配额状态操作（文件锁 / redis往返），不阻塞事件循环；
+        协程被取消时仍等待操作完成，调用方据此释放可能已经占用的槽位
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await future
+            raise
+
+    def _acquire(self, kind, rate, lease=None):
+        """在公平队列中排队，轮到后取得令牌（以及在途槽位），返回等待时间"""
+        queue = self._queue(kind)
+        flow, weight = self._flow(kind)
+        started = time.time()
+        deadline = started + self.max_wait
+        turn = threading.Event()
+        waiter = queue.push(flow, weight, turn.set)
+        self._observe_depth(kind, queue)
+        try:
+            # 等待超时的同时恰好轮到自己时照常继续
+            if not turn.wait(self.max_wait) and queue.cancel(waiter):
+                raise self._timeout(kind)
+
+            head_started = time.time()
+            acquired = False
+            try:
+                while True:
+                    wait = self._try_quota(kind, rate, lease)
+                    if wait <= 0:
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise self._timeout(kind)
+                    time.sleep(min(wait, 0.5, remaining))
+                acquired = True
+            finally:
+                queue.done(time.time() - head_started if acquired else None)
+        finally:
+            self._observe_depth(kind, queue)
+        return self._acquired(kind, flow, started, self.state.inflight() if lease is not None else None)
+
+    async def _acquire_async(self, kind, rate, lease=None):
+        """
+        _acquire的协程版本（ASGI模式）：与同步线程在同一个公平队列中排队，
+        等待配额期间不占用线程；配额状态与同步版本共用，仍然遵守所有worker共同的上限，
+        对状态后端的操作在线程池中执行（见 _state_call）
+        """
+        queue = self._queue(kind)
+        flow, weight = self._flow(kind)
+        started = time.time()
+        deadline = started + self.max_wait
+        loop = asyncio.get_running_loop()
+        turn = loop.create_future()
+        waiter = queue.push(flow, weight, lambda: loop.call_soon_threadsafe(_resolve, turn))
+        self._observe_depth(kind, queue)
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(turn), self.max_wait)
+            except asyncio.TimeoutError:
+                if queue.cancel(waiter):
+                    raise self._timeout(kind)
+            except asyncio.CancelledError:
+                # 请求被取消（如客户端断开）：已经轮到时要放行下一个等待者
+                if not queue.cancel(waiter):
+                    queue.done()
+                raise
+
+            head_started = time.time()
+            acquired = False
+            try:
+                while True:
+                    wait = await self._state_call(self._try_quota, kind, rate, lease)
+                    if wait <= 0:
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise self._timeout(kind)
+                    await asyncio.sleep(min(wait, 0.5, remaining))
+                acquired = True
+            finally:
+                queue.done(time.time() - head_started if acquired else None)
+        finally:
+            self._observe_depth(kind, queue)
+        inflight = await self._state_call(self.state.inflight) if lease is not None else None
+        return self._acquired(kind, flow, started, inflight)
+
+    def admit(self, max_wait=None):
+        """
+        提交前的准入检查：按当前请求的优先级类别和租户估算在本进程排队等待提交配额的时间
+
+        估算值 = 前面的等待者数 × 队首取得配额的平均用时（不低于令牌桶的间隔），
+        平均用时同时反映了其他worker对共享配额的占用和在途槽位已满时的等待。
+
+        参数:
+            max_wait: 可接受的最长排队时间(秒)，默认为 GOVERNOR_MAX_WAIT（排得更久也会等待超时）
+
+        返回:
+            int: 0表示接受；否则为建议客户端等待多少秒后重试（Retry-After）
+        """
+        limit = self.max_wait if max_wait is None else max_wait
+        queue = self._queue('submit')
+        flow, weight = self._flow('submit')
+        estimate = queue.ahead(flow, weight) * max(queue.service_time, 1.0 / self.submit_qps)
+        if estimate <= limit:
+            return 0
+        tryon_metrics.SCHEDULER_REJECTIONS.labels(priority=flow[0]).inc()
+        # 排在前面的等待者被放行到只剩可接受的排队时间后再重试
+        return max(1, math.ceil(estimate - limit))
+
+    @contextmanager
+    def submit_slot(self):
+        """
+        获取一次提交任务的配额，返回的lease在提交成功后应通过bind()绑定到任务ID，
+        提交失败时槽位自动释放
+        """
+        lease = f"lease-{uuid.uuid4().hex}"
+        self._acquire('submit', self.submit_qps, lease)
+        bound = {'task_id': None}
+        try:
+            yield bound
+        finally:
+            if bound['task_id']:
+                self.state.rename_slot(lease, bound['task_id'])
+            else:
+                self.state.release_slot(lease)
+
+    @contextmanager
+    def query_slot(self):
+        """获取一次查询任务状态的配额"""
+        self._acquire('query', self.query_qps)
+        yield
+
+    @asynccontextmanager
+    async def submit_slot_async(self):
+        """submit_slot的协程版本"""
+        lease = f"lease-{uuid.uuid4().hex}"
+        try:
+            await self._acquire_async('submit', self.submit_qps, lease)
+        except BaseException:
+            # 取消时线程池中的配额操作可能已经占用了槽位
+            await self._state_call(self.state.release_slot, lease)
+            raise
+        bound = {'task_id': None}
+        try:
+            yield bound
+        finally:
+            if bound['task_id']:
+                await self._state_call(self.state.rename_slot, lease, bound['task_id'])
+            else:
+                await self._state_call(self.state.release_slot, lease)
+
+    @asynccontextmanager
+    async def query_slot_async(self):
+        """query_slot的协程版本"""
+        await self._acquire_async('query', self.query_qps)
+        yield
+
+    def task_finished(self, task_id):
+        """任务结束后释放在途槽位（可重复调用）"""
+        self.state.release_slot(task_id)
+        tryon_metrics.GOVERNOR_INFLIGHT.set(self.state.inflight())
+
+    async def task_finished_async(self, task_id):
+        """task_finished的协程版本"""
+        await self._state_call(self.task_finished, task_id)
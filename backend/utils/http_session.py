@@ -0,0 +1,166 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 上游返回这些状态码时按退避策略重试
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# POST（提交任务）只在限流时重试：网关返回的5xx可能发生在上游已经创建（并计费）任务之后，重试会重复提交
+POST_RETRY_STATUS_CODES = (429,)
+
+_sessions = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
+
+
+class _UpstreamRetry(Retry):
+    """POST只按POST_RETRY_STATUS_CODES重试（连接错误时请求尚未发出，仍然重试）"""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == 'POST' and status_code not in POST_RETRY_STATUS_CODES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def create_adapter(pool_size=None, max_retries=None, backoff_factor=None, server_hostname=None):
+    """
+    创建带连接池和重试策略的HTTPAdapter
+
+    参数:
+        pool_size: 每个主机保持的最大连接数
+        max_retries: 连接错误及429/5xx响应（POST只限429）的最大重试次数，0表示不重试
+        backoff_factor: 重试退避系数，第n次重试前等待 backoff_factor * 2^(n-1) 秒
+        server_hostname: 请求URL中的主机是IP时，TLS握手（SNI）和证书校验使用的主机名
+
+    返回:
+        HTTPAdapter实例
+    """
+    pool_size = pool_size or Config.HTTP_POOL_SIZE
+    max_retries = Config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+    backoff_factor = Config.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+
+    retry = _UpstreamRetry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        # POST只在429时重试（见 _UpstreamRetry）
+        allowed_methods=frozenset(['GET', 'HEAD', 'POST']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    if server_hostname:
+        adapter.init_poolmanager(pool_size, pool_size, server_hostname=server_hostname,
+                                 assert_hostname=server_hostname)
+    return adapter
+
+
+def get_session(name='dashscope', **adapter_options):
+    """
+    获取当前进程共享的HTTP会话（保持长连接，gunicorn fork之后各worker重新创建）
+
+    参数:
+        name: 会话名称，不同上游使用不同的会话以便分别统计
+        adapter_options: 传给create_adapter的参数，仅在首次创建时生效
+
+    返回:
+        requests.Session实例
+    """
+    global _sessions_pid
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = create_adapter(**adapter_options)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[name] = session
+            logger.info(f"已创建HTTP连接池会话: {name}")
+        return session
+
+
+def register_session(name, session):
+    """登记由第三方库创建的会话（如oss2.Session内部的requests会话），使其纳入连接复用统计"""
+    global _sessions_pid
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        _sessions[name] = session
+
+
+def connection_stats():
+    """
+    汇总各会话连接池的复用情况
+
+    返回:
+        list: [{'session', 'host', 'connections', 'requests'}]，
+              requests / connections 越大说明连接复用越充分
+    """
+    stats = []
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+
+    for name, session in sessions:
+        seen = set()
+        for adapter in session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats.append({
+                    'session': name,
+                    'host': f"{pool.scheme}://{pool.host}:{pool.port}",
+                    'connections': pool.num_connections,
+                    'requests': pool.num_requests
+                })
+    return stats
+
+
+class ConnectionPoolCollector:
+    """Prometheus采集器：导出各连接池新建连接数和请求数"""
+
+    def collect(self):
+        from prometheus_client.core import CounterMetricFamily
+
+        connections = CounterMetricFamily(
+            'upstream_http_connections_opened',
+            'Number of TCP/TLS connections opened by pooled upstream sessions',
+            labels=['session', 'host']
+        )
+        requests_total = CounterMetricFamily(
+            'upstream_http_pool_requests',
+            'Number of requests sent through pooled upstream sessions',
+            labels=['session', 'host']
+        )
+        for item in connection_stats():
+            connections.add_metric([item['session'], item['host']], item['connections'])
+            requests_total.add_metric([item['session'], item['host']], item['requests'])
+        yield connections
+        yield requests_total
+
+
+def register_pool_metrics(registry=None):
+    """将连接池统计注册到Prometheus（未安装prometheus_client时跳过）"""
+    try:
+        from prometheus_client import REGISTRY
+    except ImportError:
+        logger.warning("未安装prometheus_client，跳过连接池指标")
+        return
+    (registry or REGISTRY).register(ConnectionPoolCollector())
@@ -0,0 +1,180 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from utils.upload_store import SpooledUpload
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow为可选依赖，未安装时跳过预处理
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# 输出格式对应的扩展名
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def normalize_image(src_path, dst_path, max_side=None, quality=None, output_format=None):
+    """
+    规范化图片：按EXIF方向旋转、缩放到最长边不超过max_side、去除元数据并重新编码
+
+    该函数在子进程中执行，只依赖参数，不访问应用状态。
+
+    参数:
+        src_path: 原图路径
+        dst_path: 输出路径
+        max_side: 最长边像素上限
+        quality: JPEG/WEBP编码质量
+        output_format: 输出格式 ("JPEG", "PNG", "WEBP")
+
+    返回:
+        dict: 原图与输出的尺寸、字节数、输出内容哈希，以及是否需要采用输出图片
+    """
+    max_side = max_side or Config.IMAGE_MAX_SIDE
+    quality = quality or Config.IMAGE_QUALITY
+    output_format = output_format or Config.IMAGE_OUTPUT_FORMAT
+
+    with Image.open(src_path) as image:
+        original_format = image.format
+        original_size = image.size
+        has_metadata = bool(image.info.get('exif') or image.info.get('icc_profile') or image.info.get('xmp'))
+        rotated = image.getexif().get(0x0112, 1) != 1
+        if original_format == 'JPEG':
+            # JPEG可在解码阶段直接按比例缩小，减少解码开销
+            image.draft('RGB', (max_side, max_side))
+
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ('RGBA', 'LA', 'P') and output_format == 'JPEG':
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode not in ('RGB', 'L') and output_format == 'JPEG':
+            image = image.convert('RGB')
+
+        resized = max(original_size) > max_side
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        save_options = {'optimize': True}
+        if output_format in ('JPEG', 'WEBP'):
+            save_options['quality'] = quality
+        image.save(dst_path, format=output_format, **save_options)
+        output_dimensions = image.size
+
+    original_bytes = os.path.getsize(src_path)
+    output_bytes = os.path.getsize(dst_path)
+
+    hasher = hashlib.sha256()
+    with open(dst_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(256 * 1024), b''):
+            hasher.update(chunk)
+
+    return {
+        'original_dimensions': original_size,
+        'output_dimensions': output_dimensions,
+        'original_bytes': original_bytes,
+        'output_bytes': output_bytes,
+        'digest': hasher.hexdigest(),
+        # 尺寸、方向或元数据发生变化，或者体积更小时采用输出图片
+        'use_output': resized or rotated or has_metadata or output_bytes < original_bytes
+    }
+
+
+def render_thumbnails(src_path, out_dir, widths, formats, quality):
+    """
+    按多个宽度和格式生成缩略图（在子进程中执行，只依赖参数）
+
+    参数:
+        src_path: 原图路径
+        out_dir: 输出目录
+        widths: 缩略图宽度列表，大于原图宽度时不放大
+        formats: 输出格式列表 ("WEBP", "JPEG")
+        quality: 编码质量
+
+    返回:
+        dict: 变体名（如 "w320.webp"）到文件路径的映射
+    """
+    outputs = {}
+    with Image.open(src_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        for width in widths:
+            target_width = min(width, image.width)
+            resized = image.resize((target_width, max(1, round(image.height * target_width / image.width))), Image.LANCZOS)
+            for output_format in formats:
+                variant = f"w{width}.{FORMAT_EXTENSIONS[output_format]}"
+                path = os.path.join(out_dir, variant)
+                resized.save(path, format=output_format, quality=quality, optimize=True)
+                outputs[variant] = path
+    return outputs
+
+
+def get_pool():
+    """获取当前进程的图片处理进程池（使用spawn启动，避免在多线程进程中fork）"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.IMAGE_PREPROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def preprocess_upload(upload):
+    """
+    在进程池中规范化已落盘的上传文件
+
+    参数:
+        upload: utils.upload_store.SpooledUpload 实例
+
+    返回:
+        处理后的SpooledUpload；未安装Pillow、处理失败或无需处理时返回原对象
+    """
+    if Image is None or not Config.IMAGE_PREPROCESS_ENABLED:
+        return upload
+
+    extension = FORMAT_EXTENSIONS[Config.IMAGE_OUTPUT_FORMAT]
+    fd, dst_path = tempfile.mkstemp(prefix='normalized-', suffix=f'.{extension}', dir=Config.UPLOAD_TMP_DIR)
+    os.close(fd)
+
+    started = time.time()
+    try:
+        future = get_pool().submit(normalize_image, upload.path, dst_path)
+        info = future.result(timeout=Config.IMAGE_PREPROCESS_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"图片预处理失败，使用原图: {e}")
+        os.remove(dst_path)
+        return upload
+
+    if not info['use_output']:
+        os.remove(dst_path)
+        return upload
+
+    logger.info(
+        f"图片预处理完成: {info['original_dimensions']} -> {info['output_dimensions']}, "
+        f"{info['original_bytes']} -> {info['output_bytes']} 字节, 耗时 {time.time() - started:.3f}s"
+    )
+    upload.cleanup()
+    return SpooledUpload(dst_path, info['digest'], info['output_bytes'], extension)
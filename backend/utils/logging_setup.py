@@ -0,0 +1,211 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import logging
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from config import Config
+from utils import metrics as tryon_metrics
+from utils.tracing import TraceIdFilter
+
+# 日志中需要脱敏的内容：(关键字, 正则, 替换)，文本（小写）中出现任一关键字时才执行对应的正则
+_REDACT_PATTERNS = [
+    (('bearer',), re.compile(r'(Bearer\s+)[A-Za-z0-9._~+/=-]+', re.IGNORECASE), r'\1***'),
+    (('sk-',), re.compile(r'\bsk-[A-Za-z0-9]{8,}'), 'sk-***'),
+    # 签名URL中的签名、临时凭证等查询参数
+    (('signature=', 'accesskeyid=', 'token=', 'credential='),
+     re.compile(r'((?:Signature|OSSAccessKeyId|security-token|X-Amz-Signature|X-Amz-Credential|X-Amz-Security-Token)=)'
+                r'[^&\s"\'<>]+', re.IGNORECASE), r'\1***'),
+    # 键值形式的密钥，如 'Authorization': '...'、"api_key": "..."、password=...
+    (('authorization', 'key', 'password', 'secret'),
+     re.compile(r'((?:authorization|api[_-]?key|access[_-]?key[_-]?secret|secret[_-]?access[_-]?key|password|secret)'
+                r'["\']?\s*[:=]\s*["\']?)[^"\',\s&}]+', re.IGNORECASE), r'\1***'),
+]
+
+# LogRecord的标准属性，其余属性（通过extra传入）在JSON日志中作为附加字段输出
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'trace_id', 'sample_key'}
+
+
+def redact(text):
+    """去除日志文本中的密钥、签名等敏感信息"""
+    lowered = text.lower()
+    for keywords, pattern, replacement in _REDACT_PATTERNS:
+        if any(keyword in lowered for keyword in keywords):
+            text = pattern.sub(replacement, text)
+    # 配置中的密钥原文（无论以什么形式出现）
+    for secret in (Config.DASHSCOPE_API_KEY, Config.OSS_ACCESS_KEY_SECRET, Config.S3_SECRET_ACCESS_KEY):
+        if secret and len(secret) >= 8 and secret in text:
+            text = text.replace(secret, '***')
+    return text
+
+
+class RedactingFormatter(logging.Formatter):
+    """
+    文本格式日志（输出前脱敏）
+
+    stdout和日志文件共用同一个格式化器，格式化结果缓存在日志记录上，每条日志只格式化、脱敏一次
+    """
+
+    def format(self, record):
+        cached = record.__dict__.get('_formatted')
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        line = redact(self.render(record))
+        record._formatted = (self, line)
+        return line
+
+    def render(self, record):
+        return super().format(record)
+
+
+class JsonFormatter(RedactingFormatter):
+    """
+    结构化JSON日志，每条一行
+
+    固定字段为 ts、level、logger、message、trace_id、thread，通过 extra={...} 传入的字段原样附加，
+    异常堆栈放在 exc_info 字段；整行输出前脱敏。
+    """
+
+    def render(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'trace_id': getattr(record, 'trace_id', None),
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按采样键采样日志：带有 sample_key（通过extra传入，如任务ID）的INFO及以下日志只保留约rate比例，
+    同一个键的日志要么全部保留要么全部丢弃，被采样到的任务可以看到完整的轮询过程。
+    WARNING及以上的日志和不带采样键的日志不受影响。
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.threshold = int(max(0.0, min(rate, 1.0)) * 10000)
+
+    def filter(self, record):
+        key = getattr(record, 'sample_key', None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        return zlib.crc32(str(key).encode()) % 10000 < self.threshold
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    非阻塞的队列日志处理器：请求线程只把日志记录放入队列，消息格式化、脱敏和写文件都在日志线程中完成
+
+    标准的QueueHandler会在入队前格式化消息；这里保留原始的msg/args，格式化推迟到日志线程
+    （同一进程内的队列不需要序列化）。调用方不应在记录日志后修改作为参数传入的可变对象。
+    队列已满时丢弃该条日志并计数，不阻塞请求线程。
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            tryon_metrics.LOG_RECORDS_DROPPED.inc()
+
+
+class AsyncLogging:
+    """管理日志队列和后台写日志线程，fork出的子进程（gunicorn worker）中自动重建"""
+
+    def __init__(self, handlers, queue_size):
+        self.handlers = handlers
+        self.queue_size = queue_size
+        self.queue_handler = AsyncQueueHandler(queue.Queue(maxsize=queue_size))
+        self.listener = None
+
+    def start(self):
+        self.listener = QueueListener(self.queue_handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """写完队列中剩余的日志后停止日志线程（进程退出时调用）"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def after_fork(self):
+        # 父进程的日志线程不会被复制到子进程：使用新队列并重新启动日志线程
+        self.queue_handler.queue = queue.Queue(maxsize=self.queue_size)
+        self.start()
+
+
+_async_logging = None
+
+
+def create_handlers():
+    """创建stdout和（可选的）轮转日志文件处理器"""
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if Config.LOG_FILE:
+        # 多个gunicorn worker写同一个文件时轮转可能互相干扰，生产环境建议只输出到stdout，由容器收集
+        if Config.LOG_ROTATE_WHEN:
+            handlers.append(TimedRotatingFileHandler(Config.LOG_FILE, when=Config.LOG_ROTATE_WHEN,
+                                                     backupCount=Config.LOG_BACKUP_COUNT, delay=True, encoding='utf-8'))
+        else:
+            handlers.append(RotatingFileHandler(Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES,
+                                                backupCount=Config.LOG_BACKUP_COUNT, delay=True, encoding='utf-8'))
+
+    if Config.LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = RedactingFormatter('%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s')
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging():
+    """
+    配置根日志记录器（重复调用无副作用）
+
+    LOG_ASYNC开启时，日志经队列交给后台线程输出，请求线程只承担创建日志记录和入队的开销；
+    trace id和采样在请求线程中处理（trace id来自请求上下文），格式化、脱敏和写入在日志线程中完成。
+    """
+    global _async_logging
+
+    root = logging.getLogger()
+    if getattr(root, '_tryon_configured', False):
+        return
+    root._tryon_configured = True
+    root.setLevel(Config.LOG_LEVEL)
+
+    handlers = create_handlers()
+    if Config.LOG_ASYNC:
+        _async_logging = AsyncLogging(handlers, Config.LOG_QUEUE_SIZE)
+        handlers = [_async_logging.queue_handler]
+        _async_logging.start()
+        os.register_at_fork(after_in_child=_async_logging.after_fork)
+        atexit.register(_async_logging.stop)
+
+    for handler in handlers:
+        handler.addFilter(TraceIdFilter())
+        handler.addFilter(SamplingFilter(Config.LOG_POLL_SAMPLE_RATE))
+        root.addHandler(handler)
+
+
+def flush_logging():
+    """等待队列中的日志全部写出（基准测试和进程退出前使用）"""
+    if _async_logging is not None:
+        _async_logging.stop()
+        _async_logging.start()
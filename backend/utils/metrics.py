@@ -0,0 +1,147 @@
+# 自定义Prometheus指标：注册到prometheus_client的默认注册表，由PrometheusMetrics在 /metrics 统一导出。
+# 未安装prometheus_client时使用空实现，业务代码无需判断。
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:  # prometheus_client为可选依赖
+    Counter = Gauge = Histogram = None
+
+
+class _NoopMetric:
+    """prometheus_client不可用时的空指标"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _metric(metric_class, *args, **kwargs):
+    return metric_class(*args, **kwargs) if metric_class else _NoopMetric()
+
+
+# 批量试衣
+BATCH_DURATION = _metric(
+    Histogram, 'tryon_batch_duration_seconds', 'Wall-clock time to finish a whole try-on batch',
+    buckets=(5, 10, 20, 30, 60, 90, 120, 180, 300, 600)
+)
+BATCH_SIZE = _metric(
+    Histogram, 'tryon_batch_size', 'Number of garments per try-on batch',
+    buckets=(1, 2, 5, 10, 20, 30, 50)
+)
+BATCH_THROUGHPUT = _metric(
+    Histogram, 'tryon_batch_throughput_items_per_second', 'Finished items per second for each try-on batch',
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+)
+BATCH_ITEM_LATENCY = _metric(
+    Histogram, 'tryon_batch_item_latency_seconds', 'Time from batch start until each item finished',
+    buckets=(1, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+)
+BATCH_ITEMS = _metric(
+    Counter, 'tryon_batch_items_total', 'Try-on batch items by outcome', ['status']
+)
+
+# 上游配额调节器
+GOVERNOR_QUEUE_DEPTH = _metric(
+    Gauge, 'upstream_governor_queue_depth', 'Requests waiting for upstream quota in this process', ['kind']
+)
+GOVERNOR_WAIT = _metric(
+    Histogram, 'upstream_governor_wait_seconds', 'Time spent waiting for upstream quota', ['kind'],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+GOVERNOR_TIMEOUTS = _metric(
+    Counter, 'upstream_governor_timeouts_total', 'Requests that gave up waiting for upstream quota', ['kind']
+)
+GOVERNOR_INFLIGHT = _metric(
+    Gauge, 'upstream_governor_inflight_tasks', 'DashScope tasks currently holding an in-flight slot'
+)
+
+# 提交配额的优先级类别和租户公平排队（见 utils.governor.FairQueue）
+SCHEDULER_QUEUE_DEPTH = _metric(
+    Gauge, 'tryon_scheduler_queue_depth', 'Submissions waiting for upstream quota in this process by priority class',
+    ['priority']
+)
+SCHEDULER_QUEUE_WAIT = _metric(
+    Histogram, 'tryon_scheduler_queue_wait_seconds', 'Time submissions waited for upstream quota by priority class',
+    ['priority'], buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+SCHEDULER_REJECTIONS = _metric(
+    Counter, 'tryon_scheduler_rejections_total', 'Submissions rejected by admission control (HTTP 429) by priority class',
+    ['priority']
+)
+
+# 试衣链路各阶段耗时（见 utils.tracing.record_stage）
+STAGE_DURATION = _metric(
+    Histogram, 'tryon_stage_duration_seconds',
+    'Time spent in each stage of the try-on path '
+    '(upload, storage_put, submit, queue, run, poll_overshoot, total)', ['stage'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+UPLOAD_BYTES = _metric(
+    Histogram, 'tryon_upload_bytes', 'Size of uploaded images as received, before preprocessing',
+    buckets=(64 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024, 2 * 1024 * 1024, 4 * 1024 * 1024,
+             8 * 1024 * 1024, 16 * 1024 * 1024)
+)
+UPLOAD_URLS = _metric(
+    Counter, 'tryon_upload_urls_total',
+    'Browser upload requests by path (direct: signed URL issued / server: storage backend cannot take direct uploads)',
+    ['mode']
+)
+
+# 日志
+LOG_RECORDS_DROPPED = _metric(
+    Counter, 'tryon_log_records_dropped_total', 'Log records dropped because the async logging queue was full'
+)
+
+# ASGI模式下由协程处理的接口（其余接口由Flask应用处理，见PrometheusMetrics的flask_http_*指标）
+ASGI_REQUEST_DURATION = _metric(
+    Histogram, 'tryon_asgi_request_duration_seconds', 'Latency of requests served by the async (ASGI) handlers',
+    ['method', 'endpoint', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+)
+ASGI_REQUESTS_IN_FLIGHT = _metric(
+    Gauge, 'tryon_asgi_requests_in_flight', 'Requests currently being served by the async (ASGI) handlers'
+)
+
+# 预计算结果索引（见 utils.warm_index）
+WARM_INDEX_LOOKUPS = _metric(
+    Counter, 'tryon_warm_index_lookups_total',
+    'Warm index lookups before submitting a try-on task (hit / miss / unresolved: image content hash unknown)',
+    ['result']
+)
+WARM_INDEX_LOOKUP_DURATION = _metric(
+    Histogram, 'tryon_warm_index_lookup_duration_seconds', 'Latency of warm index lookups',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+)
+WARM_INDEX_ENTRIES = _metric(
+    Gauge, 'tryon_warm_index_entries', 'Precomputed try-on results in the warm index'
+)
+
+# 状态接口的进程内缓存（见 utils.status_cache）
+STATUS_LOOKUPS = _metric(
+    Counter, 'tryon_status_lookups_total',
+    'Task status lookups by source (memo / coalesced: waited for a concurrent read / tracker / upstream)',
+    ['source']
+)
+
+# 推测性预取（见 utils.prefetch）：浪费的提交数 = submitted - 命中数
+PREFETCH_CANDIDATES = _metric(
+    Counter, 'tryon_prefetch_candidates_total',
+    'Speculative prefetch candidates by outcome (submitted / present: result or task already exists / '
+    'budget: tenant or session budget used up / busy: upstream not idle / failed)',
+    ['outcome']
+)
+PREFETCH_HITS = _metric(
+    Counter, 'tryon_prefetch_hits_total',
+    'User try-on requests served by a prefetched result (cached) or a running prefetch task (inflight), first use only',
+    ['stage']
+)
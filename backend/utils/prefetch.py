@@ -0,0 +1,124 @@
+import math
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from utils import metrics as tryon_metrics
+from utils.governor import GovernorBusy, schedule
+from utils.result_cache import MemoryCacheBackend
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchBudget:
+    """
+    每个租户（及其中每个会话）在时间窗口内最多可以推测性提交的任务数
+
+    租户由服务端确定（API密钥或客户端IP），是预算的上限；客户端传入的会话标识只用于在租户内
+    进一步细分，更换会话标识不能获得新的租户预算。
+    计数保存在结果缓存的后端中：redis / 磁盘后端时所有worker共享同一个预算。
+    """
+
+    def __init__(self, backend=None, tenant_limit=None, session_limit=None, window=None):
+        self.backend = backend or MemoryCacheBackend()
+        self.tenant_limit = Config.PREFETCH_TENANT_BUDGET if tenant_limit is None else tenant_limit
+        self.session_limit = Config.PREFETCH_SESSION_BUDGET if session_limit is None else session_limit
+        self.window = window or Config.PREFETCH_BUDGET_WINDOW
+        self._lock = threading.Lock()
+
+    def _entry(self, key, now):
+        entry = self.backend.get(key)
+        if not entry or entry['expires_at'] <= now:
+            entry = {'used': 0, 'expires_at': now + self.window}
+        return entry
+
+    def take(self, tenant, session=None):
+        """
+        同时占用租户和会话的一个预算，任一已用完时返回False且都不占用
+        （跨worker的并发占用可能略微超出预算）
+        """
+        buckets = [(f"prefetch-budget:{tenant}", self.tenant_limit)]
+        if session:
+            buckets.append((f"prefetch-budget:{tenant}:{session}", self.session_limit))
+        now = time.time()
+        with self._lock:
+            entries = [(key, self._entry(key, now)) for key, _ in buckets]
+            if any(entry['used'] >= limit for (_, entry), (_, limit) in zip(entries, buckets)):
+                return False
+            for key, entry in entries:
+                entry['used'] += 1
+                self.backend.set(key, entry, math.ceil(entry['expires_at'] - now))
+            return True
+
+
+class Prefetcher:
+    """
+    推测性预取：直接试衣成功后，在后台为用户接下来最可能试穿的服装提前生成结果
+
+    候选由客户端按可能性从高到低给出，只取前top_k个；已有结果或进行中任务的候选跳过，
+    其余按prefetch类别排队提交（在线请求和批量任务优先取得配额），结果写入结果缓存，
+    用户之后点击这些服装时直接命中。每个租户及会话的提交数受预算限制，上游排队时间
+    超过PREFETCH_MAX_QUEUE_WAIT时放弃剩余候选，预取只使用空闲的上游配额。
+    """
+
+    def __init__(self, lookup, submit, admit, result_cache, budget=None, top_k=None, workers=None):
+        # 返回 (是否已有结果或进行中的任务, 缓存键) 的函数
+        self.lookup = lookup
+        # 提交（或复用）试衣任务、返回任务ID的函数
+        self.submit = submit
+        # 准入检查，预计排队过久时抛出GovernorBusy
+        self.admit = admit
+        self.result_cache = result_cache
+        self.budget = budget or PrefetchBudget(result_cache.backend)
+        self.top_k = top_k or Config.PREFETCH_TOP_K
+        self._executor = ThreadPoolExecutor(max_workers=workers or Config.PREFETCH_WORKERS,
+                                            thread_name_prefix='tryon-prefetch')
+
+    def start(self, tenant, session, candidates):
+        """
+        在后台预取候选组合，立即返回（沿用当前请求的租户和trace id）
+
+        参数:
+            tenant: 预算计数的租户（服务端确定）
+            session: 租户内细分预算的会话标识，可以为None
+            candidates: 试衣参数的序列，按可能性从高到低
+        """
+        candidates = list(candidates)[:self.top_k]
+        if candidates:
+            self._executor.submit(contextvars.copy_context().run, self._run, tenant, session, candidates)
+
+    def _run(self, tenant, session, candidates):
+        with schedule('prefetch'):
+            for index, params in enumerate(candidates):
+                try:
+                    outcome = self._prefetch(tenant, session, params)
+                except GovernorBusy:
+                    outcome = 'busy'
+                except Exception as e:
+                    logger.warning(f"预取 {params['garment_url']} 失败: {e}")
+                    outcome = 'failed'
+                tryon_metrics.PREFETCH_CANDIDATES.labels(outcome=outcome).inc()
+                if outcome in ('budget', 'busy'):
+                    # 预算用完或上游不空闲：剩余候选不再尝试
+                    remaining = len(candidates) - index - 1
+                    if remaining:
+                        tryon_metrics.PREFETCH_CANDIDATES.labels(outcome=outcome).inc(remaining)
+                    return
+
+    def _prefetch(self, tenant, session, params):
+        present, cache_key = self.lookup(params)
+        if present:
+            return 'present'
+        # 先做准入检查再占用预算，上游繁忙时不消耗预算
+        self.admit()
+        if not self.budget.take(tenant, session):
+            return 'budget'
+        task_id = self.submit(params)
+        if not task_id:
+            return 'failed'
+        if cache_key:
+            self.result_cache.mark_prefetched(cache_key)
+        logger.info(f"已预取 {params['garment_url']}: 任务 {task_id}")
+        return 'submitted'
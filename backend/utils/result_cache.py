@@ -0,0 +1,414 @@
+import os
+import json
+import math
+import time
+import uuid
+import fcntl
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from config import Config
+from utils.url_guard import guarded_get
+
+logger = logging.getLogger(__name__)
+
+# 提交权占位值的前缀：某个进程已抢到相同输入的提交权，尚未拿到任务ID
+_PENDING_PREFIX = 'pending:'
+# 等待其他进程提交相同输入时读取进行中标记的间隔(秒)
+_CLAIM_POLL_INTERVAL = 0.1
+
+
+class MemoryCacheBackend:
+    """进程内LRU缓存，支持按条目设置过期时间"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or Config.RESULT_CACHE_MAX_ENTRIES
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key, value, ttl):
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """键不存在（或已过期）时写入并返回True，否则返回False"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and not (item[1] and item[1] < time.time()):
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DiskCacheBackend:
+    """本地磁盘缓存，每个条目一个JSON文件，适合单机多worker共享"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.RESULT_CACHE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if item.get('expires_at') and item['expires_at'] < time.time():
+            self.delete(key)
+            return None
+        return item.get('value')
+
+    def set(self, key, value, ttl=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'value': value, 'expires_at': time.time() + ttl if ttl else None}, f)
+        os.replace(tmp_path, path)
+
+    def add(self, key, value, ttl=None):
+        """键不存在（或已过期）时写入并返回True，否则返回False（同一目录下的所有进程之间原子）"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 按分片目录加文件锁，检查和写入之间其他进程不能写入同一分片
+        with open(os.path.join(os.path.dirname(path), '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self.get(key) is not None:
+                    return False
+                self.set(key, value, ttl)
+                return True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class RedisCacheBackend:
+    """Redis缓存，可在多个节点之间共享（需要安装redis包）"""
+
+    def __init__(self, url=None, prefix='paida:cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url or Config.REDIS_URL)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        """键不存在时写入并返回True，否则返回False（SET NX）"""
+        return bool(self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def create_cache_backend(name=None):
+    """
+    根据配置创建缓存后端
+
+    参数:
+        name: "memory"、"disk"、"redis" 或 "none"，默认使用 Config.RESULT_CACHE_BACKEND
+
+    返回:
+        缓存后端实例，"none"时返回None
+    """
+    name = (name or Config.RESULT_CACHE_BACKEND).lower()
+    if name == 'none':
+        return None
+    if name == 'disk':
+        return DiskCacheBackend()
+    if name == 'redis':
+        try:
+            return RedisCacheBackend()
+        except Exception as e:
+            logger.error(f"Redis缓存初始化失败，改用进程内缓存: {e}")
+    return MemoryCacheBackend()
+
+
+class ResultCache:
+    """
+    试衣结果缓存
+
+    缓存键由人物图片内容、服装图片内容、服装类型和模型参数共同决定，
+    相同输入直接返回已有结果；正在处理中的相同输入共享同一个上游任务。
+    """
+
+    def __init__(self, backend, ttl=None, session=None):
+        self.backend = backend
+        self.ttl = ttl or Config.RESULT_CACHE_TTL
+        self.session = session
+        # 每个键一把锁，用于进程内的同键请求合并
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def register_digest(self, url, digest, ttl=None):
+        """记录URL对应的图片内容哈希（上传时已知内容，无需再次下载）"""
+        if self.enabled:
+            self.backend.set(f"digest:{url}", digest, ttl or self.ttl)
+
+    def known_digest(self, url):
+        """返回URL已登记的图片内容哈希，未登记时返回None（不下载图片）"""
+        return self.backend.get(f"digest:{url}") if self.enabled else None
+
+    def content_digest(self, url):
+        """
+        获取URL对应图片内容的SHA-256哈希，未知的URL会下载一次并缓存哈希值
+
+        只下载公网地址（每次重定向后重新检查），外部URL的内容可能变化，
+        下载得到的哈希只保留 RESULT_CACHE_URL_DIGEST_TTL 秒
+
+        返回:
+            str: 十六进制哈希值
+
+        抛出:
+            UnsafeURLError: URL指向内网、本机等非公网地址
+        """
+        digest = self.known_digest(url)
+        if digest:
+            return digest
+
+        hasher = hashlib.sha256()
+        size = 0
+        timeout = (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+        with guarded_get(self.session, url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > Config.MAX_CONTENT_LENGTH:
+                    raise ValueError(f"图片过大，无法计算内容哈希: {url}")
+                hasher.update(chunk)
+
+        digest = hasher.hexdigest()
+        self.register_digest(url, digest, Config.RESULT_CACHE_URL_DIGEST_TTL)
+        return digest
+
+    def make_key(self, person_url, garment_url, garment_type, model_params, bottom_garment_url=None):
+        """
+        计算缓存键
+
+        参数:
+            person_url: 人物图像URL
+            garment_url: 服装图像URL（整套搭配时为上装）
+            garment_type: 服装类型
+            model_params: 模型名称及参数，参数不同的结果不会互相命中
+            bottom_garment_url: 整套搭配的下装图像URL
+
+        返回:
+            str: 缓存键
+        """
+        material = {
+            'person': self.content_digest(person_url),
+            'garment': self.content_digest(garment_url),
+            'garment_type': garment_type,
+            'model': model_params
+        }
+        # 只在整套搭配时加入下装，单件服装的缓存键保持不变
+        if bottom_garment_url:
+            material['bottom_garment'] = self.content_digest(bottom_garment_url)
+        material = json.dumps(material, sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key):
+        """返回缓存的结果，未命中返回None"""
+        return self.backend.get(f"result:{key}")
+
+    def set(self, key, value):
+        self.backend.set(f"result:{key}", value, self.ttl)
+
+    def get_inflight(self, key):
+        """返回相同输入正在处理中的任务ID（其他进程正在提交、尚未拿到任务ID时返回None）"""
+        task_id = self.backend.get(f"inflight:{key}")
+        return None if not task_id or task_id.startswith(_PENDING_PREFIX) else task_id
+
+    def _claim_ttl(self):
+        """提交权占位的有效期：覆盖排队等待配额和提交请求的最长时间，持有者异常退出后自动失效"""
+        return Config.GOVERNOR_MAX_WAIT + Config.HTTP_CONNECT_TIMEOUT + Config.HTTP_READ_TIMEOUT
+
+    def _try_reserve(self, key):
+        task_id = self.backend.get(f"inflight:{key}")
+        if task_id and not task_id.startswith(_PENDING_PREFIX):
+            return task_id, False
+        if task_id is None and self.backend.add(f"inflight:{key}", f"{_PENDING_PREFIX}{uuid.uuid4().hex}",
+                                                math.ceil(self._claim_ttl())):
+            return None, True
+        return None, False
+
+    def reserve_inflight(self, key):
+        """
+        跨进程合并相同输入的提交（调用方已持有该键的进程内锁）
+
+        相同输入已有进行中的任务时返回该任务；否则原子地抢占提交权（redis为SET NX，
+        磁盘后端为文件锁），抢到的调用方提交后调用set_inflight，提交失败时调用clear_inflight；
+        其他进程正在提交时等待其拿到任务ID，等待超过占位有效期后不再合并、自行提交。
+
+        返回:
+            (task_id, owner): 复用已有任务时task_id为任务ID；owner为True表示由调用方提交
+        """
+        deadline = time.monotonic() + self._claim_ttl()
+        while True:
+            task_id, owner = self._try_reserve(key)
+            if task_id or owner or time.monotonic() >= deadline:
+                return task_id, owner or not task_id
+            time.sleep(_CLAIM_POLL_INTERVAL)
+
+    async def reserve_inflight_async(self, key):
+        """reserve_inflight的协程版本，等待其他进程提交时不占用线程"""
+        deadline = time.monotonic() + self._claim_ttl()
+        while True:
+            task_id, owner = await asyncio.to_thread(self._try_reserve, key)
+            if task_id or owner or time.monotonic() >= deadline:
+                return task_id, owner or not task_id
+            await asyncio.sleep(_CLAIM_POLL_INTERVAL)
+
+    def set_inflight(self, key, task_id, ttl=None):
+        self.backend.set(f"inflight:{key}", task_id, ttl or Config.TASK_MAX_WAIT)
+
+    def clear_inflight(self, key):
+        self.backend.delete(f"inflight:{key}")
+
+    def mark_prefetched(self, key):
+        """标记该键的任务由推测性预取提交（用于统计预取命中）"""
+        if self.enabled:
+            self.backend.set(f"prefetched:{key}", True, self.ttl)
+
+    def claim_prefetched(self, key):
+        """该键的结果（或进行中的任务）来自预取且是首次被用户请求时返回True，并清除标记"""
+        if not self.enabled or not self.backend.get(f"prefetched:{key}"):
+            return False
+        self.backend.delete(f"prefetched:{key}")
+        return True
+
+    def _lock_entry(self, key):
+        with self._locks_guard:
+            entry = self._locks.setdefault(key, [_KeyLock(), 0])
+            entry[1] += 1
+        return entry
+
+    def _release_entry(self, key, entry):
+        with self._locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    @asynccontextmanager
+    async def lock_async(self, key):
+        """
+        lock的协程版本：与lock共用同一把进程内锁（ASGI模式下其余同步接口在线程中执行），
+        锁被占用时挂起等待锁被移交，不阻塞事件循环
+        """
+        entry = self._lock_entry(key)
+        try:
+            await entry[0].acquire_async()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            self._release_entry(key, entry)
+
+    @contextmanager
+    def lock(self, key):
+        """持有该键对应的进程内锁，不同键之间互不阻塞"""
+        entry = self._lock_entry(key)
+        try:
+            entry[0].acquire()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            self._release_entry(key, entry)
+
+
+class _KeyLock:
+    """
+    线程和协程共用的互斥锁：释放时按先来后到直接移交给下一个等待者
+
+    线程在Future上阻塞等待，协程await同一个Future（asyncio.wrap_future），不需要轮询
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._locked = False
+        self._waiters = deque()
+
+    def _enqueue(self):
+        """锁空闲时直接占用并返回None，否则返回排队等待移交的Future"""
+        with self._mutex:
+            if not self._locked:
+                self._locked = True
+                return None
+            waiter = Future()
+            self._waiters.append(waiter)
+            return waiter
+
+    def acquire(self):
+        waiter = self._enqueue()
+        if waiter is not None:
+            waiter.result()
+
+    async def acquire_async(self):
+        waiter = self._enqueue()
+        if waiter is None:
+            return
+        try:
+            await asyncio.wrap_future(waiter)
+        except asyncio.CancelledError:
+            # 取消前锁已移交给本等待者时需要释放，否则移交给下一个等待者
+            if not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._mutex:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                # 已取消的等待者跳过
+                if waiter.set_running_or_notify_cancel():
+                    waiter.set_result(None)
+                    return
+            self._locked = False
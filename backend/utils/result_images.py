@@ -0,0 +1,234 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import Config
+from utils.storage import LocalStorage
+from utils.upload_store import SpooledUpload
+from utils.image_preprocess import FORMAT_EXTENSIONS, Image, get_pool, render_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# 原图可能的扩展名（取自DashScope结果URL的路径）
+ORIGINAL_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+
+
+class DiskLRUCache:
+    """
+    按总大小淘汰的本地磁盘缓存
+
+    每个条目一个文件，最近访问时间记录在文件的mtime中，同一台机器上的多个worker共享同一目录；
+    总大小超过上限时删除最久未访问的文件，直到降到上限的90%。
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or Config.RESULT_IMAGE_CACHE_DIR
+        self.max_bytes = max_bytes or Config.RESULT_IMAGE_CACHE_MAX_BYTES
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """返回缓存文件路径并刷新访问时间，未命中返回None"""
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, name, src_path):
+        """复制文件到缓存（原子替换），返回缓存文件路径"""
+        path = self.path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def _scan(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        # 重新统计实际大小（其他worker也在写入同一目录）
+        entries, total = self._scan()
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        self._size = total
+        if removed:
+            logger.info(f"结果图片缓存已淘汰 {removed} 个文件，当前 {total} 字节")
+
+
+class ResultImageStore:
+    """
+    试衣结果图片代理
+
+    DashScope返回的结果URL是有时效的签名地址。任务完成后只下载一次结果图片，
+    原图和不同宽度/格式的缩略图保存到存储后端（长期有效），并通过本地磁盘LRU缓存提供访问。
+    文件名为 "<task_id>.<变体>"，例如 "<task_id>.png"、"<task_id>.w320.webp"。
+    """
+
+    prefix = 'results/'
+
+    def __init__(self, storage, session, cache=None, widths=None, formats=None, quality=None):
+        self.storage = storage
+        self.session = session
+        self.widths = widths or Config.RESULT_THUMBNAIL_WIDTHS
+        self.formats = formats or Config.RESULT_THUMBNAIL_FORMATS
+        self.quality = quality or Config.RESULT_THUMBNAIL_QUALITY
+        # 本地存储本身就在磁盘上，不再额外缓存
+        self.local = isinstance(storage, LocalStorage)
+        self.cache = None if self.local else (cache or DiskLRUCache())
+
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='tryon-result-image')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def original_variant(source_url):
+        """根据结果URL确定原图的扩展名"""
+        extension = os.path.splitext(urlparse(source_url).path)[1].lstrip('.').lower()
+        return extension if extension in ORIGINAL_EXTENSIONS else 'png'
+
+    def thumbnail_variants(self):
+        return [f"w{width}.{FORMAT_EXTENSIONS[output_format]}"
+                for width in self.widths for output_format in self.formats]
+
+    def is_valid_variant(self, variant):
+        return variant in ORIGINAL_EXTENSIONS or variant in self.thumbnail_variants()
+
+    def schedule(self, task_id, source_url):
+        """在后台线程中下载并保存结果图片（任务完成时调用）"""
+        self._single_flight(task_id, source_url, wait=False)
+
+    def open(self, task_id, variant, source_url=None):
+        """
+        返回结果图片变体的本地文件路径
+
+        依次查找磁盘缓存和存储后端；都没有且提供了source_url时，立即下载并生成缩略图
+
+        返回:
+            str: 文件路径，不存在时返回None
+        """
+        name = f"{task_id}.{variant}"
+        path = self._find(name)
+        if path is None and source_url:
+            self._single_flight(task_id, source_url, wait=True)
+            path = self._find(name)
+        return path
+
+    def _find(self, name):
+        key = f"{self.prefix}{name}"
+        if self.local:
+            path = self.storage.path(key)
+            return path if os.path.isfile(path) else None
+
+        path = self.cache.get(name)
+        if path is not None:
+            return path
+        # 磁盘缓存已淘汰：从存储后端取回一次
+        try:
+            if not self.storage.exists(key):
+                return None
+            fd, tmp_path = tempfile.mkstemp(prefix='result-', dir=Config.UPLOAD_TMP_DIR)
+            os.close(fd)
+            try:
+                self._download(self.storage.url(key), tmp_path)
+                return self.cache.put(name, tmp_path)
+            finally:
+                os.remove(tmp_path)
+        except Exception as e:
+            logger.error(f"从存储后端获取结果图片 {key} 失败: {e}")
+            return None
+
+    def _single_flight(self, task_id, source_url, wait):
+        """同一任务同时只有一次下载，并发的调用方等待同一个结果"""
+        with self._lock:
+            future = self._inflight.get(task_id)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[task_id] = future
+
+        if owner:
+            def run():
+                try:
+                    self._persist(task_id, source_url)
+                    future.set_result(True)
+                except Exception as e:
+                    logger.error(f"保存任务 {task_id} 的结果图片失败: {e}")
+                    future.set_result(False)
+                finally:
+                    with self._lock:
+                        self._inflight.pop(task_id, None)
+
+            if wait:
+                run()
+            else:
+                self._executor.submit(run)
+                return
+        if wait:
+            future.result(timeout=Config.IMAGE_PREPROCESS_TIMEOUT + Config.HTTP_READ_TIMEOUT)
+
+    def _persist(self, task_id, source_url):
+        original = f"{task_id}.{self.original_variant(source_url)}"
+        if self._find(original) is not None:
+            return
+
+        work_dir = tempfile.mkdtemp(prefix='result-', dir=Config.UPLOAD_TMP_DIR)
+        try:
+            original_path = os.path.join(work_dir, original)
+            self._download(source_url, original_path)
+
+            files = {original: original_path}
+            if Image is not None:
+                future = get_pool().submit(render_thumbnails, original_path, work_dir,
+                                           self.widths, self.formats, self.quality)
+                thumbnails = future.result(timeout=Config.IMAGE_PREPROCESS_TIMEOUT)
+                files.update({f"{task_id}.{variant}": path for variant, path in thumbnails.items()})
+
+            for name, path in files.items():
+                if self.cache is not None:
+                    self.cache.put(name, path)
+                variant = name.split('.', 1)[1]
+                self.storage.store(SpooledUpload(path, task_id, os.path.getsize(path), variant), prefix=self.prefix)
+            logger.info(f"任务 {task_id} 的结果图片已保存（{len(files)} 个文件）")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _download(self, url, dst_path):
+        with self.session.get(url, stream=True, timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)) as response:
+            response.raise_for_status()
+            with open(dst_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=256 * 1024):
+                    f.write(chunk)
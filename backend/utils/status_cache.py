@@ -0,0 +1,149 @@
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from config import Config
+from utils import metrics as tryon_metrics
+from utils.aliyun_client import TERMINAL_STATES
+
+# 不会再变化的状态：结果长期缓存（UNKNOWN可能只是任务尚未在上游可见，按进行中处理）
+FINAL_STATES = TERMINAL_STATES - {'UNKNOWN'}
+
+
+class StatusUnavailable(Exception):
+    """等待合并的读取超时（负责读取的请求仍在排队等待配额或查询上游），状态接口返回503"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"任务状态读取超时，{retry_after}秒后重试")
+        self.retry_after = retry_after
+
+
+def coalesced_wait_timeout():
+    """等待合并的读取的最长时间：负责读取的请求可能先在调度器中排队（最多GOVERNOR_MAX_WAIT），再查询上游"""
+    return Config.GOVERNOR_MAX_WAIT + Config.HTTP_CONNECT_TIMEOUT + Config.HTTP_QUERY_TIMEOUT
+
+
+def _unavailable():
+    return StatusUnavailable(max(1, math.ceil(Config.TASK_POLL_INITIAL_INTERVAL)))
+
+
+class StatusCache:
+    """
+    任务状态的进程内短时缓存，并合并同一任务的并发读取（single-flight）
+
+    多个标签页或重试的客户端同时查询同一个任务时只读取一次（跟踪器、登记表或上游），
+    其余请求等待同一个结果。已结束的状态不再变化，一直缓存到按LRU淘汰；
+    进行中的状态只缓存很短的时间（STATUS_CACHE_TTL），状态变化最多延迟这么久才可见。
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = Config.STATUS_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or Config.STATUS_CACHE_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        """返回未过期的缓存值，没有时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        tryon_metrics.STATUS_LOOKUPS.labels(source='memo').inc()
+        return value
+
+    def _store(self, key, value, status):
+        if value is None:
+            return
+        expires_at = None if status in FINAL_STATES else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """丢弃缓存的状态（任务状态变化时调用）"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get(self, key, loader):
+        """
+        返回key的状态，缓存未命中时调用loader()读取
+
+        参数:
+            loader: 返回 (值, 任务状态) 的函数，值为None表示读取失败（不缓存）
+
+        返回:
+            loader返回的值
+
+        抛出:
+            StatusUnavailable: 等待其他请求的读取超时
+        """
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            tryon_metrics.STATUS_LOOKUPS.labels(source='coalesced').inc()
+            try:
+                return future.result(timeout=coalesced_wait_timeout())
+            except FutureTimeout:
+                raise _unavailable()
+
+        try:
+            value, status = loader()
+            self._store(key, value, status)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def get_async(self, key, loader):
+        """get的协程版本，loader为返回 (值, 任务状态) 的协程函数；等待合并的读取时不占用线程"""
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            tryon_metrics.STATUS_LOOKUPS.labels(source='coalesced').inc()
+            try:
+                # shield：超时只取消本请求的等待，不取消其他请求共享的Future
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), coalesced_wait_timeout())
+            except asyncio.TimeoutError:
+                raise _unavailable()
+
+        try:
+            value, status = await loader()
+            self._store(key, value, status)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
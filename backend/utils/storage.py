@@ -0,0 +1,425 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import asyncio
+import shutil
+import mimetypes
+import logging
+import ipaddress
+import threading
+from urllib.parse import urlsplit
+from config import Config
+from utils.result_cache import MemoryCacheBackend
+from utils.http_session import create_adapter, register_session
+
+logger = logging.getLogger(__name__)
+
+# 内容寻址的文件名永不改变，浏览器和CDN可以长期缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host or '')
+        return True
+    except ValueError:
+        return False
+
+
+class StorageBackend:
+    """
+    上传图片的存储后端
+
+    对象键由内容哈希决定（见 utils.upload_store.SpooledUpload.key），相同内容只存储一份：
+    已确认存在的键记录在进程内索引中，命中时无需再访问存储服务。
+    """
+
+    name = 'base'
+    # 对象键前缀
+    prefix = ''
+
+    def __init__(self):
+        self._known_keys = MemoryCacheBackend(max_entries=Config.UPLOAD_INDEX_MAX_ENTRIES)
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def put_file(self, key, upload):
+        """将临时文件写入存储（可以移动或删除upload.path）"""
+        raise NotImplementedError
+
+    def url(self, key, base_url=None):
+        """返回对象的访问URL，base_url为当前请求的站点地址（仅本地存储使用）"""
+        raise NotImplementedError
+
+    def head(self, key):
+        """返回对象的 {'size', 'content_type'}，对象不存在时返回None"""
+        raise NotImplementedError
+
+    def check(self):
+        """连通性检查，正常时返回None，否则返回错误信息"""
+        return None
+
+    def presign_upload(self, key, content_type, max_size, expires):
+        """
+        签发浏览器直接上传对象用的短时签名表单（POST policy，存储服务拒绝超过max_size字节的文件）
+
+        返回:
+            dict: {'method', 'url', 'fields'}，浏览器以multipart表单POST，fields原样放在文件字段之前；
+                  不支持直传的后端（本地存储）返回None
+        """
+        return None
+
+    def check_upload(self, key, content_types, max_size):
+        """
+        浏览器直传的对象用于试衣之前确认其存在、类型和大小（HEAD请求）
+
+        签名表单已经限制了上传大小，这里再确认存储中的对象本身；对象禁止覆盖，
+        确认过的键记录在进程内索引中，不再重复检查。
+
+        返回:
+            str: 不符合要求的原因，符合时为None
+        """
+        if self._known_keys.get(key):
+            return None
+        info = self.head(key)
+        if info is None:
+            return '对象不存在'
+        if info['content_type'] not in content_types:
+            return f"不支持的类型: {info['content_type']}"
+        if info['size'] > max_size:
+            return f"文件太大: {info['size']} 字节"
+        self._known_keys.set(key, True)
+        return None
+
+    def store(self, upload, prefix=None):
+        """
+        保存上传内容，对象已存在时跳过写入
+
+        参数:
+            upload: utils.upload_store.SpooledUpload 实例
+            prefix: 对象键前缀，默认使用后端的prefix
+
+        返回:
+            str: 对象键
+        """
+        key = f"{self.prefix if prefix is None else prefix}{upload.key}"
+        if self._known_keys.get(key):
+            logger.info(f"对象已存在（本地索引），跳过上传: {key}")
+        elif self.exists(key):
+            logger.info(f"对象已存在，跳过上传: {key}")
+        else:
+            self.put_file(key, upload)
+            logger.info(f"已保存到{self.name}: {key} ({upload.size} 字节)")
+        self._known_keys.set(key, True)
+        return key
+
+    async def exists_async(self, key):
+        return await asyncio.to_thread(self.exists, key)
+
+    async def put_file_async(self, key, upload):
+        await asyncio.to_thread(self.put_file, key, upload)
+
+    async def store_async(self, upload, prefix=None):
+        """store的协程版本（ASGI模式），默认在线程池中执行存在检查和写入，支持异步访问的后端可以覆盖"""
+        key = f"{self.prefix if prefix is None else prefix}{upload.key}"
+        if self._known_keys.get(key):
+            logger.info(f"对象已存在（本地索引），跳过上传: {key}")
+        elif await self.exists_async(key):
+            logger.info(f"对象已存在，跳过上传: {key}")
+        else:
+            await self.put_file_async(key, upload)
+            logger.info(f"已保存到{self.name}: {key} ({upload.size} 字节)")
+        self._known_keys.set(key, True)
+        return key
+
+
+class OSSStorage(StorageBackend):
+    """阿里云OSS存储，大文件使用分片断点续传"""
+
+    name = 'oss'
+    prefix = 'uploads/'
+
+    def __init__(self, access_key_id=None, access_key_secret=None, endpoint=None, bucket_name=None, public_url=None):
+        import oss2
+        super().__init__()
+        self.endpoint = endpoint or Config.OSS_ENDPOINT
+        self.bucket_name = bucket_name or Config.OSS_BUCKET_NAME
+        # 签发直传表单（PostObject policy）时在本地计算签名
+        self.access_key_id = access_key_id or Config.OSS_ACCESS_KEY_ID
+        self._access_key_secret = access_key_secret or Config.OSS_ACCESS_KEY_SECRET
+        auth = oss2.Auth(self.access_key_id, self._access_key_secret)
+        # OSS使用独立的长连接池（重试交给oss2自身处理）
+        session = oss2.Session(adapter=create_adapter(max_retries=0))
+        register_session('oss', session.session)
+        self.bucket = oss2.Bucket(auth, self.endpoint, self.bucket_name, session=session,
+                                  connect_timeout=Config.HTTP_CONNECT_TIMEOUT)
+        host = self.endpoint.replace('https://', '').replace('http://', '')
+        self.public_url = (public_url or Config.OSS_PUBLIC_URL or f"https://{self.bucket_name}.{host}").rstrip('/')
+        # 直传表单的提交地址：浏览器直接访问，endpoint未指定协议时使用https；
+        # 与oss2相同，IP或localhost的endpoint（自建网关、本地模拟服务）使用路径形式
+        parts = urlsplit(self.endpoint if '://' in self.endpoint else f"https://{self.endpoint}")
+        if parts.hostname == 'localhost' or _is_ip(parts.hostname):
+            self.upload_url = f"{parts.scheme}://{parts.netloc}/{self.bucket_name}/"
+        else:
+            self.upload_url = f"{parts.scheme}://{self.bucket_name}.{parts.netloc}/"
+
+    def exists(self, key):
+        return self.bucket.object_exists(key)
+
+    def head(self, key):
+        import oss2
+        try:
+            meta = self.bucket.head_object(key)
+        except oss2.exceptions.NotFound:
+            return None
+        return {'size': meta.content_length, 'content_type': meta.content_type}
+
+    def put_file(self, key, upload):
+        import oss2
+        if upload.size >= Config.OSS_MULTIPART_THRESHOLD:
+            oss2.resumable_upload(
+                self.bucket, key, upload.path,
+                store=oss2.ResumableStore(root=Config.UPLOAD_TMP_DIR),
+                multipart_threshold=Config.OSS_MULTIPART_THRESHOLD,
+                part_size=Config.OSS_MULTIPART_PART_SIZE,
+                num_threads=Config.OSS_MULTIPART_THREADS
+            )
+        else:
+            self.bucket.put_object_from_file(key, upload.path)
+
+    async def exists_async(self, key):
+        """通过签名URL发送HEAD请求（签名在本地计算，请求由异步客户端发送）"""
+        from utils.async_http import get_async_client
+        url = self.bucket.sign_url('HEAD', key, 300, slash_safe=True)
+        response = await get_async_client('oss').head(url)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    async def put_file_async(self, key, upload):
+        """小文件通过签名URL以异步客户端PUT上传，大文件仍使用oss2的分片断点续传（在线程池中执行）"""
+        if upload.size >= Config.OSS_MULTIPART_THRESHOLD:
+            return await super().put_file_async(key, upload)
+        from utils.async_http import get_async_client
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        url = self.bucket.sign_url('PUT', key, 300, headers={'Content-Type': content_type}, slash_safe=True)
+        with open(upload.path, 'rb') as f:
+            content = await asyncio.to_thread(f.read)
+        response = await get_async_client('oss').put(url, content=content, headers={'Content-Type': content_type})
+        response.raise_for_status()
+
+    def presign_upload(self, key, content_type, max_size, expires):
+        # PostObject表单：policy限定对象键、各表单字段和文件大小（签名URL的PUT无法限制上传的大小）；
+        # 禁止覆盖：表单在有效期内也不能替换已经用于试衣的图片
+        fields = {'key': key, 'Content-Type': content_type, 'Cache-Control': IMMUTABLE_CACHE_CONTROL,
+                  'x-oss-forbid-overwrite': 'true', 'success_action_status': '204'}
+        policy = {
+            'expiration': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(time.time() + expires)),
+            'conditions': [{'bucket': self.bucket_name}, ['content-length-range', 1, max_size]]
+                          + [['eq', f"${name}", value] for name, value in fields.items()]
+        }
+        encoded = base64.b64encode(json.dumps(policy).encode()).decode()
+        signature = hmac.new(self._access_key_secret.encode(), encoded.encode(), hashlib.sha1).digest()
+        fields.update({'OSSAccessKeyId': self.access_key_id, 'policy': encoded,
+                       'Signature': base64.b64encode(signature).decode()})
+        return {'method': 'POST', 'url': self.upload_url, 'fields': fields}
+
+    def url(self, key, base_url=None):
+        return f"{self.public_url}/{key}"
+
+    def check(self):
+        import oss2
+        try:
+            next(iter(oss2.ObjectIterator(self.bucket, max_keys=1)), None)
+            return None
+        except Exception as e:
+            return str(e)
+
+
+class S3Storage(StorageBackend):
+    """S3兼容存储（AWS S3、MinIO等），需要安装boto3"""
+
+    name = 's3'
+    prefix = 'uploads/'
+
+    def __init__(self, endpoint_url=None, bucket_name=None, access_key_id=None, secret_access_key=None,
+                 region=None, public_url=None):
+        import boto3
+        from botocore.config import Config as BotoConfig
+        super().__init__()
+        self.endpoint_url = endpoint_url or Config.S3_ENDPOINT_URL
+        self.bucket_name = bucket_name or Config.S3_BUCKET
+        self.client = boto3.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=access_key_id or Config.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=secret_access_key or Config.S3_SECRET_ACCESS_KEY,
+            region_name=region or Config.S3_REGION,
+            config=BotoConfig(
+                connect_timeout=Config.HTTP_CONNECT_TIMEOUT,
+                read_timeout=Config.HTTP_READ_TIMEOUT,
+                max_pool_connections=Config.HTTP_POOL_SIZE,
+                # MinIO等自建服务通常使用路径风格的地址
+                s3={'addressing_style': 'path' if self.endpoint_url else 'auto'}
+            )
+        )
+        default_url = f"{self.endpoint_url.rstrip('/')}/{self.bucket_name}" if self.endpoint_url \
+            else f"https://{self.bucket_name}.s3.amazonaws.com"
+        self.public_url = (public_url or Config.S3_PUBLIC_URL or default_url).rstrip('/')
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            meta = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {'size': meta['ContentLength'], 'content_type': meta.get('ContentType')}
+
+    def put_file(self, key, upload):
+        from boto3.s3.transfer import TransferConfig
+        # 超过阈值时自动使用分片上传
+        self.client.upload_file(
+            upload.path, self.bucket_name, key,
+            ExtraArgs={'CacheControl': IMMUTABLE_CACHE_CONTROL},
+            Config=TransferConfig(
+                multipart_threshold=Config.OSS_MULTIPART_THRESHOLD,
+                multipart_chunksize=Config.OSS_MULTIPART_PART_SIZE,
+                max_concurrency=Config.OSS_MULTIPART_THREADS
+            )
+        )
+
+    def presign_upload(self, key, content_type, max_size, expires):
+        signed = self.client.generate_presigned_post(
+            self.bucket_name, key, ExpiresIn=expires,
+            Fields={'Content-Type': content_type, 'Cache-Control': IMMUTABLE_CACHE_CONTROL},
+            Conditions=[{'Content-Type': content_type}, {'Cache-Control': IMMUTABLE_CACHE_CONTROL},
+                        ['content-length-range', 1, max_size]]
+        )
+        return {'method': 'POST', 'url': signed['url'], 'fields': signed['fields']}
+
+    def url(self, key, base_url=None):
+        return f"{self.public_url}/{key}"
+
+    def check(self):
+        try:
+            self.client.head_bucket(Bucket=self.bucket_name)
+            return None
+        except Exception as e:
+            return str(e)
+
+
+class LocalStorage(StorageBackend):
+    """
+    本地目录存储，文件通过 /uploads/<key> 提供访问
+
+    serve_mode决定文件内容如何发送，"x-accel-redirect"（nginx）和"x-sendfile"（Apache/lighttpd）
+    由前端服务器直接读取文件，"send_file"由WSGI服务器通过wsgi.file_wrapper（gunicorn下为sendfile）发送，
+    图片字节都不经过Python代码。
+    """
+
+    name = 'local'
+
+    def __init__(self, folder=None, public_url=None, serve_mode=None, accel_prefix=None):
+        super().__init__()
+        self.folder = os.path.abspath(folder or Config.UPLOAD_FOLDER)
+        self.public_url = (public_url or Config.LOCAL_STORAGE_PUBLIC_URL or '').rstrip('/') or None
+        self.serve_mode = (serve_mode or Config.LOCAL_STORAGE_SERVE_MODE).lower()
+        self.accel_prefix = (accel_prefix or Config.LOCAL_STORAGE_ACCEL_PREFIX).rstrip('/')
+        os.makedirs(self.folder, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.folder, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def head(self, key):
+        try:
+            size = os.path.getsize(self.path(key))
+        except OSError:
+            return None
+        return {'size': size, 'content_type': mimetypes.guess_type(key)[0]}
+
+    def put_file(self, key, upload):
+        # 先移动到同目录下的临时名称再原子重命名，并发请求不会读到写了一半的文件
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        tmp_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.move(upload.path, tmp_path)
+        os.replace(tmp_path, self.path(key))
+
+    def url(self, key, base_url=None):
+        return f"{self.public_url or (base_url or '/').rstrip('/') + '/uploads'}/{key}"
+
+    def check(self):
+        return None if os.access(self.folder, os.W_OK) else f"上传目录不可写: {self.folder}"
+
+    def serve(self, key):
+        """
+        返回提供文件访问的Flask响应，文件不存在时返回None
+
+        send_file模式支持ETag/If-None-Match（304）和Range（206）；
+        另外两种模式由前端服务器处理条件请求和Range。
+        """
+        from flask import Response, send_file
+        from werkzeug.utils import secure_filename
+
+        key = secure_filename(key)
+        path = self.path(key)
+        if not key or not os.path.isfile(path):
+            return None
+
+        if self.serve_mode == 'x-accel-redirect':
+            response = Response(mimetype=mimetypes.guess_type(key)[0])
+            response.headers['X-Accel-Redirect'] = f"{self.accel_prefix}/{key}"
+        elif self.serve_mode == 'x-sendfile':
+            response = Response(mimetype=mimetypes.guess_type(key)[0])
+            response.headers['X-Sendfile'] = path
+        else:
+            response = send_file(path, conditional=True, etag=True, max_age=31536000)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def create_storage_backend(name=None):
+    """
+    根据配置创建存储后端
+
+    参数:
+        name: "oss"、"s3"、"local" 或 "auto"（配置了OSS时使用OSS，否则使用本地目录），
+              默认使用 Config.STORAGE_BACKEND
+
+    返回:
+        存储后端实例，远程存储初始化失败时退回本地目录
+    """
+    name = (name or Config.STORAGE_BACKEND).lower()
+    if name == 'auto':
+        oss_configured = all([Config.OSS_ACCESS_KEY_ID, Config.OSS_ACCESS_KEY_SECRET,
+                              Config.OSS_ENDPOINT, Config.OSS_BUCKET_NAME])
+        if not oss_configured:
+            logger.warning("阿里云OSS配置不完整，将使用本地存储（不推荐用于生产环境）")
+        name = 'oss' if oss_configured else 'local'
+    try:
+        if name == 'oss':
+            return OSSStorage()
+        if name == 's3':
+            return S3Storage()
+    except Exception as e:
+        logger.error(f"{name}存储初始化失败，改用本地存储: {e}")
+    return LocalStorage()
@@ -0,0 +1,159 @@
+import os
+import heapq
+import random
+import asyncio
+import logging
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TaskPoller:
+    """
+    共享的asyncio轮询调度器
+
+    所有待查询的任务按下次检查时间放入一个最小堆，由同一个事件循环中的单个调度协程统一调度。
+    查询间隔先短后长（指数退避 + 随机抖动），并通过最小请求间隔限制对上游的总QPS。
+    """
+
+    def __init__(self, query_func, on_result, initial_interval=None, max_interval=None,
+                 backoff=None, jitter=None, max_qps=None, concurrency=None):
+        """
+        参数:
+            query_func: 查询函数 query_func(task_id) -> dict，可以是普通函数（在线程池中执行）或协程函数
+            on_result: 回调 on_result(task_id, result) -> bool，返回True表示任务已结束，不再调度；
+                       与query_func相同，普通函数在线程池中执行（可以写登记表、执行结束回调），不阻塞调度协程
+            initial_interval: 首次检查前的等待时间(秒)
+            max_interval: 退避后的最大检查间隔(秒)
+            backoff: 每次检查后间隔的增长倍数
+            jitter: 随机抖动比例 (0.2 表示 ±20%)
+            max_qps: 对上游的最大查询速率
+            concurrency: 同时进行的最大查询数
+        """
+        self.query_func = query_func
+        self.on_result = on_result
+        self.initial_interval = initial_interval or Config.TASK_POLL_INITIAL_INTERVAL
+        self.max_interval = max_interval or Config.TASK_POLL_MAX_INTERVAL
+        self.backoff = backoff or Config.TASK_POLL_BACKOFF
+        self.jitter = Config.TASK_POLL_JITTER if jitter is None else jitter
+        self.max_qps = max_qps or Config.TASK_POLL_MAX_QPS
+        self.concurrency = concurrency or Config.TASK_POLL_CONCURRENCY
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._loop = None
+        self._wakeup = None
+        self._thread = None
+        self._pid = None
+        self._executor = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.requests_sent = 0
+
+    def next_interval(self, attempt):
+        """计算第attempt次检查之后的等待时间"""
+        interval = min(self.max_interval, self.initial_interval * (self.backoff ** attempt))
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return interval
+
+    def schedule(self, task_id, delay=None, attempt=0):
+        """
+        将任务加入调度队列（线程安全，可在任意线程调用）
+
+        参数:
+            task_id: 任务ID
+            delay: 首次检查前的等待时间(秒)，默认使用initial_interval
+            attempt: 已检查次数，用于计算退避间隔
+        """
+        self.start()
+        delay = self.next_interval(attempt) if delay is None else delay
+        self._loop.call_soon_threadsafe(self._push, task_id, delay, attempt)
+
+    def queue_size(self):
+        """返回调度队列中的任务数量"""
+        return len(self._heap)
+
+    def start(self):
+        """启动事件循环线程（gunicorn fork之后会在各worker中重新启动）"""
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._heap = []
+                    self._started.clear()
+                    self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='tryon-poll')
+                    self._thread = threading.Thread(target=self._run_loop, name='tryon-task-poller', daemon=True)
+                    self._thread.start()
+        # 并发调用时，等待事件循环真正就绪后再返回
+        self._started.wait()
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._started.set()
+        try:
+            self._loop.run_until_complete(self._scheduler())
+        except Exception as e:
+            logger.exception(f"任务轮询调度器异常退出: {e}")
+
+    def _push(self, task_id, delay, attempt):
+        heapq.heappush(self._heap, (self._loop.time() + delay, next(self._seq), task_id, attempt))
+        self._wakeup.set()
+
+    async def _scheduler(self):
+        """唯一的调度协程：按到期时间依次发出查询，并控制QPS和并发"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        min_gap = 1.0 / self.max_qps
+        next_slot = 0.0
+
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            due = self._heap[0][0]
+            now = self._loop.time()
+            if due > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # 限速：相邻两次上游请求之间至少间隔 1/max_qps 秒
+            if next_slot > now:
+                await asyncio.sleep(next_slot - now)
+            next_slot = max(next_slot, now) + min_gap
+
+            _, _, task_id, attempt = heapq.heappop(self._heap)
+            await semaphore.acquire()
+            self._loop.create_task(self._check(task_id, attempt, semaphore))
+
+    async def _check(self, task_id, attempt, semaphore):
+        try:
+            self.requests_sent += 1
+            if asyncio.iscoroutinefunction(self.query_func):
+                result = await self.query_func(task_id)
+            else:
+                result = await self._loop.run_in_executor(self._executor, self.query_func, task_id)
+            if asyncio.iscoroutinefunction(self.on_result):
+                finished = await self.on_result(task_id, result)
+            else:
+                finished = await self._loop.run_in_executor(self._executor, self.on_result, task_id, result)
+        except Exception as e:
+            logger.error(f"轮询任务 {task_id} 时出错: {e}")
+            finished = False
+        finally:
+            semaphore.release()
+
+        if not finished:
+            self._push(task_id, self.next_interval(attempt + 1), attempt + 1)
@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import socket
+import logging
+import sqlite3
+import threading
+from config import Config
+# 任务结束状态（到达后不再轮询），与试衣客户端共用
+from utils.aliyun_client.states import TERMINAL_STATES
+
+logger = logging.getLogger(__name__)
+
+_TERMINAL_SQL = "(" + ", ".join(f"'{status}'" for status in sorted(TERMINAL_STATES)) + ")"
+
+
+def worker_id():
+    """当前进程的唯一标识（主机名:进程号），用于标记任务由哪个worker负责轮询"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SQLiteTaskStore:
+    """
+    基于SQLite的持久化任务登记表，同一台机器上的多个worker共享同一个数据库文件
+
+    每个未结束的任务带有一个租约（owner + lease_until），持有租约的worker负责轮询；
+    租约过期（worker被回收或崩溃）后，任意worker都可以接管。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.TASK_STORE_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self):
+        """每个线程（以及fork后的每个进程）使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        # 必须在建表之前设置，之后清理过期记录时可以增量回收空间
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                inputs_hash TEXT,
+                status TEXT NOT NULL,
+                image_url TEXT,
+                message TEXT,
+                meta TEXT,
+                submitted_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                lease_until REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_inputs ON tasks (inputs_hash);
+            CREATE INDEX IF NOT EXISTS idx_tasks_updated ON tasks (updated_at);
+            -- 部分索引只包含未结束的任务，表中积累大量历史记录时查找待接管任务依然很快
+            CREATE INDEX IF NOT EXISTS idx_tasks_pending ON tasks (lease_until)
+                WHERE status NOT IN {_TERMINAL_SQL};
+        """)
+
+    @staticmethod
+    def _to_record(row):
+        return {
+            'task_id': row['task_id'],
+            'task_status': row['status'],
+            'image_url': row['image_url'],
+            'message': row['message'] or '',
+            'submitted_at': row['submitted_at'],
+            'updated_at': row['updated_at'],
+            'meta': json.loads(row['meta']) if row['meta'] else {}
+        }
+
+    def create(self, record, inputs_hash, owner, lease):
+        """
+        登记新任务并由owner持有租约
+
+        返回:
+            bool: 任务已存在时返回False
+        """
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO tasks (task_id, inputs_hash, status, image_url, message, meta, "
+            "submitted_at, updated_at, owner, lease_until) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record['task_id'], inputs_hash, record['task_status'], record['image_url'], record['message'],
+             json.dumps(record['meta']), record['submitted_at'], record['updated_at'], owner, time.time() + lease)
+        )
+        return cursor.rowcount == 1
+
+    def get(self, task_id):
+        row = self._conn().execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._to_record(row) if row else None
+
+    def update(self, record, owner, lease):
+        """
+        写入最新状态；任务结束后释放租约
+
+        只有租约持有者能写入（暂停后恢复的worker不能覆盖接管者的状态和租约），已结束的任务不再改写
+
+        返回:
+            bool: 租约已被其他worker接管（或任务已结束、不存在）时返回False
+        """
+        finished = record['task_status'] in TERMINAL_STATES
+        cursor = self._conn().execute(
+            "UPDATE tasks SET status = ?, image_url = ?, message = ?, updated_at = ?, owner = ?, lease_until = ? "
+            f"WHERE task_id = ? AND (owner = ? OR owner IS NULL) AND status NOT IN {_TERMINAL_SQL}",
+            (record['task_status'], record['image_url'], record['message'], record['updated_at'],
+             None if finished else owner, None if finished else time.time() + lease, record['task_id'], owner)
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, task_id, owner, lease):
+        """
+        尝试取得未结束任务的租约（租约已过期或本来就属于owner）
+
+        返回:
+            dict: 成功时返回任务记录，否则返回None
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            f"UPDATE tasks SET owner = ?, lease_until = ? WHERE task_id = ? AND status NOT IN {_TERMINAL_SQL} "
+            "AND (lease_until IS NULL OR lease_until < ? OR owner = ?)",
+            (owner, now + lease, task_id, now, owner)
+        )
+        return self.get(task_id) if cursor.rowcount == 1 else None
+
+    def claim_orphans(self, owner, lease, limit=100):
+        """接管租约已过期的未结束任务（原worker已退出），返回成功接管的记录列表"""
+        rows = self._conn().execute(
+            f"SELECT task_id FROM tasks WHERE status NOT IN {_TERMINAL_SQL} AND lease_until < ? "
+            "ORDER BY lease_until LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+        claimed = [self.claim(row['task_id'], owner, lease) for row in rows]
+        return [record for record in claimed if record]
+
+    def renew(self, task_ids, owner, lease):
+        """续租本worker正在轮询的任务"""
+        if not task_ids:
+            return
+        self._conn().executemany(
+            "UPDATE tasks SET lease_until = ? WHERE task_id = ? AND owner = ?",
+            [(time.time() + lease, task_id, owner) for task_id in task_ids]
+        )
+
+    def sweep(self, retention, batch_size=5000):
+        """
+        分批删除超过保留时间未更新的任务，并增量回收数据库文件空间
+
+        返回:
+            int: 删除的记录数
+        """
+        conn = self._conn()
+        cutoff = time.time() - retention
+        removed = 0
+        while True:
+            cursor = conn.execute(
+                "DELETE FROM tasks WHERE rowid IN "
+                "(SELECT rowid FROM tasks WHERE updated_at < ? LIMIT ?)",
+                (cutoff, batch_size)
+            )
+            removed += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+        if removed:
+            conn.execute('PRAGMA incremental_vacuum')
+        return removed
+
+
+# 新建任务：不存在时写入哈希并加入租约集合
+_CREATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return 1
+"""
+
+# 接管任务：租约已过期或本来就属于该worker
+_CLAIM_SCRIPT = """
+local lease_until = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not lease_until then
+    return 0
+end
+if tonumber(lease_until) >= tonumber(ARGV[3]) and redis.call('HGET', KEYS[1], 'owner') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+redis.call('HSET', KEYS[1], 'owner', ARGV[2])
+return 1
+"""
+
+# 写入最新状态：只有租约持有者能写入，任务结束后释放租约（owner置空，已结束的任务不再改写）
+_UPDATE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'owner') ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[6], 'image_url', ARGV[7], 'message', ARGV[8], 'updated_at', ARGV[9])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if ARGV[5] == '1' then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HSET', KEYS[1], 'owner', '')
+else
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+end
+return 1
+"""
+
+# 续租：只续本worker仍持有租约的任务（KEYS[2..]为任务哈希，ARGV[3..]为对应的任务ID）
+_RENEW_SCRIPT = """
+local renewed = 0
+for i = 2, #KEYS do
+    if redis.call('HGET', KEYS[i], 'owner') == ARGV[1] then
+        redis.call('ZADD', KEYS[1], 'XX', ARGV[2], ARGV[i + 1])
+        renewed = renewed + 1
+    end
+end
+return renewed
+"""
+
+
+class RedisTaskStore:
+    """
+    基于Redis的任务登记表，可在多个节点之间共享（需要安装redis包）
+
+    每个任务保存为一个哈希并设置过期时间；未结束任务的租约保存在有序集合中（分数为租约到期时间）。
+    """
+
+    def __init__(self, url=None, prefix='paida:tasks:', retention=None):
+        import redis
+        self.client = redis.Redis.from_url(url or Config.REDIS_URL, decode_responses=True)
+        self.prefix = prefix
+        self.retention = retention or Config.TASK_STORE_RETENTION
+        self._leases_key = f"{prefix}leases"
+        self._create = self.client.register_script(_CREATE_SCRIPT)
+        self._claim = self.client.register_script(_CLAIM_SCRIPT)
+        self._update = self.client.register_script(_UPDATE_SCRIPT)
+        self._renew = self.client.register_script(_RENEW_SCRIPT)
+
+    def _key(self, task_id):
+        return f"{self.prefix}{task_id}"
+
+    @staticmethod
+    def _to_record(data):
+        return {
+            'task_id': data['task_id'],
+            'task_status': data['status'],
+            'image_url': data.get('image_url') or None,
+            'message': data.get('message', ''),
+            'submitted_at': float(data['submitted_at']),
+            'updated_at': float(data['updated_at']),
+            'meta': json.loads(data['meta']) if data.get('meta') else {}
+        }
+
+    def create(self, record, inputs_hash, owner, lease):
+        fields = {
+            'task_id': record['task_id'],
+            'inputs_hash': inputs_hash or '',
+            'status': record['task_status'],
+            'image_url': record['image_url'] or '',
+            'message': record['message'],
+            'meta': json.dumps(record['meta']),
+            'submitted_at': record['submitted_at'],
+            'updated_at': record['updated_at'],
+            'owner': owner
+        }
+        args = [record['task_id'], time.time() + lease, int(self.retention)]
+        for name, value in fields.items():
+            args.extend([name, value])
+        return bool(self._create(keys=[self._key(record['task_id']), self._leases_key], args=args))
+
+    def get(self, task_id):
+        data = self.client.hgetall(self._key(task_id))
+        return self._to_record(data) if data else None
+
+    def update(self, record, owner, lease):
+        finished = record['task_status'] in TERMINAL_STATES
+        updated = self._update(keys=[self._key(record['task_id']), self._leases_key], args=[
+            record['task_id'], owner, time.time() + lease, int(self.retention), 1 if finished else 0,
+            record['task_status'], record['image_url'] or '', record['message'], record['updated_at']
+        ])
+        return bool(updated)
+
+    def claim(self, task_id, owner, lease):
+        now = time.time()
+        claimed = self._claim(keys=[self._key(task_id), self._leases_key], args=[task_id, owner, now, now + lease])
+        return self.get(task_id) if claimed else None
+
+    def claim_orphans(self, owner, lease, limit=100):
+        task_ids = self.client.zrangebyscore(self._leases_key, '-inf', time.time(), start=0, num=limit)
+        claimed = [self.claim(task_id, owner, lease) for task_id in task_ids]
+        return [record for record in claimed if record]
+
+    def renew(self, task_ids, owner, lease):
+        if not task_ids:
+            return
+        self._renew(keys=[self._leases_key] + [self._key(task_id) for task_id in task_ids],
+                    args=[owner, time.time() + lease] + list(task_ids))
+
+    def sweep(self, retention, batch_size=5000):
+        # 任务哈希由Redis按过期时间自动删除，这里只清理租约集合中早已失效的成员
+        return self.client.zremrangebyscore(self._leases_key, '-inf', time.time() - retention)
+
+
+def create_task_store(name=None):
+    """
+    根据配置创建任务登记表
+
+    参数:
+        name: "sqlite"、"redis" 或 "none"，默认使用 Config.TASK_STORE_BACKEND
+
+    返回:
+        任务登记表实例，"none"时返回None（任务状态只保存在进程内存中）
+    """
+    name = (name or Config.TASK_STORE_BACKEND).lower()
+    if name == 'none':
+        return None
+    if name == 'redis':
+        try:
+            return RedisTaskStore()
+        except Exception as e:
+            logger.error(f"Redis任务登记表初始化失败，改用SQLite: {e}")
+    return SQLiteTaskStore()
@@ -0,0 +1,444 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from config import Config
+from utils import tracing
+from utils.task_poller import TaskPoller
+from utils.task_store import TERMINAL_STATES, worker_id
+
+logger = logging.getLogger(__name__)
+
+
+def parse_upstream_time(value):
+    """解析DashScope返回的时间（如 "2024-05-20 16:08:02.123"），只用于计算时间差，无需时区；无法解析时返回None"""
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _resolve_future(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class TaskTracker:
+    """
+    后台任务跟踪器：本进程负责的任务由共享的TaskPoller统一轮询，最新状态缓存在内存中
+
+    配置了持久化任务登记表时，任务状态同时写入登记表：worker重启后可以接管未完成的任务，
+    其他worker或节点也可以直接从登记表查询任务状态。
+    """
+
+    def __init__(self, client, max_wait=None, result_ttl=None, poller=None, store=None):
+        """
+        参数:
+            client: 提供 query_task_status(task_id) 的试衣客户端
+            max_wait: 单个任务最长跟踪时间(秒)
+            result_ttl: 已结束任务在内存中的保留时间(秒)
+            poller: 共享轮询调度器，默认新建
+            store: 持久化任务登记表（utils.task_store），None表示只保存在内存中
+        """
+        self.client = client
+        self.max_wait = max_wait or Config.TASK_MAX_WAIT
+        self.result_ttl = result_ttl or Config.TASK_RESULT_TTL
+        self.poller = poller or TaskPoller(self._query, self._on_result)
+        self.store = store
+        self.lease = Config.TASK_LEASE_TIMEOUT
+
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # 协程中等待状态变化的future（ASGI模式）：task_id -> [(事件循环, future)]
+        self._async_waiters = {}
+        self._last_expire = 0
+        self._listeners = []
+        self._maintenance = None
+        self._maintenance_pid = None
+        self._maintenance_lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """
+        注册任务结束回调 callback(record)，在轮询线程池中调用（不占用调度协程），
+        但会占用一个查询并发名额，回调内不应长时间阻塞
+        """
+        self._listeners.append(callback)
+
+    def track(self, task_id, inputs_hash=None, **meta):
+        """
+        登记一个已提交的任务，由共享轮询调度器负责查询（重复登记时返回已有记录）
+
+        任务已在登记表中且由其他worker轮询时，本进程不再重复查询上游，只从登记表读取状态。
+
+        参数:
+            task_id: 任务ID
+            inputs_hash: 输入内容的哈希，写入登记表便于按输入检索
+            meta: 附加信息（如服装类型），原样保存在任务记录中
+
+        返回:
+            dict: 任务记录的副本
+        """
+        now = time.time()
+        record = {
+            'task_id': task_id,
+            'task_status': 'PENDING',
+            'image_url': None,
+            'message': '',
+            'submitted_at': now,
+            'updated_at': now,
+            'meta': meta
+        }
+        with self._lock:
+            existing = self._tasks.get(task_id)
+            if existing is not None:
+                return dict(existing)
+
+        if self.store is not None:
+            created = self._store_call('create', record, inputs_hash, worker_id(), self.lease)
+            if created is False:
+                # 登记表中已有该任务（由其他worker提交，或在重启前提交）
+                stored = self._store_call('get', task_id)
+                if stored and stored['task_status'] in TERMINAL_STATES:
+                    return stored
+                claimed = self._store_call('claim', task_id, worker_id(), self.lease)
+                if not claimed:
+                    return stored or dict(record)
+                record = claimed
+
+        return self._adopt(record)
+
+    def resume(self):
+        """
+        接管登记表中租约已过期的未完成任务（worker启动时调用），并启动后台维护线程
+
+        返回:
+            int: 接管的任务数
+        """
+        if self.store is None:
+            return 0
+        self._start_maintenance()
+        return self._claim_orphans()
+
+    def get(self, task_id):
+        """返回任务记录的副本，本进程未跟踪的任务从登记表读取，都不存在时返回None"""
+        with self._lock:
+            record = self._tasks.get(task_id)
+            if record:
+                return dict(record)
+        if self.store is None:
+            return None
+        return self._store_call('get', task_id)
+
+    def wait(self, task_id, timeout=None):
+        """
+        阻塞等待任务结束（不会自行请求上游，只等待调度器更新状态）
+
+        参数:
+            task_id: 任务ID
+            timeout: 最长等待时间(秒)，默认为max_wait
+
+        返回:
+            dict: 任务记录的副本，未跟踪的任务返回None
+        """
+        return self._wait(task_id, lambda record: record['task_status'] in TERMINAL_STATES,
+                          timeout or self.max_wait)
+
+    def wait_for_change(self, task_id, last_status, timeout):
+        """
+        阻塞等待任务状态与last_status不同（用于向浏览器推送状态变化）
+
+        参数:
+            task_id: 任务ID
+            last_status: 调用方已知的最新状态，None表示尚未获取过
+            timeout: 最长等待时间(秒)，超时返回当前记录
+
+        返回:
+            dict: 任务记录的副本，未跟踪的任务返回None
+        """
+        return self._wait(task_id, lambda record: record['task_status'] != last_status, timeout)
+
+    def _wait(self, task_id, done, timeout):
+        """等待done(record)成立或超时，返回任务记录的副本"""
+        deadline = time.time() + timeout
+        with self._lock:
+            while task_id in self._tasks or self.store is None:
+                record = self._tasks.get(task_id)
+                if record is None or done(record):
+                    return dict(record) if record else None
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return dict(record)
+                self._changed.wait(remaining)
+
+        # 由其他worker轮询的任务：定期读取登记表，对方长时间没有更新时尝试接管
+        while True:
+            record = self._store_call('get', task_id)
+            if record is None or done(record):
+                return record
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return record
+            if time.time() - record['updated_at'] > self.lease:
+                claimed = self._store_call('claim', task_id, worker_id(), self.lease)
+                if claimed:
+                    logger.info(f"任务 {task_id} 的轮询worker已无响应，由本进程接管")
+                    self._adopt(claimed, delay=0)
+                    return self._wait(task_id, done, remaining)
+            time.sleep(min(Config.TASK_STORE_POLL_INTERVAL, remaining))
+
+    async def wait_async(self, task_id, timeout=None):
+        """wait的协程版本：等待期间不占用线程，一个事件循环可以同时等待大量任务"""
+        return await self._wait_async(task_id, lambda record: record['task_status'] in TERMINAL_STATES,
+                                      timeout or self.max_wait)
+
+    async def wait_for_change_async(self, task_id, last_status, timeout):
+        """wait_for_change的协程版本"""
+        return await self._wait_async(task_id, lambda record: record['task_status'] != last_status, timeout)
+
+    async def _wait_async(self, task_id, done, timeout):
+        """_wait的协程版本：轮询线程更新任务记录时通过call_soon_threadsafe唤醒等待的协程"""
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + timeout
+        while True:
+            with self._lock:
+                record = self._tasks.get(task_id)
+                if record is None and self.store is not None:
+                    break
+                if record is None or done(record):
+                    return dict(record) if record else None
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return dict(record)
+                changed = loop.create_future()
+                waiter = (loop, changed)
+                self._async_waiters.setdefault(task_id, []).append(waiter)
+            try:
+                await asyncio.wait_for(changed, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    waiters = self._async_waiters.get(task_id)
+                    if waiters and waiter in waiters:
+                        waiters.remove(waiter)
+                        if not waiters:
+                            del self._async_waiters[task_id]
+
+        # 由其他worker轮询的任务：定期读取登记表，对方长时间没有更新时尝试接管
+        while True:
+            record = await asyncio.to_thread(self._store_call, 'get', task_id)
+            if record is None or done(record):
+                return record
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return record
+            if time.time() - record['updated_at'] > self.lease:
+                claimed = await asyncio.to_thread(self._store_call, 'claim', task_id, worker_id(), self.lease)
+                if claimed:
+                    logger.info(f"任务 {task_id} 的轮询worker已无响应，由本进程接管")
+                    self._adopt(claimed, delay=0)
+                    return await self._wait_async(task_id, done, remaining)
+            await asyncio.sleep(min(Config.TASK_STORE_POLL_INTERVAL, remaining))
+
+    def _wake_async_waiters(self, task_id):
+        """唤醒等待该任务的协程（调用方需持有self._lock）"""
+        for loop, changed in self._async_waiters.pop(task_id, ()):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve_future, changed)
+
+    def _adopt(self, record, delay=None):
+        """将任务加入本进程的内存记录并安排轮询"""
+        with self._lock:
+            existing = self._tasks.get(record['task_id'])
+            if existing is not None:
+                return dict(existing)
+            self._tasks[record['task_id']] = record
+
+        self._expire(time.time())
+        self._start_maintenance()
+        self.poller.schedule(record['task_id'], delay=delay)
+        logger.info(f"任务 {record['task_id']} 已加入后台跟踪")
+        return dict(record)
+
+    def pending_count(self):
+        """返回尚未结束的任务数量"""
+        with self._lock:
+            return sum(1 for r in self._tasks.values() if r['task_status'] not in TERMINAL_STATES)
+
+    def _trace_id(self, task_id):
+        with self._lock:
+            record = self._tasks.get(task_id)
+            return record['meta'].get('trace_id') if record else None
+
+    def _query(self, task_id):
+        """查询上游任务状态（在轮询线程中执行，日志带上提交该任务的请求的trace id）"""
+        with tracing.trace_context(self._trace_id(task_id)):
+            return self.client.query_task_status(task_id)
+
+    def _on_result(self, task_id, result):
+        with tracing.trace_context(self._trace_id(task_id)):
+            return self._apply_result(task_id, result)
+
+    def _apply_result(self, task_id, result):
+        """
+        将上游查询结果写入任务记录（由轮询调度器在线程池中回调，写登记表和结束回调不阻塞调度协程）
+
+        返回:
+            bool: 任务已结束或不再跟踪时返回True
+        """
+        now = time.time()
+        with self._lock:
+            record = self._tasks.get(task_id)
+            if record is None:
+                return True
+
+            # 上一次查询的时间，任务在这次查询之前的某个时刻结束
+            previous_poll = record.get('polled_at') or record['submitted_at']
+            record['polled_at'] = now
+            output = None
+            if result:
+                output = result.get('output', {})
+                task_status = output.get('task_status') or record['task_status']
+                if task_status != record['task_status']:
+                    logger.info(f"任务 {task_id} 状态: {record['task_status']} -> {task_status}")
+                if task_status != 'PENDING' and 'running_at' not in record:
+                    record['running_at'] = now
+                record['task_status'] = task_status
+                record['message'] = output.get('message', '')
+                if task_status == 'SUCCEEDED':
+                    record['image_url'] = output.get('image_url')
+                record['updated_at'] = now
+
+            if record['task_status'] not in TERMINAL_STATES and now - record['submitted_at'] > self.max_wait:
+                logger.error(f"任务 {task_id} 在 {self.max_wait} 秒内仍未完成，停止跟踪")
+                record['task_status'] = 'UNKNOWN'
+                record['message'] = '任务超时'
+                record['updated_at'] = now
+
+            self._changed.notify_all()
+            self._wake_async_waiters(task_id)
+            finished = record['task_status'] in TERMINAL_STATES
+            snapshot = dict(record)
+
+        if self.store is not None and self._store_call('update', snapshot, worker_id(), self.lease) is False:
+            # 本进程暂停期间租约已被其他worker接管：停止轮询，等待者改为读取登记表，结束回调由接管者执行
+            logger.warning(f"任务 {task_id} 的租约已由其他worker接管，本进程停止跟踪")
+            with self._lock:
+                self._tasks.pop(task_id, None)
+                self._changed.notify_all()
+                self._wake_async_waiters(task_id)
+            return True
+
+        # 只统计上游给出明确结果的任务（超时放弃或上游已不认识的任务没有有意义的阶段耗时）
+        if finished and output and output.get('task_status') in TERMINAL_STATES - {'UNKNOWN'}:
+            self._record_stages(snapshot, output, previous_poll, now)
+
+        if finished:
+            for callback in self._listeners:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    logger.error(f"任务 {task_id} 结束回调出错: {e}")
+        return finished
+
+    def _record_stages(self, record, output, previous_poll, observed_at):
+        """
+        任务结束时记录各阶段耗时：queue（提交到开始运行）、run（上游运行）、
+        poll_overshoot（上游结束到本进程观察到结束）和 total（提交到观察到结束）
+
+        上游返回了submit_time/scheduled_time/end_time时，排队和运行时长直接使用上游时间戳之差（同一时钟），
+        上游结束时刻以本地提交时刻为基准换算到本机时钟，从而得到轮询带来的滞后；
+        否则使用本进程观察到状态变化的时刻，此时轮询滞后取两次查询的间隔（上界）。
+        """
+        task_id = record['task_id']
+        trace_id = record['meta'].get('trace_id')
+        submitted_at = record['submitted_at']
+        poll_gap = observed_at - previous_poll
+
+        submit_time = parse_upstream_time(output.get('submit_time'))
+        scheduled_time = parse_upstream_time(output.get('scheduled_time'))
+        end_time = parse_upstream_time(output.get('end_time'))
+        if submit_time and scheduled_time and end_time:
+            running_at = submitted_at + (scheduled_time - submit_time)
+            finished_at = submitted_at + (end_time - submit_time)
+            overshoot = observed_at - finished_at
+        else:
+            running_at = record.get('running_at') or observed_at
+            finished_at = observed_at
+            overshoot = poll_gap
+        overshoot = min(max(overshoot, 0), poll_gap)
+
+        attributes = {'task_id': task_id, 'task_status': record['task_status']}
+        tracing.record_stage('queue', submitted_at, running_at, trace_id, **attributes)
+        tracing.record_stage('run', running_at, finished_at, trace_id, **attributes)
+        tracing.record_stage('poll_overshoot', observed_at - overshoot, observed_at, trace_id, **attributes)
+        tracing.record_stage('total', submitted_at, observed_at, trace_id, **attributes)
+        logger.info(
+            f"任务 {task_id} 耗时: 排队 {running_at - submitted_at:.2f}s，运行 {finished_at - running_at:.2f}s，"
+            f"轮询滞后 {overshoot:.2f}s，合计 {observed_at - submitted_at:.2f}s"
+        )
+
+    def _expire(self, now):
+        """移除结束已超过保留时间的任务记录（最多每分钟执行一次）"""
+        if now - self._last_expire < 60:
+            return
+        self._last_expire = now
+        with self._lock:
+            expired = [
+                task_id for task_id, r in self._tasks.items()
+                if r['task_status'] in TERMINAL_STATES and now - r['updated_at'] > self.result_ttl
+            ]
+            for task_id in expired:
+                del self._tasks[task_id]
+
+    def _start_maintenance(self):
+        """启动（或在fork后的worker中重新启动）登记表维护线程"""
+        if self.store is None:
+            return
+        if self._maintenance is not None and self._maintenance.is_alive() and self._maintenance_pid == os.getpid():
+            return
+        with self._maintenance_lock:
+            if self._maintenance is not None and self._maintenance.is_alive() and self._maintenance_pid == os.getpid():
+                return
+            self._maintenance_pid = os.getpid()
+            self._maintenance = threading.Thread(target=self._maintenance_loop, name='tryon-task-store', daemon=True)
+            self._maintenance.start()
+
+    def _maintenance_loop(self):
+        """定期续租本进程负责的任务、接管其他worker遗留的任务，并清理过期记录"""
+        last_sweep = 0
+        while True:
+            time.sleep(self.lease / 3)
+            with self._lock:
+                pending = [task_id for task_id, r in self._tasks.items() if r['task_status'] not in TERMINAL_STATES]
+            self._store_call('renew', pending, worker_id(), self.lease)
+            self._claim_orphans()
+
+            now = time.time()
+            if now - last_sweep >= Config.TASK_STORE_SWEEP_INTERVAL:
+                last_sweep = now
+                removed = self._store_call('sweep', Config.TASK_STORE_RETENTION)
+                if removed:
+                    logger.info(f"任务登记表已清理 {removed} 条过期记录")
+
+    def _claim_orphans(self):
+        records = self._store_call('claim_orphans', worker_id(), self.lease) or []
+        for record in records:
+            logger.info(f"接管未完成的任务 {record['task_id']}（原worker已退出）")
+            self._adopt(record, delay=0)
+        return len(records)
+
+    def _store_call(self, method, *args):
+        """调用登记表方法，出错时记录日志并返回None（登记表故障不影响内存中的跟踪）"""
+        try:
+            return getattr(self.store, method)(*args)
+        except Exception as e:
+            logger.error(f"任务登记表操作 {method} 失败: {e}")
+            return None
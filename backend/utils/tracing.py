@@ -0,0 +1,174 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from config import Config
+from utils import metrics as tryon_metrics
+
+logger = logging.getLogger(__name__)
+
+# 当前请求（或当前处理的任务）的trace id
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+
+# 接受客户端传入的X-Request-ID时允许的字符
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def new_trace_id():
+    """生成新的trace id（32位十六进制，与W3C Trace Context的trace-id格式一致）"""
+    return uuid.uuid4().hex
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def set_trace_id(trace_id):
+    _trace_id.set(trace_id)
+
+
+@contextmanager
+def trace_context(trace_id):
+    """在代码块内使用指定的trace id（用于轮询线程等没有请求上下文的地方），trace_id为None时不做改变"""
+    if not trace_id:
+        yield
+        return
+    token = _trace_id.set(trace_id)
+    try:
+        yield
+    finally:
+        _trace_id.reset(token)
+
+
+def trace_id_from_headers(headers):
+    """
+    从请求头中取得trace id：优先使用W3C traceparent，其次是X-Request-ID，都没有时生成新的
+
+    参数:
+        headers: 请求头（支持get方法的映射）
+    """
+    parts = (headers.get('traceparent') or '').split('-')
+    if len(parts) == 4 and re.fullmatch(r'[0-9a-f]{32}', parts[1]) and parts[1] != '0' * 32:
+        return parts[1]
+    request_id = headers.get('X-Request-ID') or ''
+    if _REQUEST_ID_PATTERN.match(request_id):
+        return request_id
+    return new_trace_id()
+
+
+class TraceIdFilter(logging.Filter):
+    """为日志记录添加trace_id字段，日志格式中可使用 %(trace_id)s"""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get() or '-'
+        return True
+
+
+class OTelSpanExporter:
+    """
+    将阶段耗时以OpenTelemetry span的形式导出到OTLP收集器（HTTP协议，需要安装
+    opentelemetry-sdk 和 opentelemetry-exporter-otlp-proto-http）
+
+    同一个trace id下的所有span挂在同一个虚拟的父span下，提交请求、后台轮询等
+    不同线程（甚至不同worker）中产生的阶段都能在同一条trace中查看。
+    """
+
+    def __init__(self, endpoint=None, service_name=None):
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        self._trace = trace
+        endpoint = (endpoint or Config.OTEL_EXPORTER_OTLP_ENDPOINT).rstrip('/')
+        self.provider = TracerProvider(resource=Resource.create({
+            'service.name': service_name or Config.OTEL_SERVICE_NAME
+        }))
+        self.provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{endpoint}/v1/traces")))
+        self.tracer = self.provider.get_tracer('paida.tryon')
+
+    @staticmethod
+    def _otel_trace_id(trace_id):
+        if re.fullmatch(r'[0-9a-f]{32}', trace_id):
+            return int(trace_id, 16)
+        # 客户端传入的X-Request-ID不是128位十六进制时，取其哈希
+        return int(hashlib.md5(trace_id.encode()).hexdigest(), 16)
+
+    def export(self, name, trace_id, started, finished, attributes):
+        trace = self._trace
+        otel_trace_id = self._otel_trace_id(trace_id)
+        parent = trace.SpanContext(
+            trace_id=otel_trace_id,
+            span_id=(otel_trace_id & 0xFFFFFFFFFFFFFFFF) or 1,
+            is_remote=True,
+            trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED)
+        )
+        span = self.tracer.start_span(
+            name,
+            context=trace.set_span_in_context(trace.NonRecordingSpan(parent)),
+            start_time=int(started * 1e9),
+            attributes={key: value for key, value in attributes.items() if value is not None}
+        )
+        span.end(end_time=int(finished * 1e9))
+
+
+# 按进程创建的span导出器（BatchSpanProcessor的后台线程不能跨fork使用）
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def get_span_exporter():
+    """返回当前进程的OpenTelemetry导出器，未配置OTEL_EXPORTER_OTLP_ENDPOINT或未安装依赖时返回None"""
+    if not Config.OTEL_EXPORTER_OTLP_ENDPOINT:
+        return None
+    pid = os.getpid()
+    if pid not in _exporters:
+        with _exporters_lock:
+            if pid not in _exporters:
+                try:
+                    _exporters[pid] = OTelSpanExporter()
+                    logger.info(f"OpenTelemetry span将导出到 {Config.OTEL_EXPORTER_OTLP_ENDPOINT}")
+                except Exception as e:
+                    logger.warning(f"OpenTelemetry初始化失败，不导出span: {e}")
+                    _exporters[pid] = None
+    return _exporters[pid]
+
+
+def record_stage(stage, started, finished, trace_id=None, **attributes):
+    """
+    记录试衣链路中一个阶段的耗时：写入 tryon_stage_duration_seconds 直方图，并在启用时导出span
+
+    参数:
+        stage: 阶段名称（upload / storage_put / submit / queue / run / poll_overshoot / total）
+        started, finished: 开始和结束时间（time.time()）
+        trace_id: 所属trace，默认使用当前上下文的trace id
+        attributes: 附加到span上的属性
+    """
+    tryon_metrics.STAGE_DURATION.labels(stage=stage).observe(max(finished - started, 0))
+    trace_id = trace_id or current_trace_id()
+    exporter = get_span_exporter()
+    if exporter is None or not trace_id:
+        return
+    try:
+        exporter.export(f"tryon.{stage}", trace_id, started, finished, attributes)
+    except Exception as e:
+        logger.debug(f"导出span {stage} 失败: {e}")
+
+
+@contextmanager
+def stage(name, **attributes):
+    """记录代码块耗时的上下文管理器，代码块抛出异常时同样记录，并在span上标记error"""
+    started = time.time()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes['error'] = type(e).__name__
+        raise
+    finally:
+        record_stage(name, started, time.time(), **attributes)
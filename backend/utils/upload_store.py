@@ -0,0 +1,59 @@
+import os
+import hashlib
+import logging
+import tempfile
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SpooledUpload:
+    """已写入临时文件的上传内容及其哈希"""
+
+    def __init__(self, path, digest, size, extension):
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.extension = extension
+
+    @property
+    def key(self):
+        """按内容寻址的对象名"""
+        return f"{self.digest}.{self.extension}"
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def spool_upload(stream, filename, chunk_size=None):
+    """
+    分块读取上传流写入临时文件，同时计算SHA-256哈希，内存占用与文件大小无关
+
+    参数:
+        stream: 可读的文件流
+        filename: 原始文件名（用于确定扩展名）
+        chunk_size: 每次读取的字节数
+
+    返回:
+        SpooledUpload实例
+    """
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+    hasher = hashlib.sha256()
+    size = 0
+
+    fd, path = tempfile.mkstemp(prefix='upload-', suffix=f'.{extension}', dir=Config.UPLOAD_TMP_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return SpooledUpload(path, hasher.hexdigest(), size, extension)
@@ -0,0 +1,154 @@
+import os
+import socket
+import threading
+import ipaddress
+from urllib.parse import urljoin, urlsplit, urlunsplit
+import requests
+from config import Config
+from utils.http_session import create_adapter
+
+# 下载客户端提供的图片URL时最多跟随的重定向次数（每一跳都重新检查地址）
+MAX_REDIRECTS = 3
+# 每个进程为固定到IP的下载保留连接池的主机数，超过时丢弃最早的
+MAX_PINNED_HOSTS = 64
+
+_adapters = {}
+_adapters_pid = None
+_adapters_lock = threading.Lock()
+
+
+class UnsafeURLError(ValueError):
+    """URL不是公网http(s)地址（内网、本机、链路本地、保留地址等），拒绝由本服务访问"""
+
+
+def _literal_address(host):
+    """主机名为IP字面量时返回地址（含 2130706433、0x7f.1 等IPv4简写形式），否则返回None"""
+    try:
+        return ipaddress.ip_address(host)
+    except ValueError:
+        pass
+    try:
+        return ipaddress.IPv4Address(socket.inet_aton(host))
+    except (OSError, ValueError):
+        return None
+
+
+def is_public_address(address):
+    """公网单播地址（IPv4映射的IPv6地址按其IPv4地址判断）"""
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+def _allowed_host(host):
+    return host in {value.strip().lower() for value in Config.IMAGE_FETCH_ALLOWED_HOSTS.split(',') if value.strip()}
+
+
+def check_url_syntax(url):
+    """
+    不解析域名的快速检查（请求参数校验时调用）：http(s)协议、有主机名、不是localhost或非公网的IP字面量
+
+    抛出:
+        UnsafeURLError
+    """
+    parts = urlsplit(url or '')
+    host = (parts.hostname or '').lower()
+    if parts.scheme not in ('http', 'https') or not host:
+        raise UnsafeURLError(f"不是http(s)地址: {url}")
+    if _allowed_host(host):
+        return
+    if host == 'localhost' or host.endswith('.localhost'):
+        raise UnsafeURLError(f"本机地址: {url}")
+    address = _literal_address(host)
+    if address is not None and not is_public_address(address):
+        raise UnsafeURLError(f"非公网地址: {url}")
+
+
+def check_url(url):
+    """
+    本服务下载URL之前调用：解析域名，任一地址不是公网地址时拒绝
+    （IMAGE_FETCH_ALLOWED_HOSTS中的主机除外，用于内网对象存储等）
+
+    返回:
+        list: 解析得到的地址（均为公网地址）；IMAGE_FETCH_ALLOWED_HOSTS中的主机返回None
+
+    抛出:
+        UnsafeURLError
+    """
+    check_url_syntax(url)
+    parts = urlsplit(url)
+    host = parts.hostname.lower()
+    if _allowed_host(host):
+        return None
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == 'https' else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        raise UnsafeURLError(f"无法解析主机 {host}: {e}")
+    addresses = []
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%', 1)[0])
+        if not is_public_address(address):
+            raise UnsafeURLError(f"{host} 解析到非公网地址 {address}")
+        addresses.append(address)
+    return addresses
+
+
+def _pinned_adapter(hostname):
+    """按主机名共享的连接池，TLS握手和证书校验使用原主机名（gunicorn fork之后各worker重新创建）"""
+    global _adapters_pid
+    with _adapters_lock:
+        if _adapters_pid != os.getpid():
+            _adapters.clear()
+            _adapters_pid = os.getpid()
+
+        adapter = _adapters.get(hostname)
+        if adapter is None:
+            if len(_adapters) >= MAX_PINNED_HOSTS:
+                _adapters.pop(next(iter(_adapters))).close()
+            adapter = create_adapter(server_hostname=hostname)
+            _adapters[hostname] = adapter
+        return adapter
+
+
+def _get(session, url, stream, timeout):
+    """
+    检查并下载一跳：连接固定到检查过的地址，不再重新解析域名，
+    避免检查之后域名改为解析到内网地址（DNS rebinding）；Host头和TLS SNI仍使用原主机名
+    """
+    addresses = check_url(url)
+    parts = urlsplit(url)
+    if not addresses or _literal_address(parts.hostname) is not None:
+        return session.get(url, allow_redirects=False, stream=stream, timeout=timeout)
+
+    address = addresses[0]
+    userinfo, _, host = parts.netloc.rpartition('@')
+    netloc = f"[{address}]" if address.version == 6 else str(address)
+    if parts.port:
+        netloc = f"{netloc}:{parts.port}"
+    if userinfo:
+        netloc = f"{userinfo}@{netloc}"
+    request = session.prepare_request(
+        requests.Request('GET', urlunsplit(parts._replace(netloc=netloc)), headers={'Host': host}))
+    settings = session.merge_environment_settings(request.url, {}, stream, None, None)
+    return _pinned_adapter(parts.hostname.lower()).send(request, timeout=timeout, **settings)
+
+
+def guarded_get(session, url, stream=False, timeout=None):
+    """
+    下载客户端提供的URL：不自动跟随重定向，每一跳都先检查目标地址并固定连接到该地址
+
+    参数:
+        session: 提供请求头、代理等设置的requests会话
+
+    返回:
+        requests.Response（调用方负责关闭）
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        response = _get(session, url, stream, timeout)
+        if not response.is_redirect:
+            return response
+        location = response.headers.get('Location')
+        response.close()
+        url = urljoin(url, location)
+    raise UnsafeURLError(f"重定向次数过多: {url}")
@@ -0,0 +1,257 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import sqlite3
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from utils import metrics as tryon_metrics
+from utils.governor import schedule
+
+logger = logging.getLogger(__name__)
+
+# 内容寻址的文件名："<sha256>.<扩展名>"（上传接口和预渲染工具保存的图片）
+_CONTENT_ADDRESSED_NAME = re.compile(r'^([0-9a-f]{64})\.[0-9a-z]+$')
+
+
+def asset_id_from_url(url):
+    """从内容寻址的URL中取出图片内容哈希，不是内容寻址的URL返回None"""
+    match = _CONTENT_ADDRESSED_NAME.match(os.path.basename(urlparse(url).path).lower())
+    return match.group(1) if match else None
+
+
+def model_key(model, parameters):
+    """模型名称及参数的短哈希，模型或参数变化后旧的索引条目不再命中"""
+    material = json.dumps({'model': model, 'parameters': parameters}, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()[:16]
+
+
+class WarmIndex:
+    """
+    热门商品的预计算试衣结果索引（SQLite）
+
+    键为 (人物图片内容哈希, 服装图片内容哈希, 服装类型, 模型)，值为任务ID和结果URL。
+    查找只读本地数据库文件，不下载图片、不访问上游：图片内容哈希取自内容寻址的URL，
+    或结果缓存中已登记的URL哈希，两者都没有时视为未命中。
+    同一台机器上的多个worker共享同一个数据库文件，预热任务的进度也记录在其中。
+    """
+
+    def __init__(self, path=None, max_age=None):
+        self.path = path or Config.WARM_INDEX_PATH
+        # 条目有效期(秒)，None表示长期有效（结果图片已保存到存储后端）
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+        tryon_metrics.WARM_INDEX_ENTRIES.set(self.count())
+
+    def _conn(self):
+        """每个线程（以及fork后的每个进程）使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        # WITHOUT ROWID：条目按主键聚簇存储，点查只需一次B树查找
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS warm_results (
+                person TEXT NOT NULL,
+                garment TEXT NOT NULL,
+                garment_type TEXT NOT NULL,
+                model TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                image_url TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (person, garment, garment_type, model)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS warm_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                succeeded INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """)
+
+    def get(self, person, garment, garment_type, model):
+        """按内容哈希查找，返回 {'task_id', 'image_url', 'created_at'}，不存在或已过期时返回None"""
+        row = self._conn().execute(
+            'SELECT task_id, image_url, created_at FROM warm_results '
+            'WHERE person = ? AND garment = ? AND garment_type = ? AND model = ?',
+            (person, garment, garment_type, model)
+        ).fetchone()
+        if row is None or (self.max_age is not None and time.time() - row['created_at'] > self.max_age):
+            return None
+        return dict(row)
+
+    def lookup(self, person_url, garment_url, garment_type, model, known_digest=None):
+        """
+        按图片URL查找预计算结果（直接试衣接口在提交上游任务前调用）
+
+        参数:
+            known_digest: 返回URL已登记的内容哈希的函数（不下载图片），用于非内容寻址的URL
+
+        返回:
+            dict: 命中时为 {'task_id', 'image_url', 'created_at'}，否则为None
+        """
+        started = time.perf_counter()
+        person = asset_id_from_url(person_url) or (known_digest and known_digest(person_url))
+        garment = asset_id_from_url(garment_url) or (known_digest and known_digest(garment_url))
+        if not person or not garment:
+            entry, result = None, 'unresolved'
+        else:
+            entry = self.get(person, garment, garment_type, model)
+            result = 'hit' if entry else 'miss'
+        tryon_metrics.WARM_INDEX_LOOKUP_DURATION.observe(time.perf_counter() - started)
+        tryon_metrics.WARM_INDEX_LOOKUPS.labels(result=result).inc()
+        return entry
+
+    def put_many(self, entries):
+        """
+        写入一批条目（已存在的键覆盖）
+
+        参数:
+            entries: (人物哈希, 服装哈希, 服装类型, 模型, 任务ID, 结果URL) 的序列
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO warm_results '
+                '(person, garment, garment_type, model, task_id, image_url, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(*entry, now) for entry in entries]
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        tryon_metrics.WARM_INDEX_ENTRIES.set(self.count())
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM warm_results').fetchone()[0]
+
+    def create_job(self, total):
+        """登记一个预热任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO warm_jobs (job_id, status, total, created_at, updated_at) VALUES (?, 'pending', ?, ?, ?)",
+            (job_id, total, now, now)
+        )
+        return job_id
+
+    def update_job(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._conn().execute(f"UPDATE warm_jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def get_job(self, job_id):
+        row = self._conn().execute('SELECT * FROM warm_jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+
+class IndexWarmer:
+    """
+    在后台为一批 (人物, 服装, 类型) 组合预先生成试衣结果并写入索引
+
+    已在索引中的组合跳过；其余按批提交（submit_many）并等待结束（wait_many），
+    结果图片保存到存储后端后再写入索引，之后的直接试衣请求不再提交上游任务。
+    每批的任务数应小于上游在途任务上限（GOVERNOR_MAX_INFLIGHT），为在线请求留出余量。
+    """
+
+    def __init__(self, index, client, content_digest, result_images=None, batch_size=None):
+        self.index = index
+        self.client = client
+        # 返回URL对应图片内容哈希的函数（非内容寻址的URL使用，未知的URL会下载一次）
+        self.content_digest = content_digest
+        self.result_images = result_images
+        self.batch_size = batch_size or Config.WARM_INDEX_BATCH_SIZE
+        # 预热任务依次执行，避免多个任务同时占用上游配额
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tryon-warm')
+
+    def start(self, pairs):
+        """
+        登记并在后台执行预热任务
+
+        参数:
+            pairs: {'person_url', 'garment_url', 'garment_type'} 的序列
+
+        返回:
+            str: 预热任务ID
+        """
+        pairs = list({(p['person_url'], p['garment_url'], p['garment_type']): p for p in pairs}.values())
+        job_id = self.index.create_job(len(pairs))
+        self._executor.submit(self._run, job_id, pairs)
+        return job_id
+
+    def _run(self, job_id, pairs):
+        model = model_key(self.client.model, self.client.parameters)
+        counts = {'succeeded': 0, 'skipped': 0, 'failed': 0}
+        logger.info(f"预热任务 {job_id} 开始: {len(pairs)} 个组合")
+        self.index.update_job(job_id, status='running')
+        try:
+            # 预热任务按批量类别排队提交，在线请求优先取得上游配额
+            with schedule('batch', 'warm-index'):
+                for start in range(0, len(pairs), self.batch_size):
+                    self._run_batch(pairs[start:start + self.batch_size], model, counts)
+                    self.index.update_job(job_id, **counts)
+        except Exception as e:
+            logger.exception(f"预热任务 {job_id} 异常中止")
+            self.index.update_job(job_id, status='failed', error=str(e), **counts)
+            return
+        logger.info(f"预热任务 {job_id} 完成: {counts}")
+        self.index.update_job(job_id, status='done', **counts)
+
+    def _run_batch(self, pairs, model, counts):
+        todo = []
+        for pair in pairs:
+            try:
+                person = asset_id_from_url(pair['person_url']) or self.content_digest(pair['person_url'])
+                garment = asset_id_from_url(pair['garment_url']) or self.content_digest(pair['garment_url'])
+            except Exception as e:
+                logger.warning(f"获取图片内容哈希失败，跳过 {pair['person_url']} + {pair['garment_url']}: {e}")
+                counts['failed'] += 1
+                continue
+            if self.index.get(person, garment, pair['garment_type'], model):
+                counts['skipped'] += 1
+                continue
+            todo.append((person, garment, pair))
+        if not todo:
+            return
+
+        submitted = self.client.submit_many([(pair['person_url'], pair['garment_url'], pair['garment_type'])
+                                             for _, _, pair in todo])
+        results = self.client.wait_many([result.task_id for result in submitted if result.ok])
+        entries = []
+        for (person, garment, pair), submit in zip(todo, submitted):
+            result = results.get(submit.task_id) if submit.ok else None
+            if result is None or not result.succeeded or not self._persist(result):
+                counts['failed'] += 1
+                continue
+            entries.append((person, garment, pair['garment_type'], model, result.task_id, result.image_url))
+        if entries:
+            self.index.put_many(entries)
+            counts['succeeded'] += len(entries)
+
+    def _persist(self, result):
+        """保存结果图片（DashScope的结果URL约24小时后失效），未启用结果图片代理时直接使用结果URL"""
+        if self.result_images is None:
+            return True
+        variant = self.result_images.original_variant(result.image_url)
+        return self.result_images.open(result.task_id, variant, result.image_url) is not None
@@ -1,9 +1,14 @@
 // API Base URL - Modify according to your actual deployment address
 const API_BASE_URL = 'http://localhost:5001';
 
+// Client-side image processing before upload; keep in step with IMAGE_MAX_SIDE / IMAGE_QUALITY on the backend
+const UPLOAD_MAX_SIDE = 2048;
+const UPLOAD_JPEG_QUALITY = 0.9;
+
 // Global variables
 let personImageUrl = null;
 let garmentImageUrl = null;
+let bottomImageUrl = null;
 
 // DOM elements
 const personPreview = document.getElementById('person-preview');
@@ -17,6 +22,20 @@ const garmentFile = document.getElementById('garment-file');
 const garmentType = document.getElementById('garment-type');
 const garmentPreviewContainer = document.getElementById('garment-preview-container');
 
+// Bottom garment (outfit mode only)
+const bottomUpload = document.getElementById('bottom-upload');
+const bottomPreview = document.getElementById('bottom-preview');
+const bottomPlaceholder = document.getElementById('bottom-placeholder');
+const bottomFile = document.getElementById('bottom-file');
+const bottomPreviewContainer = document.getElementById('bottom-preview-container');
+
+// Preview elements for each upload slot
+const UPLOAD_SLOTS = {
+    person: { preview: personPreview, placeholder: personPlaceholder, container: personPreviewContainer },
+    garment: { preview: garmentPreview, placeholder: garmentPlaceholder, container: garmentPreviewContainer },
+    bottom: { preview: bottomPreview, placeholder: bottomPlaceholder, container: bottomPreviewContainer }
+};
+
 const tryonBtn = document.getElementById('tryon-btn');
 const resultSection = document.getElementById('result-section');
 const loading = document.getElementById('loading');
@@ -72,6 +91,32 @@ function init() {
         });
     }
     
+    // Bottom garment photo upload (outfit mode)
+    if (bottomPreviewContainer) {
+        bottomPreviewContainer.addEventListener('click', () => {
+            if (bottomFile) {
+                bottomFile.click();
+            }
+        });
+        setupDragAndDrop(bottomPreviewContainer, 'bottom');
+    }
+    
+    if (bottomFile) {
+        bottomFile.addEventListener('change', (e) => {
+            handleFileUpload(e, 'bottom');
+        });
+    }
+    
+    // Outfit mode shows the bottom garment upload
+    if (garmentType) {
+        garmentType.addEventListener('change', () => {
+            if (bottomUpload) {
+                bottomUpload.style.display = isOutfitMode() ? 'block' : 'none';
+            }
+            updateTryonButtonState();
+        });
+    }
+    
     // Try-on button
     if (tryonBtn) {
         tryonBtn.addEventListener('click', startTryOn);
@@ -126,20 +171,17 @@ function handleDroppedFile(file, type) {
         return;
     }
     
-    const preview = type === 'person' ? personPreview : garmentPreview;
-    const placeholder = type === 'person' ? personPlaceholder : garmentPlaceholder;
+    const { preview, placeholder } = UPLOAD_SLOTS[type];
     
-    const reader = new FileReader();
-    reader.onload = (e) => {
-        console.log('File reader loaded');
-        preview.src = e.target.result;
-        preview.style.display = 'block';
-        placeholder.style.display = 'none';
-        
-        // Upload file to server
-        uploadFile(file, type);
-    };
-    reader.readAsDataURL(file);
+    // Preview from an object URL instead of reading the whole file into a data URL
+    if (preview.src.startsWith('blob:')) {
+        URL.revokeObjectURL(preview.src);
+    }
+    preview.src = URL.createObjectURL(file);
+    preview.style.display = 'block';
+    placeholder.style.display = 'none';
+    
+    uploadFile(file, type);
 }
 
 function handleFileUpload(event, type) {
@@ -154,46 +196,136 @@ function handleFileUpload(event, type) {
     handleDroppedFile(file, type);
 }
 
-function uploadFile(file, type) {
+async function uploadFile(file, type) {
     console.log('uploadFile called with type:', type, 'file:', file);
     
-    const formData = new FormData();
-    formData.append('file', file);
-    
     // Show upload progress
     showUploadProgress(type);
     
-    fetch(`${API_BASE_URL}/api/tryon/upload`, {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
-    .then(data => {
-        console.log('Upload response:', data);
-        if (data.error) {
-            showNotification(`Upload failed: ${data.error}`, 'error');
-            resetPreview(type);
-            return;
-        }
+    try {
+        const blob = await compressImage(file);
+        console.log(`Image compressed: ${file.size} -> ${blob.size} bytes`);
+        const url = await uploadDirect(blob) || await uploadViaServer(blob, file.name);
         
         if (type === 'person') {
-            personImageUrl = data.url;
+            personImageUrl = url;
+        } else if (type === 'bottom') {
+            bottomImageUrl = url;
         } else {
-            garmentImageUrl = data.url;
+            garmentImageUrl = url;
         }
         
         showNotification('Image uploaded successfully', 'success');
         updateTryonButtonState();
-    })
-    .catch(error => {
+    } catch (error) {
         console.error('Upload error:', error);
-        showNotification('An error occurred while uploading the file', 'error');
+        showNotification(`Upload failed: ${error.message}`, 'error');
         resetPreview(type);
+    }
+}
+
+// Decode the image (applying EXIF orientation), downscale it to UPLOAD_MAX_SIDE and re-encode it as JPEG.
+// Re-encoding also drops metadata such as GPS location; the original file is used if the browser cannot decode it
+async function compressImage(file) {
+    try {
+        const source = await loadImage(file);
+        const scale = Math.min(1, UPLOAD_MAX_SIDE / Math.max(source.width, source.height));
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(source.width * scale);
+        canvas.height = Math.round(source.height * scale);
+        const context = canvas.getContext('2d');
+        // JPEG has no alpha channel: flatten transparent PNGs onto white
+        context.fillStyle = '#fff';
+        context.fillRect(0, 0, canvas.width, canvas.height);
+        context.drawImage(source, 0, 0, canvas.width, canvas.height);
+        if (source.close) {
+            source.close();
+        }
+        const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', UPLOAD_JPEG_QUALITY));
+        return blob || file;
+    } catch (error) {
+        console.warn('Image compression failed, uploading the original file:', error);
+        return file;
+    }
+}
+
+function loadImage(file) {
+    if (window.createImageBitmap) {
+        return createImageBitmap(file, { imageOrientation: 'from-image' });
+    }
+    return new Promise((resolve, reject) => {
+        const image = new Image();
+        const url = URL.createObjectURL(file);
+        image.onload = () => {
+            URL.revokeObjectURL(url);
+            resolve(image);
+        };
+        image.onerror = (error) => {
+            URL.revokeObjectURL(url);
+            reject(error);
+        };
+        image.src = url;
+    });
+}
+
+// Ask the backend for a short-lived signed upload form and POST the image straight to object storage.
+// Returns null when direct uploads are unavailable (local storage mode, image too large) or fail (e.g. bucket CORS not configured)
+async function uploadDirect(blob) {
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/tryon/upload-url`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ content_type: blob.type, size: blob.size })
+        });
+        if (!response.ok) {
+            return null;
+        }
+        const signed = await response.json();
+        if (!signed.direct) {
+            return null;
+        }
+        // Signed POST form: the policy fields go first and the file last; storage rejects files larger than declared
+        const form = new FormData();
+        for (const [name, value] of Object.entries(signed.fields)) {
+            form.append(name, value);
+        }
+        form.append('file', blob);
+        const upload = await fetch(signed.upload_url, {
+            method: signed.method,
+            body: form
+        });
+        if (!upload.ok) {
+            throw new Error(`storage responded with ${upload.status}`);
+        }
+        return signed.url;
+    } catch (error) {
+        console.warn('Direct upload failed, uploading through the server:', error);
+        return null;
+    }
+}
+
+// Fallback: POST the (already compressed) image to the backend, which stores it
+async function uploadViaServer(blob, filename) {
+    const formData = new FormData();
+    const name = blob.type === 'image/jpeg' ? filename.replace(/\.[^.]*$/, '') + '.jpg' : filename;
+    formData.append('file', blob, name);
+    
+    const response = await fetch(`${API_BASE_URL}/api/tryon/upload`, {
+        method: 'POST',
+        body: formData
     });
+    const data = await response.json();
+    console.log('Upload response:', data);
+    if (data.error) {
+        throw new Error(data.error);
+    }
+    return data.url;
 }
 
 function showUploadProgress(type) {
-    const container = type === 'person' ? personPreviewContainer : garmentPreviewContainer;
+    const container = UPLOAD_SLOTS[type].container;
     const progress = document.createElement('div');
     progress.className = 'upload-progress';
     progress.innerHTML = `
@@ -257,20 +389,25 @@ function showUploadProgress(type) {
 }
 
 function resetPreview(type) {
+    const { preview, placeholder } = UPLOAD_SLOTS[type];
+    preview.style.display = 'none';
+    placeholder.style.display = 'block';
     if (type === 'person') {
-        personPreview.style.display = 'none';
-        personPlaceholder.style.display = 'block';
         personImageUrl = null;
+    } else if (type === 'bottom') {
+        bottomImageUrl = null;
     } else {
-        garmentPreview.style.display = 'none';
-        garmentPlaceholder.style.display = 'block';
         garmentImageUrl = null;
     }
     updateTryonButtonState();
 }
 
+function isOutfitMode() {
+    return garmentType && garmentType.value === 'outfit';
+}
+
 function updateTryonButtonState() {
-    const isReady = personImageUrl && garmentImageUrl;
+    const isReady = personImageUrl && garmentImageUrl && (!isOutfitMode() || bottomImageUrl);
     if (tryonBtn) {
         tryonBtn.disabled = !isReady;
     }
@@ -366,8 +503,27 @@ function retryTask() {
     startTryOn();
 }
 
+// Post a try-on request; when the server's queue is full (429) wait for Retry-After and try again
+async function postTryOn(path, request, attempts = 3) {
+    for (let attempt = 1; ; attempt++) {
+        const response = await fetch(`${API_BASE_URL}${path}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(request)
+        });
+        if (response.status !== 429 || attempt >= attempts) {
+            return response;
+        }
+        const retryAfter = Math.min(parseInt(response.headers.get('Retry-After'), 10) || 5, 60);
+        showNotification(`Server is busy, retrying in ${retryAfter}s...`, 'info');
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    }
+}
+
 async function startTryOn() {
-    if (!personImageUrl || !garmentImageUrl) return;
+    if (!personImageUrl || !garmentImageUrl || (isOutfitMode() && !bottomImageUrl)) return;
     
     console.log('Starting try-on...');
     
@@ -392,27 +548,49 @@ async function startTryOn() {
     }
     
     const selectedGarmentType = garmentType ? garmentType.value : 'top';
+    const request = {
+        person_image_url: personImageUrl,
+        garment_image_url: garmentImageUrl,
+        garment_type: selectedGarmentType
+    };
+    // Outfit mode: top and bottom are tried on together in one request
+    if (selectedGarmentType === 'outfit') {
+        request.bottom_garment_image_url = bottomImageUrl;
+    }
     
     try {
-        // Submit try-on request
-        const response = await fetch(`${API_BASE_URL}/api/tryon/direct`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                person_image_url: personImageUrl,
-                garment_image_url: garmentImageUrl,
-                garment_type: selectedGarmentType
-            })
-        });
+        // Submit try-on job; the backend returns a task id right away
+        let response = await postTryOn('/api/tryon/jobs', request);
         
-        const data = await response.json();
+        // Models that take one garment per call chain the outfit on the server,
+        // which is only available on the direct endpoint
+        if (response.status === 400 && selectedGarmentType === 'outfit') {
+            response = await postTryOn('/api/tryon/direct', request);
+        }
+        
+        let data = await response.json();
         console.log('Try-on response:', data);
         
+        if (data.status === 'submitted') {
+            showNotification('Try-on submitted, please wait...', 'info');
+            // Wait for status updates pushed by the backend
+            data = await watchTask(data.task_id);
+        }
+        
         if (data.status === 'success') {
             // Display result image directly
             if (resultImage) {
+                // Let the browser pick a WebP thumbnail matching the display size
+                const srcset = Object.entries(data.thumbnails || {})
+                    .filter(([, urls]) => urls.webp)
+                    .map(([width, urls]) => `${urls.webp} ${width}w`)
+                    .join(', ');
+                if (srcset) {
+                    resultImage.srcset = srcset;
+                    resultImage.sizes = '(max-width: 768px) 100vw, 640px';
+                } else {
+                    resultImage.removeAttribute('srcset');
+                }
                 resultImage.src = data.image_url;
             }
             if (loading) {
@@ -422,13 +600,10 @@ async function startTryOn() {
                 resultImageContainer.style.display = 'block';
             }
             showNotification('Try-on completed!', 'success');
-        } else if (data.status === 'submitted') {
-            // For now, just show a message about polling
-            showNotification('Try-on submitted, please wait...', 'info');
-        } else if (data.status === 'error') {
-            throw new Error(data.message);
+        } else if (data.error) {
+            throw new Error(data.error);
         } else {
-            throw new Error('Unknown response status');
+            throw new Error(data.message || 'Unknown response status');
         }
     } catch (error) {
         console.error('Try-on error:', error);
@@ -441,4 +616,68 @@ async function startTryOn() {
             tryonBtn.innerHTML = '<i class="fas fa-magic"></i><span>Start AI Try-On</span>';
         }
     }
-}
\ No newline at end of file
+}
+
+const TERMINAL_STATUSES = ['SUCCEEDED', 'FAILED', 'CANCELED', 'UNKNOWN'];
+
+const STATUS_LABELS = {
+    PENDING: 'Queued...',
+    'PRE-PROCESSING': 'Preparing images...',
+    RUNNING: 'Generating try-on...',
+    'POST-PROCESSING': 'Finishing up...'
+};
+
+function updateProgress(data) {
+    if (progressText && data.task_status) {
+        progressText.textContent = STATUS_LABELS[data.task_status] || data.task_status;
+    }
+}
+
+// Resolve with the final status of a task, using server-sent events when available
+function watchTask(taskId) {
+    if (!window.EventSource) {
+        return pollTask(taskId);
+    }
+    
+    return new Promise((resolve) => {
+        const source = new EventSource(`${API_BASE_URL}/api/tryon/events/${taskId}`);
+        
+        source.addEventListener('status', (event) => {
+            const data = JSON.parse(event.data);
+            console.log('Task status event:', data);
+            updateProgress(data);
+            if (TERMINAL_STATUSES.includes(data.task_status)) {
+                source.close();
+                resolve(data);
+            }
+        });
+        
+        source.onerror = () => {
+            // Stream unavailable (e.g. proxy without streaming support): fall back to polling
+            console.warn('Task event stream failed, falling back to polling');
+            source.close();
+            resolve(pollTask(taskId));
+        };
+    });
+}
+
+async function pollTask(taskId, interval = 3000) {
+    while (true) {
+        const response = await fetch(`${API_BASE_URL}/api/tryon/status/${taskId}`);
+        if (response.status === 503) {
+            // The shared status read is still queued: poll again after Retry-After
+            const retryAfter = Math.min(parseInt(response.headers.get('Retry-After'), 10) || 5, 60);
+            await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+            continue;
+        }
+        const data = await response.json();
+        if (data.error) {
+            return data;
+        }
+        updateProgress(data);
+        if (TERMINAL_STATUSES.includes(data.task_status)) {
+            return data;
+        }
+        await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+}